@@ -146,12 +146,13 @@ class SheetDataCacheAdmin(admin.ModelAdmin):
         'columns_info_display',
         'data_preview',
         'rows_count',
-        'cached_at'
+        'cached_at',
+        'rollups_updated_at'
     ]
     
     fieldsets = (
         ('📑 Informations de la feuille', {
-            'fields': ('file_cache', 'sheet_name', 'rows_count', 'cached_at')
+            'fields': ('file_cache', 'sheet_name', 'rows_count', 'cached_at', 'rollups_updated_at')
         }),
         ('📋 Colonnes', {
             'fields': ('headers_display', 'columns_info_display')
@@ -198,9 +199,12 @@ class SheetDataCacheAdmin(admin.ModelAdmin):
     columns_info_display.short_description = "Informations des colonnes"
     
     def data_preview(self, obj):
-        if obj.data:
-            # Afficher les 10 premières lignes
-            preview_data = obj.data[:10]
+        # Afficher les 10 premières lignes
+        preview_data = [
+            {"_row_id": row.row_id, **row.values}
+            for row in obj.rows.order_by('position')[:10]
+        ]
+        if preview_data:
             headers = obj.headers or []
             
             html = f"<p><strong>Total: {obj.rows_count} lignes</strong> (affichage des 10 premières)</p>"
@@ -0,0 +1,243 @@
+"""
+Détection du type réel des colonnes d'une feuille (data_type de columns_info)
+
+Les statistiques d'une colonne s'accumulent valeur par valeur (ColumnStats) pendant
+la lecture du classeur : il n'est pas nécessaire de garder toutes les valeurs en mémoire.
+Module sans accès à la base de données (utilisable dans un processus de lecture séparé).
+"""
+import re
+from datetime import datetime, time, timedelta
+
+# Formats de date reconnus dans les cellules texte
+DATE_PATTERNS = [
+    re.compile(r'^\d{2}/\d{2}/\d{4}$'),  # DD/MM/YYYY
+    re.compile(r'^\d{4}-\d{2}-\d{2}'),   # YYYY-MM-DD
+    re.compile(r'^\d{2}-\d{2}-\d{4}$'),  # DD-MM-YYYY
+    re.compile(r'^\d{2}\.\d{2}\.\d{4}$') # DD.MM.YYYY
+]
+
+# Nombre avec virgule ou point comme séparateur décimal
+NUMBER_PATTERN = re.compile(r'^-?\d+([.,]\d+)?$')
+
+# Part minimale des valeurs pour retenir un type dominant
+TYPE_THRESHOLD = 0.6
+
+# Nombre de premières valeurs gardées pour les exemples (sample_values)
+SAMPLE_SIZE = 5
+
+
+class ColumnStats:
+    """Compteurs par type des valeurs d'une colonne, alimentés au fil de la lecture"""
+
+    def __init__(self):
+        self.date_count = 0
+        self.number_count = 0
+        self.text_count = 0
+        self.long_text_count = 0
+        self.oui_non_count = 0
+        self.total = 0
+        self.values_count = 0
+        self.first_values = []
+
+    def add(self, value):
+        """Prendre en compte une valeur de la colonne (None compris)"""
+        self.values_count += 1
+        if len(self.first_values) < SAMPLE_SIZE:
+            self.first_values.append(value)
+
+        if value is None or str(value).strip() == '':
+            return
+        self.total += 1
+
+        # Vérifier si c'est une date/datetime
+        if isinstance(value, (datetime, time)):
+            self.date_count += 1
+            return
+        if isinstance(value, timedelta):
+            self.number_count += 1  # Les durées sont considérées comme des nombres
+            return
+
+        # Vérifier si c'est un nombre
+        if isinstance(value, (int, float)):
+            self.number_count += 1
+            return
+
+        # Convertir en string pour analyse
+        str_value = str(value).strip()
+
+        # Vérifier Oui/Non
+        if str_value.lower() in ['oui', 'non', 'yes', 'no', 'o', 'n']:
+            self.oui_non_count += 1
+            return
+
+        # Vérifier si c'est une date en format string
+        if any(pattern.match(str_value) for pattern in DATE_PATTERNS):
+            self.date_count += 1
+            return
+
+        # Vérifier si c'est un nombre en format string
+        if NUMBER_PATTERN.match(str_value.replace(' ', '')):
+            self.number_count += 1
+            return
+
+        # C'est du texte
+        if len(str_value) > 100:
+            self.long_text_count += 1
+        else:
+            self.text_count += 1
+
+    def sample_values(self):
+        """Exemples de valeurs non vides parmi les premières de la colonne"""
+        return [str(v)[:50] for v in self.first_values if v is not None and str(v).strip() != ''][:3]
+
+    def column_type(self, column_name=""):
+        """(field_type, data_type) de la colonne d'après les valeurs vues"""
+        if not self.values_count or not self.total:
+            # Pas de données (ou uniquement des cellules vides), utiliser le nom de la colonne
+            return guess_field_type(column_name)
+
+        total = self.total
+        if self.date_count / total >= TYPE_THRESHOLD:
+            return 'datetime-local', 'date'
+
+        if self.number_count / total >= TYPE_THRESHOLD:
+            return 'number', 'number'
+
+        if self.oui_non_count / total >= TYPE_THRESHOLD:
+            return 'select-yesno', 'boolean'
+
+        if self.long_text_count / total >= 0.4:
+            return 'textarea', 'text'
+
+        # Si les données sont du texte, vérifier si c'est du "text_only"
+        # (noms de navires, clients, etc. qui ne doivent pas être des nombres)
+        name_lower = column_name.lower()
+        text_only_keywords = [
+            'navire', 'navires', 'ship', 'vessel',
+            'client', 'customer', 
+            'fournisseur', 'supplier', 'vendeur',
+            'origine', 'origin', 'provenance',
+            'destination', 'dest',
+            'region', 'région',
+            'port', 'quai', 'terminal',
+            'agent', 'agents', 'transitaire', 'armateur',
+            'surveillant', 'surveill',
+            'qualité', 'qualite', 'quality',
+            'type', 'catégorie', 'categorie',
+            'incoterm', 'incoterme',
+            'facturation',
+            'famille'
+        ]
+        if any(word in name_lower for word in text_only_keywords):
+            return 'text', 'text_only'
+
+        # Par défaut c'est du texte libre
+        return 'text', 'any'
+
+
+def analyze_column_data_type(column_values, column_name=""):
+    """
+    Analyser les valeurs d'une colonne pour déterminer son type réel.
+    Retourne: (field_type, data_type)
+    - field_type: 'number', 'datetime-local', 'text', 'textarea', 'select-yesno'
+    - data_type: 'number', 'date', 'text', 'text_only', 'boolean', 'any'
+    """
+    stats = ColumnStats()
+    for value in column_values:
+        stats.add(value)
+    return stats.column_type(column_name)
+
+
+def guess_field_type(column_name):
+    """Deviner le type de champ en fonction du nom de la colonne (fallback quand pas de données)"""
+    name_lower = column_name.lower().strip()
+    
+    # Numéro de ligne (N°, N, #)
+    if name_lower in ['n°', 'n', '#', 'no', 'num', 'numero', 'numéro']:
+        return 'number', 'number'
+    
+    # Dates - patterns étendus
+    date_keywords = [
+        'date', 'arrivée', 'arrivee', 'arriv', 
+        'debut', 'début', 'fin', 
+        'accostage', 'appareillage', 
+        'nor', 'quai libre', 
+        'pose passerelle', 'ordre',
+        'connection', 'déconnection', 'deconnection',
+        'draft', 'notice'
+    ]
+    if any(word in name_lower for word in date_keywords):
+        return 'datetime-local', 'date'
+    
+    # Nombres - patterns étendus
+    number_keywords = [
+        'tonnage', 'tonne', 'poids', 'masse',
+        'nombre', 'nbr', 'nb',
+        '%', 'h2o', 'h2so4', 'p2o5', 'k2o',
+        'fob', 'fret', 'cfr', 'pu', 'p.u',
+        'cours', 'valeur', 'montant', 'prix', 'tarif', 'total',
+        'loa', 'jour', 'jr',
+        'cadence', 'performance', 'taux',
+        'attente', 'séjour', 'sejour', 'durée', 'duree',
+        'surestaries', 'surrestaries', 
+        'temps', 'humidité', 'humidite', 'humidit',
+        'quantité', 'quantite', 'qte',
+        'volume', 'surface',
+        'acconnage', 'assurance',
+        'fwd', 'aft', 'trim',
+        'fresh water', 'fw',
+        'mouvements', 'mvt',
+        'concentration', 'concent'
+    ]
+    if any(word in name_lower for word in number_keywords):
+        return 'number', 'number'
+    
+    # Texte long - patterns étendus
+    long_text_keywords = [
+        'remarques', 'remarque',
+        'commentaire', 'commentaires', 'comment',
+        'description', 'desc',
+        'evenements', 'événements', 'evenement',
+        'observation', 'observations', 'observ',
+        'cause', 'conflit',
+        'etat', 'état'
+    ]
+    if any(word in name_lower for word in long_text_keywords):
+        return 'textarea', 'text'
+    
+    # Sélection Oui/Non
+    if 'oui/non' in name_lower or 'oui non' in name_lower:
+        return 'select-yesno', 'boolean'
+    
+    # Texte obligatoire (noms propres qui ne doivent pas être des nombres)
+    text_only_keywords = [
+        'navire', 'navires', 'ship', 'vessel',
+        'client', 'customer', 
+        'fournisseur', 'supplier', 'vendeur',
+        'origine', 'origin', 'provenance',
+        'destination', 'dest',
+        'region', 'région',
+        'port de chargement',
+        'agent', 'agents', 'transitaire', 'armateur',
+        'surveillant', 'surveill',
+        'qualité', 'qualite', 'quality',
+        'type', 'catégorie', 'categorie', 'cat',
+        'incoterm', 'incoterme',
+        'facturation',
+        'famille',
+        'dum', 'ei', 'cde', 'n° ei', 'n° cde'
+    ]
+    if any(word in name_lower for word in text_only_keywords):
+        return 'text', 'text_only'
+    
+    # Par défaut: texte libre (accepte tout)
+    return 'text', 'any'
+
+
+def is_required_field(column_name):
+    """Déterminer si un champ est obligatoire"""
+    name_lower = column_name.lower()
+    required_fields = ['n°', 'n', 'navires', 'date b/l', 'date bl', 'tonnage']
+    return any(field in name_lower for field in required_fields)
+
+
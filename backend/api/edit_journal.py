@@ -0,0 +1,277 @@
+"""
+Journal d'écriture différée des modifications d'entrées (modèle PendingEdit)
+
+En mode fichier, un ajout / une modification / une suppression met à jour la base
+(SheetRow), enregistre la modification dans le journal et répond tout de suite.
+Le compacteur regroupe ensuite les modifications en attente de chaque classeur et les
+écrit directement dans le XML des feuilles, en une seule réécriture du fichier
+(xlsx_patch, ajouts par xlsx_append). Si la structure du fichier n'est pas gérée, il
+revient à un seul cycle load_workbook / save d'openpyxl pour toutes les modifications.
+
+Il passe toutes les EDIT_JOURNAL_FLUSH_INTERVAL secondes (thread en arrière-plan,
+0 pour le désactiver), avant chaque téléchargement (download_excel), avant la
+resynchronisation d'un fichier modifié sur le disque et via `manage.py flush_edit_journal`.
+
+Si le fichier correspondait au cache avant l'écriture, ses nouvelles empreintes sont
+enregistrées : la synchronisation suivante ne relit pas ce que le cache contient déjà.
+
+Après des suppressions (ou des ajouts placés ailleurs qu'à leur _row_id), les feuilles
+concernées sont relues et leurs _row_id renumérotés comme les lignes du fichier : une
+écriture fondée sur une copie antérieure (?base_version=) est refusée par un 409
+(etags.row_ids_conflict) et le client recharge la feuille.
+
+Le verrou par classeur est propre au processus : le mode fichier suppose un seul
+processus (serveur de développement). Les modifications restent dans le journal
+tant que l'écriture du fichier n'a pas réussi ; un échec n'empêche ni le téléchargement
+(fichier envoyé tel quel, en-tête X-Pending-Edits) ni la relecture du fichier modifié.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from openpyxl import load_workbook
+
+from .ingestion import cached_sheets_details, ingest_sheets, record_content_hashes
+from .models import FileCache, PendingEdit
+from .sheet_parser import file_hash
+from .xlsx_append import XlsxPatchError, check_cell_value, save_workbook, sheet_headers
+from .xlsx_patch import apply_edits_xml
+
+# Intervalle par défaut (secondes) entre deux passages du compacteur
+DEFAULT_FLUSH_INTERVAL = 30
+
+# Taille des lots pour les insertions en masse
+BULK_BATCH_SIZE = 500
+
+_locks = {}
+_locks_guard = threading.Lock()
+_compactor = None
+
+
+def flush_interval():
+    return getattr(settings, 'EDIT_JOURNAL_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+
+def edit_lock(file_cache):
+    """Verrou d'un classeur : une modification n'est pas journalisée pendant sa compaction"""
+    with _locks_guard:
+        return _locks.setdefault(file_cache.pk, threading.RLock())
+
+
+def check_values(values):
+    """Lève ValueError si une valeur ne pourra pas être écrite dans le fichier"""
+    for value in values.values():
+        check_cell_value(value)
+
+
+def journal_edit(file_cache, sheet_name, operation, row_id, values=None, user=None):
+    """Enregistrer une modification à écrire dans le fichier (dans la transaction de l'appelant)"""
+    journal_edits(file_cache, sheet_name, operation, [(row_id, values)], user)
+
+
+def journal_edits(file_cache, sheet_name, operation, edits, user=None):
+    """Enregistrer la même opération pour plusieurs lignes : edits = [(row_id, valeurs)]"""
+    created_by = user if user is not None and user.is_authenticated else None
+    PendingEdit.objects.bulk_create([
+        PendingEdit(
+            file_cache=file_cache,
+            sheet_name=sheet_name,
+            operation=operation,
+            row_id=row_id,
+            values={key: value for key, value in (values or {}).items() if key != '_row_id'},
+            created_by=created_by
+        )
+        for row_id, values in edits
+    ], batch_size=BULK_BATCH_SIZE)
+    ensure_compactor()
+
+
+def coalesce_edits(edits):
+    """
+    Regrouper les modifications par feuille, dans l'ordre :
+    {feuille: {'updates': {row_id: valeurs}, 'deletes': {row_id}, 'inserts': {row_id: valeurs}}}
+    Une ligne ajoutée puis modifiée reste un ajout ; ajoutée puis supprimée, elle disparaît.
+    """
+    sheets = {}
+    for edit in edits:
+        pending = sheets.setdefault(edit.sheet_name, {'updates': {}, 'deletes': set(), 'inserts': {}})
+        row_id = edit.row_id
+        if edit.operation == 'insert':
+            pending['inserts'][row_id] = dict(edit.values)
+        elif edit.operation == 'update':
+            if row_id in pending['inserts']:
+                pending['inserts'][row_id].update(edit.values)
+            else:
+                pending['updates'].setdefault(row_id, {}).update(edit.values)
+        elif row_id in pending['inserts']:
+            del pending['inserts'][row_id]
+        else:
+            pending['updates'].pop(row_id, None)
+            pending['deletes'].add(row_id)
+    return sheets
+
+
+def cell_value(value):
+    return None if value == "" else value
+
+
+def apply_with_openpyxl(filepath, sheets):
+    """Appliquer toutes les modifications en un cycle load_workbook / save"""
+    wb = load_workbook(filepath)
+    inserted = {}
+    try:
+        for sheet_name, pending in sheets.items():
+            if sheet_name not in wb.sheetnames:
+                print(f"Journal: feuille '{sheet_name}' absente de {os.path.basename(filepath)}, modifications ignorées")
+                continue
+            ws = wb[sheet_name]
+            headers = sheet_headers(ws)
+
+            # Modifications avant suppressions : les numéros de ligne sont encore ceux du fichier
+            for row_id, values in pending['updates'].items():
+                for col_idx, header in headers:
+                    if header in values:
+                        ws.cell(row=row_id, column=col_idx, value=cell_value(values[header]))
+
+            for row_id in sorted(pending['deletes'], reverse=True):
+                ws.delete_rows(row_id)
+
+            row_numbers = []
+            for row_number, values in enumerate(pending['inserts'].values(), start=ws.max_row + 1):
+                for col_idx, header in headers:
+                    ws.cell(row=row_number, column=col_idx, value=cell_value(values.get(header)))
+                row_numbers.append(row_number)
+            inserted[sheet_name] = row_numbers
+
+        # Toutes les modifications du lot ou aucune : le fichier est remplacé d'un coup
+        save_workbook(wb, filepath)
+    finally:
+        wb.close()
+    return inserted
+
+
+def apply_edits(filepath, sheets):
+    """Écriture directe dans le XML des feuilles, openpyxl si la structure du fichier n'est pas gérée"""
+    try:
+        inserted = apply_edits_xml(filepath, sheets)
+    except XlsxPatchError as e:
+        print(f"Journal: écriture directe impossible dans {os.path.basename(filepath)} ({e}), passage par openpyxl")
+        return apply_with_openpyxl(filepath, sheets)
+    for sheet_name in sheets.keys() - inserted.keys():
+        print(f"Journal: feuille '{sheet_name}' absente de {os.path.basename(filepath)}, modifications ignorées")
+    return inserted
+
+
+def flush_pending_edits(file_cache):
+    """
+    Écrire dans le fichier les modifications en attente d'un classeur.
+    Retourne le nombre de modifications appliquées ; lève l'erreur si l'écriture échoue.
+    """
+    with edit_lock(file_cache):
+        edits = list(PendingEdit.objects.filter(file_cache=file_cache).order_by('id'))
+        if not edits:
+            return 0
+
+        filepath = file_cache.file_path
+        if not filepath or not os.path.exists(filepath):
+            print(f"Journal: fichier introuvable pour {file_cache.filename}, {len(edits)} modification(s) conservée(s)")
+            return 0
+
+        started = time.perf_counter()
+        # Fichier identique à celui mis en cache : après l'écriture, base et fichier concordent
+        stored_hash = FileCache.objects.filter(pk=file_cache.pk).values_list('content_hash', flat=True).first()
+        in_sync = bool(stored_hash) and file_hash(filepath) == stored_hash
+
+        sheets = coalesce_edits(edits)
+        inserted = apply_edits(filepath, sheets)
+
+        PendingEdit.objects.filter(pk__in=[edit.pk for edit in edits]).delete()
+
+        # Lignes décalées (suppressions) ou ajoutées ailleurs qu'à leur _row_id : relire ces feuilles
+        reread = []
+        for sheet_name, pending in sheets.items():
+            row_numbers = inserted.get(sheet_name, [])
+            shifted = any(row_id != row_number for row_id, row_number in zip(pending['inserts'], row_numbers))
+            if pending['deletes'] or shifted:
+                reread.append(sheet_name)
+        counts = {}
+        if reread:
+            ingest_sheets(file_cache, filepath, reread)
+            # Nombres d'entrées recomptés sur les lignes relues
+            sheets_details = cached_sheets_details(file_cache)
+            counts = {
+                'sheets_details': sheets_details,
+                'total_entries': sum(details['entries'] for details in sheets_details.values())
+            }
+
+        # Fichier à jour : pas de ré-ingestion par sync_all_files_cache
+        file_stat = os.stat(filepath)
+        FileCache.objects.filter(pk=file_cache.pk).update(
+            file_size=file_stat.st_size,
+            file_modified=datetime.fromtimestamp(file_stat.st_mtime),
+            version=F('version') + 1,
+            **counts
+        )
+        if in_sync:
+            record_content_hashes(file_cache, filepath)
+
+        print(f"Journal: {len(edits)} modification(s) écrite(s) dans {file_cache.filename} "
+              f"en {(time.perf_counter() - started) * 1000:.0f} ms")
+        return len(edits)
+
+
+def try_flush_pending_edits(file_cache):
+    """
+    flush_pending_edits sans lever l'erreur : un journal qui ne peut pas être écrit ne bloque
+    ni le téléchargement ni la synchronisation. Retourne le nombre de modifications non écrites.
+    """
+    try:
+        flush_pending_edits(file_cache)
+    except Exception as e:
+        remaining = PendingEdit.objects.filter(file_cache=file_cache).count()
+        print(f"Journal: échec de l'écriture de {file_cache.filename}: {e}, "
+              f"{remaining} modification(s) non écrite(s)")
+        return remaining
+    return 0
+
+
+def flush_all_pending_edits():
+    """Écrire les modifications en attente de tous les classeurs"""
+    file_ids = set(PendingEdit.objects.values_list('file_cache_id', flat=True))
+    total = 0
+    for file_cache in FileCache.objects.filter(pk__in=file_ids):
+        try:
+            total += flush_pending_edits(file_cache)
+        except Exception as e:
+            print(f"Journal: échec de l'écriture de {file_cache.filename}: {e}")
+    return total
+
+
+def run_compactor(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush_all_pending_edits()
+        except Exception as e:
+            print(f"Journal: erreur du compacteur: {e}")
+        finally:
+            # Pas de connexion gardée ouverte entre deux passages
+            connection.close()
+
+
+def ensure_compactor():
+    """Démarrer le compacteur en arrière-plan (une fois par processus)"""
+    global _compactor
+    interval = flush_interval()
+    if interval <= 0:
+        return
+    with _locks_guard:
+        if _compactor is None or not _compactor.is_alive():
+            _compactor = threading.Thread(
+                target=run_compactor, args=(interval,), name='edit-journal-compactor', daemon=True
+            )
+            _compactor.start()
@@ -0,0 +1,92 @@
+"""
+Versions des caches et requêtes conditionnelles (ETag / If-None-Match)
+
+Chaque écriture incrémente la version de la feuille (SheetDataCache) et de son
+fichier (FileCache). Les lectures renvoient cette version en ETag fort : si le
+client renvoie le même ETag, la réponse est un 304 sans relire les lignes.
+
+Une écriture par _row_id peut indiquer la version de la copie du client
+(?base_version=) : si les lignes ont été renumérotées depuis, elle est refusée (409).
+"""
+import hashlib
+
+from django.db.models import F
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from .models import FileCache, SheetDataCache
+
+
+def bump_sheet_version(sheet_cache):
+    """
+    Incrémenter la version d'une feuille et de son fichier (écriture par queryset.update()).
+    Retourne la nouvelle version de la feuille.
+    """
+    sheets = SheetDataCache.objects.filter(pk=sheet_cache.pk)
+    sheets.update(version=F('version') + 1)
+    FileCache.objects.filter(pk=sheet_cache.file_cache_id).update(version=F('version') + 1)
+    sheet_cache.version = sheets.values_list('version', flat=True).first()
+    return sheet_cache.version
+
+
+def sheet_etag(sheet_cache, resource='data'):
+    return f'"sheet-{sheet_cache.pk}-{resource}-v{sheet_cache.version}"'
+
+
+def file_etag(file_cache):
+    return f'"file-{file_cache.pk}-v{file_cache.version}"'
+
+
+def files_etag(files):
+    """ETag d'une liste de fichiers : empreinte des couples (id, version)"""
+    digest = hashlib.sha1()
+    for pk, version in files.order_by('pk').values_list('pk', 'version'):
+        digest.update(f'{pk}:{version};'.encode())
+    return f'"files-{digest.hexdigest()}"'
+
+
+def not_modified(request, etag):
+    """Réponse 304 si le client possède déjà cette version (If-None-Match), sinon None"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return None
+    # Comparaison faible (RFC 9110) : la réponse compressée porte l'ETag W/"..."
+    etags = [value.removeprefix('W/') for value in parse_etags(if_none_match)]
+    if '*' in etags or etag in etags:
+        return with_etag(Response(status=304), etag)
+    return None
+
+
+def row_ids_conflict(request, sheet_cache):
+    """
+    Réponse 409 si les _row_id de la feuille ont été renumérotés après la version
+    ?base_version= de la copie du client (il viserait une autre ligne), 400 si elle est
+    invalide, sinon None. Sans base_version, l'écriture est acceptée.
+    À appeler sous le verrou d'écriture : la version de renumérotation est relue en base.
+    """
+    base_version = request.query_params.get('base_version')
+    if base_version is None:
+        return None
+    try:
+        base_version = int(base_version)
+    except ValueError:
+        return Response({"error": "Paramètre 'base_version' invalide"}, status=400)
+
+    sheet = SheetDataCache.objects.filter(pk=sheet_cache.pk).values('version', 'rows_renumbered_version').first()
+    if sheet is not None and base_version < sheet['rows_renumbered_version']:
+        return Response({
+            "error": "Les lignes de la feuille ont été renumérotées depuis votre chargement : rechargez la feuille",
+            "full_reload": True,
+            "version": sheet['version']
+        }, status=409)
+    return None
+
+
+def with_etag(response, etag):
+    """Ajouter l'ETag à la réponse ; le navigateur revalide à chaque lecture (no-cache)"""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    # Le format (JSON, CSV, Arrow...) peut dépendre de l'en-tête Accept
+    patch_vary_headers(response, ['Accept', 'Authorization'])
+    return response
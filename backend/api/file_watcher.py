@@ -0,0 +1,235 @@
+"""
+Surveillance du dossier des fichiers Excel (thread en arrière-plan)
+
+La liste des fichiers (get_excel_files) ne fait que lire la base : c'est ce thread
+qui garde FileCache et SheetDataCache à jour quand un .xlsx du dossier apparaît,
+change ou disparaît. La première synchronisation est faite dans la requête qui
+démarre la surveillance (la première liste n'est donc ni vide ni périmée), les
+suivantes par le thread après chaque changement, une fois le dossier calme depuis
+SETTLE_DELAY secondes (fichier en cours de copie). La synchronisation (sync_all_files_cache) ne relit que les
+fichiers modifiés, et dans ces fichiers que les feuilles modifiées.
+
+Sous Linux, les changements sont signalés par inotify (appelé via ctypes, sans
+dépendance). Ailleurs, ou si inotify n'est pas disponible, la taille et la date de
+chaque .xlsx sont relues toutes les FILE_WATCHER_INTERVAL secondes.
+FILE_WATCHER : 'auto' (inotify si possible), 'poll' (relecture périodique, pour un
+dossier réseau dont inotify ne voit pas les modifications faites ailleurs) ou 'off'.
+
+Comme le compacteur du journal, le thread est propre au processus et démarre au
+premier appel de ensure_watcher.
+"""
+import os
+import select
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+try:
+    import ctypes
+    import ctypes.util
+
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    _inotify_init1 = _libc.inotify_init1
+    _inotify_add_watch = _libc.inotify_add_watch
+    _inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+    HAS_INOTIFY = True
+except (ImportError, OSError, AttributeError):
+    HAS_INOTIFY = False
+
+# Événements inotify (sys/inotify.h)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+
+# Fichier écrit, renommé, supprimé ou dont la date a changé (touch)
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+# Dossier surveillé supprimé ou déplacé : inotify ne suit plus rien
+LOST_MASK = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+EVENT_HEADER = struct.Struct('iIII')
+
+# Intervalle par défaut (secondes) entre deux relectures du dossier sans inotify
+DEFAULT_POLL_INTERVAL = 5
+
+# Délai (secondes) sans changement avant de synchroniser
+SETTLE_DELAY = 1.0
+
+_watcher = None
+_watcher_guard = threading.Lock()
+
+
+def watcher_mode():
+    return getattr(settings, 'FILE_WATCHER', 'auto')
+
+
+def poll_interval():
+    return getattr(settings, 'FILE_WATCHER_INTERVAL', DEFAULT_POLL_INTERVAL)
+
+
+def is_excel_name(name):
+    """Fichier Excel suivi par le cache (pas les fichiers de verrouillage ~$ d'Excel)"""
+    return name.endswith('.xlsx') and not name.startswith('~$')
+
+
+def folder_snapshot(folder):
+    """Taille et date de chaque .xlsx du dossier : {nom: (mtime_ns, taille)}"""
+    snapshot = {}
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if is_excel_name(entry.name):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        pass
+    return snapshot
+
+
+class InotifyWatch:
+    """Descripteur inotify sur un dossier. Lève OSError si la surveillance est impossible."""
+
+    def __init__(self, folder):
+        self.fd = _inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if _inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"{os.strerror(errno)}: {folder}")
+
+    def read_events(self, timeout=None):
+        """
+        Événements reçus dans le délai : (un .xlsx a changé, dossier toujours suivi).
+        (False, True) si rien n'est arrivé.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False, True
+
+        data = os.read(self.fd, 64 * 1024)
+        changed = False
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+            if mask & LOST_MASK:
+                return True, False
+            # File d'événements pleine : des changements ont pu être perdus
+            if mask & IN_Q_OVERFLOW or is_excel_name(name):
+                changed = True
+        return changed, True
+
+    def wait_for_change(self):
+        """
+        Attendre qu'un .xlsx change, puis que le dossier soit calme depuis SETTLE_DELAY.
+        Retourne False si le dossier n'est plus suivi.
+        """
+        changed = False
+        while not changed:
+            changed, watching = self.read_events()
+            if not watching:
+                return False
+        while changed:
+            changed, watching = self.read_events(SETTLE_DELAY)
+            if not watching:
+                return False
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def wait_for_snapshot_change(folder, snapshot, interval):
+    """Relire le dossier toutes les `interval` secondes jusqu'à un changement, puis jusqu'au calme"""
+    while True:
+        time.sleep(interval)
+        current = folder_snapshot(folder)
+        if current != snapshot:
+            break
+    while True:
+        time.sleep(SETTLE_DELAY)
+        settled = folder_snapshot(folder)
+        if settled == current:
+            return current
+        current = settled
+
+
+def sync_once(sync):
+    try:
+        sync()
+    except Exception as e:
+        print(f"Surveillance: erreur de synchronisation: {e}")
+
+
+def run_sync(sync):
+    try:
+        sync_once(sync)
+    finally:
+        # Pas de connexion gardée ouverte entre deux synchronisations
+        connection.close()
+
+
+def open_inotify(folder, interval):
+    if not HAS_INOTIFY:
+        print(f"Surveillance: inotify non disponible, relecture de {folder} toutes les {interval} s")
+        return None
+    try:
+        return InotifyWatch(folder)
+    except OSError as e:
+        print(f"Surveillance: inotify impossible ({e}), relecture de {folder} toutes les {interval} s")
+        return None
+
+
+def run_watcher(folder, sync, watch, snapshot, interval):
+    """Boucle du thread : la synchronisation initiale a déjà été faite par ensure_watcher"""
+    while True:
+        if watch is not None:
+            if not watch.wait_for_change():
+                print(f"Surveillance: {folder} n'est plus suivi par inotify, relecture toutes les {interval} s")
+                watch.close()
+                watch = None
+                # Référence pour la relecture : état du dossier au moment où inotify est perdu
+                snapshot = folder_snapshot(folder)
+        else:
+            snapshot = wait_for_snapshot_change(folder, snapshot, interval)
+        run_sync(sync)
+
+
+def ensure_watcher(folder, sync):
+    """
+    Démarrer la surveillance de `folder` en arrière-plan (une fois par processus) :
+    sync() est appelée tout de suite, dans la requête, puis par le thread après chaque
+    changement d'un .xlsx du dossier. Les requêtes arrivées pendant la synchronisation
+    initiale attendent qu'elle soit terminée.
+    """
+    global _watcher
+    mode = watcher_mode()
+    if mode == 'off':
+        return
+    with _watcher_guard:
+        if _watcher is None or not _watcher.is_alive():
+            interval = poll_interval()
+            # Surveillance ouverte avant la synchronisation : un changement pendant
+            # celle-ci déclenche une nouvelle synchronisation
+            watch = open_inotify(folder, interval) if mode == 'auto' else None
+            snapshot = folder_snapshot(folder)
+            sync_once(sync)
+            _watcher = threading.Thread(
+                target=run_watcher, args=(folder, sync, watch, snapshot, interval), name='file-watcher', daemon=True
+            )
+            _watcher.start()
@@ -0,0 +1,311 @@
+"""
+Ingestion des classeurs Excel dans le cache (FileCache, SheetDataCache, SheetRow)
+
+Un classeur est lu une seule fois (sheet_parser.read_workbook) : les métadonnées du
+fichier et les données de toutes ses feuilles viennent de la même passe, au lieu
+d'une ouverture pour compter les lignes puis d'une ouverture par feuille.
+Chaque ingestion affiche le temps de lecture et le temps d'écriture en base.
+
+Les lignes lues passent par les fichiers temporaires de read_workbook et sont écrites
+en base par lots : feuilles de toute taille, nombre d'entrées exact, mémoire bornée.
+
+Chaque fichier et chaque feuille en cache garde son empreinte (content_hash). À la
+synchronisation (ingest_workbooks(..., incremental=True)), un fichier touché mais
+identique n'est pas relu, et seules les feuilles dont l'empreinte a changé le sont ;
+les autres gardent leurs lignes, index et agrégats.
+
+Plusieurs classeurs (ingest_workbooks) peuvent être lus en parallèle dans un pool de
+processus (INGESTION_WORKERS, 0 = un par cœur) : la lecture du XML occupe le processeur.
+Chaque processus recharge Django et openpyxl : le parallélisme est donc à activer
+explicitement, la valeur par défaut (1) lit en série pour tenir dans une petite instance.
+Les résultats sont écrits en base par le processus principal, dans l'ordre des fichiers.
+Avec un seul processus, un seul classeur, ou si le pool ne peut pas démarrer, la
+lecture se fait en série, dans le même ordre.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import FileCache, SheetDataCache
+from .sheet_parser import content_hashes, discard_workbook, file_hash, iter_spool, read_workbook
+from .sheet_rows import replace_sheet_rows
+
+
+def iter_sheet_entries(sheet):
+    """Entrées d'une feuille lue, relues lot par lot depuis son fichier temporaire"""
+    for chunk in iter_spool(sheet["spool"]):
+        yield from chunk
+
+
+def save_sheet(file_cache, sheet):
+    """Enregistrer une feuille lue (métadonnées + une ligne SQL par entrée, insérées par lots)"""
+    with transaction.atomic():
+        sheet_cache, created = SheetDataCache.objects.update_or_create(
+            file_cache=file_cache,
+            sheet_name=sheet["name"],
+            defaults={
+                'headers': sheet["headers"],
+                'columns_info': sheet["columns_info"],
+                'data': [],
+                'rows_count': sheet["entries"],
+                'content_hash': sheet.get("hash", '')
+            }
+        )
+        replace_sheet_rows(sheet_cache, iter_sheet_entries(sheet))
+    return sheet_cache
+
+
+def available_cpus():
+    """Nombre de cœurs utilisables par le processus"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def ingestion_workers(workers=None):
+    """Nombre de processus de lecture : `workers`, sinon INGESTION_WORKERS (1 = en série, 0 = un par cœur)"""
+    if workers is None:
+        workers = getattr(settings, 'INGESTION_WORKERS', 1)
+    if workers <= 0:
+        workers = available_cpus()
+    return workers
+
+
+# Écart (secondes) entre la date du fichier et celle du cache en deçà duquel rien n'a changé
+MODIFIED_TOLERANCE = 0.001
+
+
+def unchanged_sheets_details(filename, sheet_names):
+    """Détails des feuilles non relues (empreinte inchangée), repris de leur cache"""
+    if not sheet_names:
+        return {}
+    sheet_caches = SheetDataCache.objects.filter(
+        file_cache__filename=filename, sheet_name__in=sheet_names
+    ).annotate(entries=Count('rows'))
+    return {
+        sheet_cache.sheet_name: {'columns': len(sheet_cache.headers or []), 'entries': sheet_cache.entries}
+        for sheet_cache in sheet_caches
+    }
+
+
+def cached_sheets_details(file_cache):
+    """Détails de toutes les feuilles d'un fichier d'après leur cache (lignes comptées en base)"""
+    sheet_names = FileCache.objects.filter(pk=file_cache.pk).values_list('sheets_json', flat=True).first() or []
+    details = unchanged_sheets_details(file_cache.filename, sheet_names)
+    return {sheet_name: details[sheet_name] for sheet_name in sheet_names if sheet_name in details}
+
+
+def save_workbook(filepath, filename, workbook, last_modified_by=None):
+    """
+    Écrire en base un classeur lu par read_workbook (fichier puis chacune des feuilles lues),
+    puis supprimer ses fichiers temporaires. Les feuilles non relues gardent leur cache.
+    """
+    sheets = workbook["sheets"]
+    read_details = {
+        sheet["name"]: {'columns': len(sheet["headers"]), 'entries': sheet["entries"]}
+        for sheet in sheets
+    }
+    unchanged = unchanged_sheets_details(filename, [name for name in workbook["sheetnames"] if name not in read_details])
+    sheets_details = {}
+    for sheet_name in workbook["sheetnames"]:
+        details = read_details.get(sheet_name) or unchanged.get(sheet_name)
+        if details:
+            sheets_details[sheet_name] = details
+
+    file_stat = os.stat(filepath)
+    defaults = {
+        'name': filename.replace('.xlsx', ''),
+        'file_path': filepath,
+        'sheets_count': len(workbook["sheetnames"]),
+        'sheets_json': workbook["sheetnames"],
+        'sheets_details': sheets_details,
+        'total_entries': sum(details['entries'] for details in sheets_details.values()),
+        'file_size': file_stat.st_size,
+        'file_modified': datetime.fromtimestamp(file_stat.st_mtime),
+        'content_hash': workbook["file_hash"]
+    }
+    # Ajouter le dernier utilisateur qui a modifié si fourni
+    if last_modified_by:
+        defaults['last_modified_by'] = last_modified_by
+
+    started = time.perf_counter()
+    try:
+        # Fichier et feuilles mis à jour ensemble : pas de cache à moitié relu en cas d'erreur
+        with transaction.atomic():
+            file_cache, created = FileCache.objects.update_or_create(filename=filename, defaults=defaults)
+            for sheet in sheets:
+                save_sheet(file_cache, sheet)
+    finally:
+        discard_workbook(workbook)
+
+    kept = f", {len(unchanged)} inchangée(s)" if unchanged else ""
+    print(f"Ingestion: {filename}: {len(sheets)} feuille(s) lue(s){kept}, {defaults['total_entries']} entrée(s) "
+          f"- lecture {workbook['read_ms']:.0f} ms ({workbook['reader']}), écriture {(time.perf_counter() - started) * 1000:.0f} ms")
+    return file_cache
+
+
+def known_sheet_hashes(file_cache):
+    """Empreintes des feuilles en cache d'un fichier : {feuille: empreinte}"""
+    return dict(
+        SheetDataCache.objects.filter(file_cache=file_cache).exclude(content_hash='')
+        .values_list('sheet_name', 'content_hash')
+    )
+
+
+def record_content_hashes(file_cache, filepath):
+    """
+    Enregistrer les empreintes actuelles d'un fichier dont le cache est à jour
+    (après l'écriture des modifications en attente, par exemple).
+    """
+    digest, sheet_hashes = content_hashes(filepath)
+    with transaction.atomic():
+        # Sans empreintes de feuilles, l'empreinte du fichier ne permet pas d'éviter une relecture
+        FileCache.objects.filter(pk=file_cache.pk).update(content_hash=digest if sheet_hashes else '')
+        for sheet_name, sheet_hash in sheet_hashes.items():
+            SheetDataCache.objects.filter(file_cache=file_cache, sheet_name=sheet_name).update(content_hash=sheet_hash)
+
+
+def modified_since_cache(file_cache, file_stat):
+    """
+    Fichier modifié depuis sa mise en cache : taille différente ou date plus récente.
+    La date enregistrée est arrondie à la microseconde : comparaison à la milliseconde près.
+    """
+    if file_cache.file_modified is None or file_stat.st_size != file_cache.file_size:
+        return True
+    return file_stat.st_mtime - file_cache.file_modified.timestamp() > MODIFIED_TOLERANCE
+
+
+def touch_if_unchanged(filepath, file_cache):
+    """
+    Fichier identique à celui mis en cache (même empreinte, toutes ses feuilles en cache) :
+    mettre à jour sa date et sa taille sans le relire. Retourne True dans ce cas.
+    """
+    if not file_cache.content_hash:
+        return False
+    known = known_sheet_hashes(file_cache)
+    if any(sheet_name not in known for sheet_name in file_cache.sheets_json or []):
+        return False
+    if file_hash(filepath) != file_cache.content_hash:
+        return False
+
+    file_stat = os.stat(filepath)
+    FileCache.objects.filter(pk=file_cache.pk).update(
+        file_size=file_stat.st_size,
+        file_modified=datetime.fromtimestamp(file_stat.st_mtime)
+    )
+    print(f"Ingestion: {file_cache.filename}: contenu inchangé, fichier non relu")
+    return True
+
+
+def ingest_workbook(filepath, filename=None, last_modified_by=None):
+    """
+    Mettre en cache un fichier et toutes ses feuilles à partir d'une seule lecture du classeur.
+    Retourne le FileCache ; lève l'erreur de lecture si le classeur est illisible.
+    """
+    if filename is None:
+        filename = os.path.basename(filepath)
+    return save_workbook(filepath, filename, read_workbook(filepath), last_modified_by)
+
+
+def read_workbooks_parallel(filepaths, workers, known_hashes=None):
+    """
+    Lire les classeurs dans un pool de processus.
+    Retourne {chemin: classeur lu ou exception}, None si le pool n'a pas pu servir.
+    """
+    known_hashes = known_hashes or {}
+    results = {}
+    try:
+        # 'spawn' : processus neufs, sans les connexions ni les threads du serveur
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {
+                filepath: executor.submit(read_workbook, filepath, None, known_hashes.get(filepath))
+                for filepath in filepaths
+            }
+            for filepath, future in futures.items():
+                try:
+                    results[filepath] = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    results[filepath] = e
+            return results
+    except (BrokenProcessPool, OSError, NotImplementedError, ImportError) as e:
+        print(f"Ingestion: lecture en parallèle impossible ({e}), lecture en série")
+        for workbook in results.values():
+            if not isinstance(workbook, Exception):
+                discard_workbook(workbook)
+        return None
+
+
+def ingest_workbooks(filepaths, workers=None, incremental=False):
+    """
+    Mettre en cache plusieurs fichiers : lecture en parallèle, écriture en base ici, dans l'ordre.
+    incremental : pour les fichiers déjà en cache, ne relire que ce dont l'empreinte a changé
+    (rien si le fichier est identique, sinon les feuilles modifiées).
+    Retourne {chemin: FileCache ou None si le fichier est illisible}.
+    """
+    filepaths = list(filepaths)
+    started = time.perf_counter()
+
+    file_caches = {}
+    known_hashes = {}
+    if incremental:
+        for filepath in filepaths:
+            file_cache = FileCache.objects.filter(filename=os.path.basename(filepath)).first()
+            if file_cache is None:
+                continue
+            try:
+                if touch_if_unchanged(filepath, file_cache):
+                    file_caches[filepath] = file_cache
+                    continue
+            except OSError as e:
+                print(f"Erreur empreinte pour {file_cache.filename}: {e}")
+            known_hashes[filepath] = known_sheet_hashes(file_cache)
+    to_read = [filepath for filepath in filepaths if filepath not in file_caches]
+
+    workers = min(ingestion_workers(workers), len(to_read))
+    workbooks = read_workbooks_parallel(to_read, workers, known_hashes) if workers > 1 else None
+    mode = f"{workers} processus" if workbooks is not None else "en série"
+
+    for filepath in to_read:
+        filename = os.path.basename(filepath)
+        try:
+            if workbooks is None:
+                workbook = read_workbook(filepath, known_hashes=known_hashes.get(filepath))
+            else:
+                workbook = workbooks[filepath]
+                if isinstance(workbook, Exception):
+                    raise workbook
+            file_caches[filepath] = save_workbook(filepath, filename, workbook)
+        except Exception as e:
+            print(f"Erreur cache pour {filename}: {e}")
+            file_caches[filepath] = None
+
+    if filepaths:
+        print(f"Ingestion: {len(filepaths)} fichier(s), {len(to_read)} lu(s) ({mode}) "
+              f"en {(time.perf_counter() - started) * 1000:.0f} ms")
+    return {filepath: file_caches[filepath] for filepath in filepaths}
+
+
+def ingest_sheets(file_cache, filepath, sheet_names):
+    """
+    Remettre en cache quelques feuilles d'un fichier (une seule lecture du classeur).
+    Retourne {nom de feuille: SheetDataCache} pour les feuilles présentes dans le classeur.
+    """
+    started = time.perf_counter()
+    workbook = read_workbook(filepath, sheet_names=set(sheet_names))
+    try:
+        sheet_caches = {sheet["name"]: save_sheet(file_cache, sheet) for sheet in workbook["sheets"]}
+    finally:
+        discard_workbook(workbook)
+
+    print(f"Ingestion: {file_cache.filename}: {', '.join(sheet_caches) or 'aucune feuille'} "
+          f"- lecture {workbook['read_ms']:.0f} ms ({workbook['reader']}), total {(time.perf_counter() - started) * 1000:.0f} ms")
+    return sheet_caches
@@ -0,0 +1,90 @@
+"""
+Renderer et parser JSON rapides (orjson) pour l'API
+
+orjson encode et décode plusieurs fois plus vite que le module json standard,
+ce qui compte pour get_sheet_data sur des feuilles de milliers de lignes.
+Sans orjson (paquet optionnel), ou pour une valeur qu'il ne sait pas encoder,
+on revient au JSONRenderer / JSONParser de DRF.
+
+Les dates, heures et durées passent par l'encodeur de DRF : la sortie est
+identique à celle du JSONRenderer standard. Seule différence : NaN / Infinity
+deviennent null au lieu de provoquer une erreur.
+"""
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Import conditionnel d'orjson
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Encodeur de DRF pour les types non natifs (datetime, time, timedelta, Decimal, UUID...)
+_encoder = JSONEncoder()
+
+if HAS_ORJSON:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def dumps_bytes(value):
+    """Encoder une valeur en JSON compact (UTF-8), comme le JSONRenderer de DRF"""
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(value, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Entier hors 64 bits, type inconnu... : encodeur standard
+            pass
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(value):
+    """Comme dumps_bytes, en chaîne"""
+    return dumps_bytes(value).decode('utf-8')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer de DRF encodé par orjson (sortie compacte)"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not HAS_ORJSON or self.ensure_ascii or not self.compact:
+            # Sortie ASCII ou espacée demandée dans les réglages : encodeur standard
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Indentation demandée (API navigable, ?indent=) : non gérée par orjson
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Comme DRF : \u2028 et \u2029 échappés (sous-ensemble strict de JavaScript)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser de DRF décodé par orjson"""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if not HAS_ORJSON or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            # orjson refuse NaN / Infinity, comme le mode strict de DRF
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,83 @@
+"""
+Commande Django pour comparer l'encodage / décodage JSON de l'API (orjson vs json standard)
+"""
+import io
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.json_renderers import HAS_ORJSON, FastJSONParser, FastJSONRenderer
+
+
+def sample_rows(count):
+    """Lignes semblables à celles de get_sheet_data (textes, nombres, dates, vides)"""
+    start = datetime(2024, 1, 1, 8, 30)
+    rows = []
+    for index in range(count):
+        rows.append({
+            "_row_id": index + 2,
+            "N°": index + 1,
+            "Navires": f"NAVIRE {index % 37}",
+            "Client": f"Client {index % 11}",
+            "Date B/L": (start + timedelta(days=index % 365)).strftime("%Y-%m-%d %H:%M"),
+            "Heure": f"{index % 24:02d}:{index % 60:02d}:00",
+            "Tonnage": round(1000 + index * 3.75, 2),
+            "Observations": None if index % 3 else "Chargement terminé — quai n°2",
+        })
+    return rows
+
+
+def best_of(function, repeat):
+    """Meilleur temps (ms) sur `repeat` exécutions"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = "Compare le JSONRenderer / JSONParser de DRF et leurs versions orjson sur une feuille synthétique"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Nombre de lignes de la feuille (défaut: 5000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Nombre de mesures, le meilleur temps est gardé (défaut: 5)')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+        data = {
+            "filename": "benchmark.xlsx",
+            "sheet_name": "Feuille",
+            "headers": list(sample_rows(1)[0].keys())[1:],
+            "data": sample_rows(rows),
+            "total_rows": rows,
+            # Valeurs non natives, encodées par l'encodeur de DRF dans les deux cas
+            "generated_at": datetime(2024, 6, 1, 12, 0, 0),
+            "duration": timedelta(minutes=3),
+        }
+
+        if not HAS_ORJSON:
+            self.stdout.write(self.style.WARNING("orjson n'est pas installé : les deux mesures utilisent le module json standard"))
+
+        standard = JSONRenderer().render(data)
+        fast = FastJSONRenderer().render(data)
+        if standard != fast:
+            self.stdout.write(self.style.ERROR('Sorties différentes entre les deux renderers'))
+            return
+
+        render_before = best_of(lambda: JSONRenderer().render(data), repeat)
+        render_after = best_of(lambda: FastJSONRenderer().render(data), repeat)
+
+        parse_before = best_of(lambda: JSONParser().parse(io.BytesIO(standard)), repeat)
+        parse_after = best_of(lambda: FastJSONParser().parse(io.BytesIO(standard)), repeat)
+
+        self.stdout.write(f"{rows} lignes, {len(standard) / 1024:.0f} Ko de JSON (meilleur de {repeat})")
+        self.stdout.write(f"  encodage : {render_before:8.2f} ms -> {render_after:8.2f} ms (x{render_before / render_after:.1f})")
+        self.stdout.write(f"  décodage : {parse_before:8.2f} ms -> {parse_after:8.2f} ms (x{parse_before / parse_after:.1f})")
+        self.stdout.write(self.style.SUCCESS('Sorties identiques'))
@@ -0,0 +1,16 @@
+"""
+Commande Django pour écrire dans les fichiers Excel les modifications en attente
+"""
+from django.core.management.base import BaseCommand
+
+from api.edit_journal import flush_all_pending_edits
+from api.models import PendingEdit
+
+
+class Command(BaseCommand):
+    help = "Écrit dans les fichiers Excel les modifications en attente du journal d'écriture différée"
+
+    def handle(self, *args, **options):
+        total = flush_all_pending_edits()
+        remaining = PendingEdit.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'Modifications écrites: {total}, restantes: {remaining}'))
@@ -6,6 +6,7 @@ import os
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from api.models import FileCache, SheetDataCache
+from api.sheet_rows import absorb_legacy_data
 
 
 class Command(BaseCommand):
@@ -82,6 +83,8 @@ class Command(BaseCommand):
                         rows_count=sheet_data['rows_count']
                     )
                     sdc.save()
+                    # Découper les données en lignes SheetRow
+                    absorb_legacy_data(sdc)
                     sheets_created += 1
                 except Exception as e:
                     self.stdout.write(self.style.WARNING(f'  Erreur feuille {sheet_data["sheet_name"]}: {e}'))
@@ -0,0 +1,18 @@
+"""
+Commande Django pour reconstruire les index secondaires des colonnes indexées
+"""
+from django.core.management.base import BaseCommand
+
+from api.models import SheetDataCache
+from api.sheet_indexes import rebuild_sheet_indexes
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les index des colonnes indexées de toutes les feuilles en cache"
+
+    def handle(self, *args, **options):
+        sheets = SheetDataCache.objects.defer('data').exclude(indexed_columns=[])
+        total = 0
+        for sheet_cache in sheets:
+            total += rebuild_sheet_indexes(sheet_cache)
+        self.stdout.write(self.style.SUCCESS(f'Index reconstruits: {sheets.count()} feuilles, {total} entrées'))
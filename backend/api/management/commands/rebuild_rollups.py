@@ -0,0 +1,18 @@
+"""
+Commande Django pour recalculer les agrégats du tableau de bord
+"""
+from django.core.management.base import BaseCommand
+
+from api.models import SheetDataCache
+from api.sheet_rollups import rebuild_sheet_rollups
+
+
+class Command(BaseCommand):
+    help = "Recalcule les agrégats pré-calculés (par mois, par catégorie) de toutes les feuilles en cache"
+
+    def handle(self, *args, **options):
+        sheets = SheetDataCache.objects.defer('data')
+        total = 0
+        for sheet_cache in sheets:
+            total += rebuild_sheet_rollups(sheet_cache)
+        self.stdout.write(self.style.SUCCESS(f'Agrégats recalculés: {sheets.count()} feuilles, {total} agrégats'))
@@ -0,0 +1,18 @@
+"""
+Commande Django pour reconstruire l'index de recherche plein texte
+"""
+from django.core.management.base import BaseCommand
+
+from api.search_index import rebuild_index, is_available
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte de toutes les lignes en cache"
+
+    def handle(self, *args, **options):
+        if not is_available():
+            self.stdout.write(self.style.WARNING("Recherche plein texte non disponible pour cette base de données"))
+            return
+
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Index reconstruit: {count} lignes indexées'))
@@ -0,0 +1,188 @@
+"""
+Compression des réponses de l'API (/api/) négociée par Accept-Encoding : zstd, brotli ou gzip
+
+Les données des feuilles sont très répétitives (mêmes navires, clients, noms de
+colonnes sur chaque ligne) et se compressent fortement.
+- réponses classiques : compressées au-delà de API_COMPRESSION_MIN_SIZE octets
+- réponses diffusées (feuille complète, CSV, NDJSON, Arrow) : compressées morceau par morceau
+- fichiers déjà compressés (téléchargements .xlsx, zip, images) : envoyés tels quels
+
+zstd et brotli sont optionnels (paquets zstandard et brotli) ; gzip est toujours disponible.
+Comme GZipMiddleware de Django, l'ETag d'une réponse compressée devient faible (W/"...").
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+# Import conditionnel de Brotli
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+# Import conditionnel de Zstandard
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# Préfixe des URL compressées
+API_PREFIX = '/api/'
+
+# Taille minimale (octets) d'une réponse non diffusée pour être compressée
+DEFAULT_MIN_SIZE = 1024
+
+# Types de contenu déjà compressés (xlsx = archive zip)
+COMPRESSED_CONTENT_TYPES = (
+    'application/vnd.openxmlformats-officedocument',
+    'application/vnd.ms-excel',
+    'application/zip',
+    'application/gzip',
+    'application/x-7z-compressed',
+    'image/',
+    'audio/',
+    'video/',
+)
+
+# Niveaux adaptés à des réponses dynamiques (rapides plutôt que maximaux)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+accept_encoding_re = _lazy_re_compile(r'^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def available_encodings():
+    """Encodages disponibles, par ordre de préférence du serveur"""
+    encodings = []
+    if HAS_ZSTD:
+        encodings.append('zstd')
+    if HAS_BROTLI:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def choose_encoding(accept_encoding):
+    """Encodage à utiliser pour l'en-tête Accept-Encoding du client, None si aucun"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        match = accept_encoding_re.match(part)
+        if not match:
+            continue
+        coding = match.group(1).lower()
+        try:
+            quality = float(match.group(2)) if match.group(2) is not None else 1.0
+        except ValueError:
+            continue
+        accepted[coding] = quality
+
+    best = None
+    best_quality = 0.0
+    for coding in available_encodings():
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class StreamCompressor:
+    """Compresseur incrémental commun aux trois encodages"""
+
+    def __init__(self, coding):
+        self.coding = coding
+        if coding == 'zstd':
+            self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif coding == 'br':
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        """Compresser un morceau et le rendre immédiatement décodable par le client"""
+        if self.coding == 'zstd':
+            return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.coding == 'br':
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.coding == 'zstd':
+            return self.compressor.flush()
+        if self.coding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+def compress_bytes(data, coding):
+    if coding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_sequence(chunks, coding):
+    compressor = StreamCompressor(coding)
+    for chunk in chunks:
+        if chunk:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """Compression des réponses de /api/ (à placer juste après CorsMiddleware)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'API_COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.path.startswith(API_PREFIX):
+            return self.process_response(request, response)
+        return response
+
+    def process_response(self, request, response):
+        if response.status_code in (204, 304) or request.method == 'HEAD':
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').lower()
+        if content_type.startswith(COMPRESSED_CONTENT_TYPES):
+            return response
+
+        # La réponse dépend d'Accept-Encoding, même quand elle n'est pas compressée
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(response.streaming_content, coding)
+            del response['Content-Length']
+        else:
+            compressed = compress_bytes(response.content, coding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # Le corps diffère de la version non compressée : ETag faible
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        response['Content-Encoding'] = coding
+        return response
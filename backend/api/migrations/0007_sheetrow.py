@@ -0,0 +1,104 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:56
+
+import django.db.models.deletion
+import json
+
+from django.db import migrations, models
+
+
+def parse_legacy_row_id(value):
+    """_row_id d'un ancien blob (int, float entier ou str, comme sheet_rows.parse_row_id), None si invalide"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        value = value.strip()
+        if value.endswith('.0'):
+            value = value[:-2]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def split_sheet_blobs(apps, schema_editor):
+    """Découper le JSON `data` de chaque feuille en lignes SheetRow"""
+    SheetDataCache = apps.get_model('api', 'SheetDataCache')
+    SheetRow = apps.get_model('api', 'SheetRow')
+
+    for sheet in SheetDataCache.objects.all().iterator():
+        data = sheet.data
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                data = []
+        if not isinstance(data, list) or not data:
+            continue
+
+        rows = []
+        used_ids = set()
+        max_id = 1
+        for position, entry in enumerate(data):
+            if not isinstance(entry, dict):
+                continue
+            values = dict(entry)
+            row_id = parse_legacy_row_id(values.pop('_row_id', None))
+            # Absent, invalide, en-tête (< 2) ou en double : numéroté d'après la position
+            if row_id is None or row_id < 2 or row_id in used_ids:
+                row_id = max(max_id, position + 2)
+                while row_id in used_ids:
+                    row_id += 1
+            used_ids.add(row_id)
+            max_id = max(max_id, row_id + 1)
+            rows.append(SheetRow(sheet_id=sheet.pk, row_id=row_id, position=position, values=values))
+
+        SheetRow.objects.bulk_create(rows, batch_size=500)
+        SheetDataCache.objects.filter(pk=sheet.pk).update(data=[], rows_count=len(rows))
+
+
+def merge_sheet_rows(apps, schema_editor):
+    """Reconstituer le JSON `data` à partir des lignes (retour arrière)"""
+    SheetDataCache = apps.get_model('api', 'SheetDataCache')
+    SheetRow = apps.get_model('api', 'SheetRow')
+
+    for sheet in SheetDataCache.objects.all().iterator():
+        data = []
+        for row_id, values in SheetRow.objects.filter(sheet_id=sheet.pk).order_by('position').values_list('row_id', 'values'):
+            entry = {'_row_id': row_id}
+            entry.update(values)
+            data.append(entry)
+        SheetDataCache.objects.filter(pk=sheet.pk).update(data=data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_add_soft_delete_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sheetdatacache',
+            name='data',
+            field=models.JSONField(default=list, verbose_name='Données brutes (héritage)'),
+        ),
+        migrations.CreateModel(
+            name='SheetRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_id', models.IntegerField(verbose_name='Identifiant de ligne')),
+                ('position', models.IntegerField(default=0, verbose_name='Position')),
+                ('values', models.JSONField(default=dict, verbose_name='Valeurs de la ligne')),
+                ('sheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='api.sheetdatacache')),
+            ],
+            options={
+                'verbose_name': 'Ligne de feuille',
+                'verbose_name_plural': 'Lignes des feuilles',
+                'indexes': [models.Index(fields=['sheet', 'position'], name='api_sheetrow_position_idx')],
+                'unique_together': {('sheet', 'row_id')},
+            },
+        ),
+        migrations.RunPython(split_sheet_blobs, merge_sheet_rows),
+    ]
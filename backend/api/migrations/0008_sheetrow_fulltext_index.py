@@ -0,0 +1,72 @@
+# Index plein texte des lignes (FTS5 sous SQLite, tsvector + GIN sous PostgreSQL)
+
+from django.db import migrations
+
+
+def row_search_text(values):
+    """Texte indexé d'une ligne : toutes ses valeurs non vides"""
+    parts = []
+    for value in (values or {}).values():
+        if value is None:
+            continue
+        text = str(value).strip()
+        if text:
+            parts.append(text)
+    return ' · '.join(parts)
+
+
+def create_fulltext_index(apps, schema_editor):
+    """Créer l'index selon la base de données puis y ajouter les lignes existantes"""
+    vendor = schema_editor.connection.vendor
+    SheetRow = apps.get_model('api', 'SheetRow')
+
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS api_sheetrow_fts USING fts5("
+            "content, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insert_sql = "INSERT INTO api_sheetrow_fts (rowid, content) VALUES (%s, %s)"
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS api_sheetrow_fts ("
+            "row_pk bigint PRIMARY KEY REFERENCES api_sheetrow (id) ON DELETE CASCADE, "
+            "content text NOT NULL, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS api_sheetrow_fts_document_gin "
+            "ON api_sheetrow_fts USING gin (document)"
+        )
+        insert_sql = (
+            "INSERT INTO api_sheetrow_fts (row_pk, content, document) "
+            "VALUES (%s, %s, to_tsvector('simple', %s))"
+        )
+    else:
+        return
+
+    batch = []
+    with schema_editor.connection.cursor() as cursor:
+        for pk, values in SheetRow.objects.values_list('pk', 'values').iterator(chunk_size=500):
+            text = row_search_text(values)
+            batch.append((pk, text) if vendor == 'sqlite' else (pk, text, text))
+            if len(batch) >= 500:
+                cursor.executemany(insert_sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert_sql, batch)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS api_sheetrow_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_sheetrow'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_sheetrow_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sheetdatacache',
+            name='rollups_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Agrégats mis à jour le'),
+        ),
+        migrations.CreateModel(
+            name='SheetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('month', 'Par mois'), ('category', 'Par catégorie')], max_length=20, verbose_name="Type d'agrégat")),
+                ('dimension', models.CharField(max_length=255, verbose_name='Colonne de regroupement')),
+                ('bucket', models.CharField(max_length=255, verbose_name='Valeur du groupe')),
+                ('measure', models.CharField(blank=True, default='', max_length=255, verbose_name='Colonne sommée')),
+                ('count', models.IntegerField(default=0, verbose_name='Nombre de lignes')),
+                ('total', models.FloatField(default=0, verbose_name='Somme')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Mis à jour le')),
+                ('sheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.sheetdatacache')),
+            ],
+            options={
+                'verbose_name': 'Agrégat de feuille',
+                'verbose_name_plural': 'Agrégats des feuilles',
+                'unique_together': {('sheet', 'kind', 'dimension', 'bucket', 'measure')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_sheet_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sheetdatacache',
+            name='indexed_columns',
+            field=models.JSONField(blank=True, default=list, verbose_name='Colonnes indexées'),
+        ),
+        migrations.CreateModel(
+            name='SheetIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('column', models.CharField(max_length=255, verbose_name='Colonne')),
+                ('text_key', models.CharField(blank=True, max_length=255, null=True, verbose_name='Clé texte')),
+                ('number_key', models.FloatField(blank=True, null=True, verbose_name='Clé numérique')),
+                ('date_key', models.CharField(blank=True, max_length=32, null=True, verbose_name='Clé date')),
+                ('row', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='index_entries', to='api.sheetrow')),
+                ('sheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='index_entries', to='api.sheetdatacache')),
+            ],
+            options={
+                'verbose_name': "Entrée d'index",
+                'verbose_name_plural': "Entrées d'index",
+                'indexes': [models.Index(fields=['sheet', 'column', 'text_key'], name='api_index_text_idx'), models.Index(fields=['sheet', 'column', 'number_key'], name='api_index_number_idx'), models.Index(fields=['sheet', 'column', 'date_key'], name='api_index_date_idx')],
+            },
+        ),
+    ]
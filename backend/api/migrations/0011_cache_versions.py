@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_sheet_column_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filecache',
+            name='version',
+            field=models.BigIntegerField(default=0, verbose_name='Version'),
+        ),
+        migrations.AddField(
+            model_name='sheetdatacache',
+            name='version',
+            field=models.BigIntegerField(default=0, verbose_name='Version'),
+        ),
+    ]
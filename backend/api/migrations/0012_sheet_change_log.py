@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def start_change_log(apps, schema_editor):
+    """Le journal démarre vide : complet à partir de la version actuelle de chaque feuille"""
+    SheetDataCache = apps.get_model('api', 'SheetDataCache')
+    SheetDataCache.objects.update(changes_base_version=models.F('version'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_cache_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sheetdatacache',
+            name='changes_base_version',
+            field=models.BigIntegerField(default=0, verbose_name='Journal complet depuis la version'),
+        ),
+        migrations.CreateModel(
+            name='SheetChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='Version de la feuille après la modification')),
+                ('row_id', models.IntegerField(verbose_name='Identifiant de ligne')),
+                ('operation', models.CharField(choices=[('insert', 'Ajout'), ('update', 'Modification'), ('delete', 'Suppression')], max_length=10, verbose_name='Opération')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Date')),
+                ('sheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='api.sheetdatacache')),
+            ],
+            options={
+                'verbose_name': 'Modification de feuille',
+                'verbose_name_plural': 'Modifications des feuilles',
+                'indexes': [models.Index(fields=['sheet', 'version'], name='api_sheetchange_version_idx')],
+            },
+        ),
+        migrations.RunPython(start_change_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_sheet_change_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingEdit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sheet_name', models.CharField(max_length=255, verbose_name='Nom de la feuille')),
+                ('row_id', models.IntegerField(verbose_name='Identifiant de ligne')),
+                ('operation', models.CharField(choices=[('insert', 'Ajout'), ('update', 'Modification'), ('delete', 'Suppression')], max_length=10, verbose_name='Opération')),
+                ('values', models.JSONField(blank=True, default=dict, verbose_name='Valeurs')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Date')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Modifié par')),
+                ('file_cache', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_edits', to='api.filecache')),
+            ],
+            options={
+                'verbose_name': 'Modification en attente',
+                'verbose_name_plural': 'Modifications en attente',
+                'ordering': ['id'],
+            },
+        ),
+    ]
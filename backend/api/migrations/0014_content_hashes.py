@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_pending_edits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filecache',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Empreinte du fichier'),
+        ),
+        migrations.AddField(
+            model_name='sheetdatacache',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Empreinte de la feuille'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Agrégats du tableau de bord recalculés avec les colonnes limitées (date principale, nombres résumés)
+
+from django.db import migrations
+
+
+def reset_rollups(apps, schema_editor):
+    """
+    Agrégats limités à la colonne date principale et aux colonnes numériques résumées :
+    les anciens (toutes les dates croisées avec tous les nombres) sont recalculés à la
+    prochaine lecture du tableau de bord (ensure_rollups)
+    """
+    SheetRollup = apps.get_model('api', 'SheetRollup')
+    SheetDataCache = apps.get_model('api', 'SheetDataCache')
+    SheetRollup.objects.all().delete()
+    SheetDataCache.objects.update(rollups_updated_at=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_content_hashes'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_rollups, migrations.RunPython.noop),
+    ]
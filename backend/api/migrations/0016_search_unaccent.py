@@ -0,0 +1,38 @@
+# Recherche plein texte insensible aux accents sous PostgreSQL, comme sous SQLite
+# (FTS5 remove_diacritics) : extension unaccent et configuration texte api_search
+
+from django.db import migrations
+
+FORWARD_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "DROP TEXT SEARCH CONFIGURATION IF EXISTS api_search",
+    "CREATE TEXT SEARCH CONFIGURATION api_search (COPY = simple)",
+    "ALTER TEXT SEARCH CONFIGURATION api_search "
+    "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, simple",
+    "UPDATE api_sheetrow_fts SET document = to_tsvector('api_search', content)",
+]
+
+BACKWARD_SQL = [
+    "UPDATE api_sheetrow_fts SET document = to_tsvector('simple', content)",
+    "DROP TEXT SEARCH CONFIGURATION IF EXISTS api_search",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_reset_sheet_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(FORWARD_SQL), run_on_postgresql(BACKWARD_SQL)),
+    ]
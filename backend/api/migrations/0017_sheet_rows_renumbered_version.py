@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_search_unaccent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sheetdatacache',
+            name='rows_renumbered_version',
+            field=models.BigIntegerField(default=0, verbose_name='Lignes renumérotées à la version'),
+        ),
+    ]
@@ -13,6 +13,8 @@ class FileCache(models.Model):
     total_entries = models.IntegerField(default=0, verbose_name="Nombre d'entrées")
     file_size = models.BigIntegerField(default=0, verbose_name="Taille du fichier")
     file_modified = models.DateTimeField(verbose_name="Date de modification du fichier")
+    # Empreinte SHA-256 du fichier mis en cache ('' = inconnue) : un fichier touché mais identique n'est pas relu
+    content_hash = models.CharField(max_length=64, blank=True, default='', verbose_name="Empreinte du fichier")
     cached_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise en cache")
     # Suivi du dernier utilisateur qui a modifié le fichier
     last_modified_by = models.ForeignKey(
@@ -37,6 +39,8 @@ class FileCache(models.Model):
     )
     # Chemin d'archive pour le fichier supprimé
     archived_path = models.CharField(max_length=1000, blank=True, null=True, verbose_name="Chemin d'archive")
+    # Version incrémentée à chaque écriture (fichier ou une de ses feuilles), sert d'ETag
+    version = models.BigIntegerField(default=0, verbose_name="Version")
     
     class Meta:
         verbose_name = "Cache de fichier"
@@ -45,6 +49,13 @@ class FileCache(models.Model):
     
     def __str__(self):
         return self.filename
+    
+    def save(self, *args, **kwargs):
+        # Les mises à jour par queryset.update() incrémentent la version avec F('version') + 1
+        self.version = (self.version or 0) + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
 
 
 class SheetDataCache(models.Model):
@@ -53,9 +64,25 @@ class SheetDataCache(models.Model):
     sheet_name = models.CharField(max_length=255, verbose_name="Nom de la feuille")
     headers = models.JSONField(default=list, verbose_name="En-têtes des colonnes")
     columns_info = models.JSONField(default=list, verbose_name="Infos des colonnes")
-    data = models.JSONField(default=list, verbose_name="Données de la feuille")
+    # Ancien stockage monolithique : les lignes vivent maintenant dans SheetRow.
+    # Ce champ ne sert plus qu'à l'import (data_export.json) avant découpage.
+    data = models.JSONField(default=list, verbose_name="Données brutes (héritage)")
     rows_count = models.IntegerField(default=0, verbose_name="Nombre de lignes")
+    # Empreinte de la partie XML de la feuille et de ce dont ses valeurs dépendent ('' = inconnue) :
+    # à la synchronisation, seules les feuilles dont l'empreinte a changé sont relues
+    content_hash = models.CharField(max_length=64, blank=True, default='', verbose_name="Empreinte de la feuille")
     cached_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise en cache")
+    # Colonnes indexées (SheetIndexEntry) pour accélérer les filtres, choisies par l'utilisateur
+    indexed_columns = models.JSONField(default=list, blank=True, verbose_name="Colonnes indexées")
+    # Date de dernière mise à jour des agrégats (SheetRollup), None = jamais calculés
+    rollups_updated_at = models.DateTimeField(null=True, blank=True, verbose_name="Agrégats mis à jour le")
+    # Version incrémentée à chaque écriture (en-têtes, colonnes ou lignes), sert d'ETag
+    version = models.BigIntegerField(default=0, verbose_name="Version")
+    # Journal des modifications (SheetChange) complet à partir de cette version
+    changes_base_version = models.BigIntegerField(default=0, verbose_name="Journal complet depuis la version")
+    # Version de la dernière renumérotation des _row_id (relecture du fichier, par exemple
+    # après l'écriture de suppressions) : une écriture fondée sur une version antérieure est refusée
+    rows_renumbered_version = models.BigIntegerField(default=0, verbose_name="Lignes renumérotées à la version")
     
     class Meta:
         verbose_name = "Cache de feuille"
@@ -64,6 +91,143 @@ class SheetDataCache(models.Model):
     
     def __str__(self):
         return f"{self.file_cache.filename} - {self.sheet_name}"
+    
+    def save(self, *args, **kwargs):
+        self.version = (self.version or 0) + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+
+
+class SheetRow(models.Model):
+    """Une ligne de données d'une feuille (une modification = une seule ligne SQL)"""
+    sheet = models.ForeignKey(SheetDataCache, on_delete=models.CASCADE, related_name='rows')
+    row_id = models.IntegerField(verbose_name="Identifiant de ligne")
+    position = models.IntegerField(default=0, verbose_name="Position")
+    values = models.JSONField(default=dict, verbose_name="Valeurs de la ligne")
+    
+    class Meta:
+        verbose_name = "Ligne de feuille"
+        verbose_name_plural = "Lignes des feuilles"
+        unique_together = ['sheet', 'row_id']
+        indexes = [
+            models.Index(fields=['sheet', 'position'], name='api_sheetrow_position_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.sheet.sheet_name} - ligne {self.row_id}"
+
+
+class SheetChange(models.Model):
+    """Journal des modifications d'entrées d'une feuille (synchronisation par différences)"""
+    OPERATIONS = [
+        ('insert', 'Ajout'),
+        ('update', 'Modification'),
+        ('delete', 'Suppression'),
+    ]
+    
+    sheet = models.ForeignKey(SheetDataCache, on_delete=models.CASCADE, related_name='changes')
+    version = models.BigIntegerField(verbose_name="Version de la feuille après la modification")
+    row_id = models.IntegerField(verbose_name="Identifiant de ligne")
+    operation = models.CharField(max_length=10, choices=OPERATIONS, verbose_name="Opération")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date")
+    
+    class Meta:
+        verbose_name = "Modification de feuille"
+        verbose_name_plural = "Modifications des feuilles"
+        indexes = [
+            models.Index(fields=['sheet', 'version'], name='api_sheetchange_version_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.sheet.sheet_name} - v{self.version} {self.operation} ligne {self.row_id}"
+
+
+class SheetIndexEntry(models.Model):
+    """
+    Entrée d'index secondaire : valeur d'une colonne indexée -> ligne.
+    Une seule des clés est renseignée selon le type de la colonne :
+    text_key (égalité, colonnes text_only), number_key / date_key (égalité et intervalles).
+    """
+    sheet = models.ForeignKey(SheetDataCache, on_delete=models.CASCADE, related_name='index_entries')
+    column = models.CharField(max_length=255, verbose_name="Colonne")
+    row = models.ForeignKey(SheetRow, on_delete=models.CASCADE, related_name='index_entries')
+    text_key = models.CharField(max_length=255, null=True, blank=True, verbose_name="Clé texte")
+    number_key = models.FloatField(null=True, blank=True, verbose_name="Clé numérique")
+    date_key = models.CharField(max_length=32, null=True, blank=True, verbose_name="Clé date")
+    
+    class Meta:
+        verbose_name = "Entrée d'index"
+        verbose_name_plural = "Entrées d'index"
+        indexes = [
+            models.Index(fields=['sheet', 'column', 'text_key'], name='api_index_text_idx'),
+            models.Index(fields=['sheet', 'column', 'number_key'], name='api_index_number_idx'),
+            models.Index(fields=['sheet', 'column', 'date_key'], name='api_index_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.sheet.sheet_name} - {self.column} - ligne {self.row_id}"
+
+
+class SheetRollup(models.Model):
+    """
+    Agrégat pré-calculé d'une feuille pour le tableau de bord :
+    - par mois de la colonne date principale (nombre de lignes, somme des colonnes numériques résumées)
+    - par catégorie d'une colonne texte (nombre de lignes)
+    Tenu à jour à chaque ajout / modification / suppression d'entrée.
+    """
+    KIND_MONTH = 'month'
+    KIND_CATEGORY = 'category'
+    KINDS = [
+        (KIND_MONTH, 'Par mois'),
+        (KIND_CATEGORY, 'Par catégorie'),
+    ]
+    
+    sheet = models.ForeignKey(SheetDataCache, on_delete=models.CASCADE, related_name='rollups')
+    kind = models.CharField(max_length=20, choices=KINDS, verbose_name="Type d'agrégat")
+    dimension = models.CharField(max_length=255, verbose_name="Colonne de regroupement")
+    bucket = models.CharField(max_length=255, verbose_name="Valeur du groupe")
+    measure = models.CharField(max_length=255, blank=True, default='', verbose_name="Colonne sommée")
+    count = models.IntegerField(default=0, verbose_name="Nombre de lignes")
+    total = models.FloatField(default=0, verbose_name="Somme")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Mis à jour le")
+    
+    class Meta:
+        verbose_name = "Agrégat de feuille"
+        verbose_name_plural = "Agrégats des feuilles"
+        unique_together = ['sheet', 'kind', 'dimension', 'bucket', 'measure']
+    
+    def __str__(self):
+        return f"{self.sheet.sheet_name} - {self.dimension}={self.bucket} {self.measure}"
+
+
+class PendingEdit(models.Model):
+    """
+    Modification d'entrée en attente d'écriture dans le fichier Excel (journal d'écriture différée).
+    La base est à jour immédiatement ; le compacteur applique les modifications en attente
+    d'un classeur en un seul cycle load_workbook / save puis les supprime.
+    """
+    OPERATIONS = [
+        ('insert', 'Ajout'),
+        ('update', 'Modification'),
+        ('delete', 'Suppression'),
+    ]
+    
+    file_cache = models.ForeignKey(FileCache, on_delete=models.CASCADE, related_name='pending_edits')
+    sheet_name = models.CharField(max_length=255, verbose_name="Nom de la feuille")
+    row_id = models.IntegerField(verbose_name="Identifiant de ligne")
+    operation = models.CharField(max_length=10, choices=OPERATIONS, verbose_name="Opération")
+    values = models.JSONField(default=dict, blank=True, verbose_name="Valeurs")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Modifié par")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date")
+    
+    class Meta:
+        verbose_name = "Modification en attente"
+        verbose_name_plural = "Modifications en attente"
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.file_cache.filename} / {self.sheet_name} - {self.operation} ligne {self.row_id}"
 
 
 class ExcelFile(models.Model):
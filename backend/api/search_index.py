@@ -0,0 +1,199 @@
+"""
+Index plein texte des lignes de toutes les feuilles (recherche inter-fichiers)
+
+- SQLite : table virtuelle FTS5 api_sheetrow_fts (rowid = id de la SheetRow)
+- PostgreSQL : table api_sheetrow_fts (tsvector + index GIN)
+
+Les deux ignorent la casse et les accents (« equipe » trouve « Équipe ») : FTS5 avec
+remove_diacritics, PostgreSQL avec la configuration api_search (simple + unaccent,
+migration 0016).
+
+L'index est tenu à jour ligne par ligne par sheet_rows (ingestion d'un fichier
+et ajout / modification / suppression d'entrées).
+"""
+import html
+import re
+
+from django.db import connection
+
+from .models import SheetRow, SheetDataCache, FileCache
+
+FTS_TABLE = 'api_sheetrow_fts'
+
+# Configuration texte PostgreSQL : 'simple' (pas de racinisation : noms de navires,
+# clients...) précédée de unaccent
+SEARCH_CONFIG = 'api_search'
+
+# Taille des lots pour les mises à jour de l'index
+INDEX_BATCH_SIZE = 500
+
+# Nombre maximum de résultats par recherche
+MAX_SEARCH_RESULTS = 200
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Marqueurs internes du surlignage, remplacés par <mark> après échappement HTML
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def is_available():
+    """L'index plein texte n'existe que sous SQLite (FTS5) et PostgreSQL"""
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def row_search_text(values):
+    """Texte indexé d'une ligne : toutes ses valeurs non vides"""
+    parts = []
+    for value in values.values():
+        if value is None:
+            continue
+        text = str(value).strip()
+        if text:
+            parts.append(text)
+    return ' · '.join(parts)
+
+
+def batches(items, size=INDEX_BATCH_SIZE):
+    """Découper une liste en lots"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def index_rows(rows):
+    """Indexer (ou ré-indexer) des lignes : itérable de (id SheetRow, valeurs)"""
+    if not is_available():
+        return
+
+    items = [(pk, row_search_text(values or {})) for pk, values in rows]
+    with connection.cursor() as cursor:
+        for batch in batches(items):
+            if connection.vendor == 'sqlite':
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+                    [pk for pk, _ in batch]
+                )
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, content) VALUES (%s, %s)",
+                    batch
+                )
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (row_pk, content, document) "
+                    f"VALUES (%s, %s, to_tsvector('{SEARCH_CONFIG}', %s)) "
+                    f"ON CONFLICT (row_pk) DO UPDATE "
+                    f"SET content = EXCLUDED.content, document = EXCLUDED.document",
+                    [(pk, text, text) for pk, text in batch]
+                )
+
+
+def unindex_rows(pks):
+    """Retirer des lignes de l'index (ids SheetRow)"""
+    if not is_available():
+        return
+
+    pks = list(pks)
+    column = 'rowid' if connection.vendor == 'sqlite' else 'row_pk'
+    with connection.cursor() as cursor:
+        for batch in batches(pks):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE {column} IN ({placeholders})", batch)
+
+
+def rebuild_index():
+    """Reconstruire entièrement l'index à partir de toutes les lignes en cache"""
+    if not is_available():
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    count = 0
+    pending = []
+    for pk, values in SheetRow.objects.values_list('pk', 'values').iterator(chunk_size=INDEX_BATCH_SIZE):
+        pending.append((pk, values))
+        if len(pending) >= INDEX_BATCH_SIZE:
+            index_rows(pending)
+            count += len(pending)
+            pending = []
+    if pending:
+        index_rows(pending)
+        count += len(pending)
+    return count
+
+
+def search_tokens(query):
+    """Mots de la recherche (lettres et chiffres uniquement, sans syntaxe FTS)"""
+    return TOKEN_PATTERN.findall(query.lower())
+
+
+def highlight(snippet):
+    """Échapper l'extrait puis convertir les marqueurs internes en <mark>"""
+    escaped = html.escape(snippet or '')
+    return escaped.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def search_rows(query, limit=50, filename=None):
+    """
+    Rechercher des lignes dans toutes les feuilles de tous les fichiers actifs.
+    Chaque mot doit apparaître (préfixe accepté). Retourne une liste de résultats triés par pertinence.
+    """
+    tokens = search_tokens(query)
+    if not tokens or not is_available():
+        return []
+
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    rows_table = SheetRow._meta.db_table
+    sheets_table = SheetDataCache._meta.db_table
+    files_table = FileCache._meta.db_table
+
+    file_condition = ''
+    file_params = []
+    if filename:
+        file_condition = 'AND f.filename = %s'
+        file_params = [filename]
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        sql = (
+            f"SELECT f.filename, f.name, s.sheet_name, r.row_id, "
+            f"snippet({FTS_TABLE}, 0, %s, %s, '…', 16) "
+            f"FROM {FTS_TABLE} "
+            f"JOIN {rows_table} r ON r.id = {FTS_TABLE}.rowid "
+            f"JOIN {sheets_table} s ON s.id = r.sheet_id "
+            f"JOIN {files_table} f ON f.id = s.file_cache_id "
+            f"WHERE {FTS_TABLE} MATCH %s AND f.is_deleted = %s {file_condition} "
+            f"ORDER BY bm25({FTS_TABLE}) LIMIT %s"
+        )
+        params = [MARK_START, MARK_END, match, False, *file_params, limit]
+    else:
+        ts_query = ' & '.join(f'{token}:*' for token in tokens)
+        sql = (
+            f"SELECT f.filename, f.name, s.sheet_name, r.row_id, "
+            f"ts_headline('{SEARCH_CONFIG}', x.content, q, %s) "
+            f"FROM {FTS_TABLE} x "
+            f"CROSS JOIN to_tsquery('{SEARCH_CONFIG}', %s) q "
+            f"JOIN {rows_table} r ON r.id = x.row_pk "
+            f"JOIN {sheets_table} s ON s.id = r.sheet_id "
+            f"JOIN {files_table} f ON f.id = s.file_cache_id "
+            f"WHERE x.document @@ q AND f.is_deleted = %s {file_condition} "
+            f"ORDER BY ts_rank(x.document, q) DESC LIMIT %s"
+        )
+        headline_options = f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=24, MinWords=8"
+        params = [headline_options, ts_query, False, *file_params, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        results = cursor.fetchall()
+
+    return [
+        {
+            "filename": result_filename,
+            "file_name": name,
+            "sheet_name": sheet_name,
+            "_row_id": row_id,
+            "snippet": highlight(snippet)
+        }
+        for result_filename, name, sheet_name, row_id, snippet in results
+    ]
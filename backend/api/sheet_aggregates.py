@@ -0,0 +1,283 @@
+"""
+Agrégations (somme, moyenne, min, max, comptage) par groupes sur les lignes d'une feuille
+
+Les colonnes nécessaires sont lues en base sous forme de colonnes (une liste de
+valeurs par colonne) puis agrégées en une passe vectorisée avec NumPy.
+Sans NumPy, un calcul équivalent en Python pur est utilisé.
+
+    ?group_by=Navires&metric=sum:Tonnage&metric=avg:Tonnage&metric=count
+    ?group_by=Date B/L:month&metric=sum:Tonnage
+"""
+import math
+import re
+
+from .sheet_queries import NUMBER_TEXT_PATTERN, JsonText, get_column_types, parse_date, split_params
+
+# Import conditionnel de NumPy (calcul vectorisé)
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+AGGREGATE_OPERATIONS = ['sum', 'avg', 'min', 'max', 'count']
+
+# Opérations qui exigent une colonne de type nombre
+NUMERIC_OPERATIONS = ['sum', 'avg', 'min', 'max']
+
+# Regroupement des colonnes de dates par période
+DATE_PERIODS = {'year': 4, 'month': 7, 'day': 10}
+
+# Même règle que les filtres en base (sheet_queries.JsonNumber)
+NUMBER_PATTERN = re.compile(NUMBER_TEXT_PATTERN)
+
+
+def parse_group_by(values, headers, column_types):
+    """Lire les colonnes de regroupement: 'Colonne' ou 'Colonne:month' pour une date"""
+    groups = []
+    for item in split_params(values, headers):
+        column, period = item, None
+        if column not in headers and ':' in column:
+            column, period = column.rsplit(':', 1)
+        if column not in headers:
+            raise ValueError(f"Colonne de regroupement inconnue: {column}")
+        if period is not None:
+            if period not in DATE_PERIODS:
+                raise ValueError(f"Période inconnue: {period} (year, month, day)")
+            if column_types.get(column) != 'date':
+                raise ValueError(f"La colonne '{column}' n'est pas une date")
+        groups.append((column, period))
+    return groups
+
+
+def parse_metrics(values, headers, column_types):
+    """Lire les mesures 'operation:Colonne' (ou 'count' seul pour le nombre de lignes)"""
+    metrics = []
+    for value in split_params(values, headers):
+        operation, _, column = value.partition(':')
+        operation = operation.strip().lower()
+        if operation not in AGGREGATE_OPERATIONS:
+            raise ValueError(f"Opération inconnue: {operation}")
+        if not column:
+            if operation != 'count':
+                raise ValueError(f"Colonne requise pour '{operation}'")
+            metrics.append((operation, None))
+            continue
+        if column not in headers:
+            raise ValueError(f"Colonne inconnue: {column}")
+        if operation in NUMERIC_OPERATIONS and column_types.get(column) != 'number':
+            raise ValueError(f"La colonne '{column}' n'est pas numérique")
+        metrics.append((operation, column))
+    return metrics
+
+
+def metric_label(operation, column):
+    return f"{operation}:{column}" if column else operation
+
+
+def to_number(value):
+    """Convertir une cellule en nombre (NaN si vide ou non numérique)"""
+    if value is None or isinstance(value, bool):
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace(' ', '')
+    if NUMBER_PATTERN.match(text):
+        return float(text.replace(',', '.'))
+    return math.nan
+
+
+def group_key(value, period):
+    """Clé de regroupement d'une cellule (None si vide), tronquée à la période pour une date"""
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    if period:
+        try:
+            text, _ = parse_date(text[:16])
+        except ValueError:
+            try:
+                text, _ = parse_date(text[:10])
+            except ValueError:
+                return text
+        return text[:DATE_PERIODS[period]]
+    return text
+
+
+def load_columns(queryset, columns):
+    """Lire uniquement les colonnes demandées, sous forme de listes (une par colonne)"""
+    if not columns:
+        return {}, queryset.count()
+
+    aliases = {f'_c{index}': column for index, column in enumerate(columns)}
+    rows = queryset.order_by().annotate(
+        **{alias: JsonText(column) for alias, column in aliases.items()}
+    ).values_list(*aliases.keys())
+
+    values = list(zip(*rows)) if rows else [()] * len(aliases)
+    row_count = len(values[0]) if values else 0
+    return {column: list(values[index]) for index, column in enumerate(aliases.values())}, row_count
+
+
+def aggregate_numpy(key_columns, metric_columns, metrics, row_count):
+    """Agrégation vectorisée: codes de groupes puis bincount / reduceat par mesure"""
+    if row_count == 0:
+        return [], []
+
+    # Code entier du groupe de chaque ligne (combinaison des colonnes de regroupement)
+    group_codes = np.zeros(row_count, dtype=np.int64)
+    key_uniques = []
+    for keys in key_columns:
+        marked = np.array(['' if key is None else '\x01' + key for key in keys], dtype=object)
+        uniques, codes = np.unique(marked.astype(str), return_inverse=True)
+        key_uniques.append([None if key == '' else key[1:] for key in uniques.tolist()])
+        group_codes = group_codes * len(uniques) + codes.reshape(-1)
+    combined, inverse = np.unique(group_codes, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    group_count = len(combined)
+
+    # Clés de chaque groupe (décodage des codes combinés)
+    group_keys = []
+    for code in combined.tolist():
+        keys = []
+        for uniques in reversed(key_uniques):
+            code, index = divmod(code, len(uniques))
+            keys.append(uniques[index])
+        group_keys.append(list(reversed(keys)))
+
+    order = np.argsort(inverse, kind='stable')
+    sorted_groups = inverse[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+
+    results = []
+    row_counts = np.bincount(inverse, minlength=group_count)
+    for operation, column in metrics:
+        if column is None:
+            results.append(row_counts.astype(float))
+            continue
+
+        numbers = metric_columns[column]
+        present = ~np.isnan(numbers)
+        if operation == 'count':
+            results.append(np.bincount(inverse, weights=present, minlength=group_count))
+            continue
+
+        filled = np.where(present, numbers, 0.0)
+        totals = np.bincount(inverse, weights=filled, minlength=group_count)
+        counts = np.bincount(inverse, weights=present, minlength=group_count)
+        if operation == 'sum':
+            values = np.where(counts > 0, totals, np.nan)
+        elif operation == 'avg':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = totals / counts
+        elif operation == 'min':
+            values = np.fmin.reduceat(numbers[order], starts)
+        else:
+            values = np.fmax.reduceat(numbers[order], starts)
+        results.append(values)
+
+    return group_keys, [row_counts.tolist()] + [values.tolist() for values in results]
+
+
+def aggregate_python(key_columns, metric_columns, metrics, row_count):
+    """Agrégation équivalente en Python pur (si NumPy n'est pas installé)"""
+    groups = {}
+    for index in range(row_count):
+        key = tuple(keys[index] for keys in key_columns)
+        state = groups.get(key)
+        if state is None:
+            state = groups[key] = {'rows': 0, 'metrics': [[0.0, 0, math.nan, math.nan] for _ in metrics]}
+        state['rows'] += 1
+        for metric_index, (operation, column) in enumerate(metrics):
+            if column is None:
+                continue
+            number = metric_columns[column][index]
+            if math.isnan(number):
+                continue
+            metric_state = state['metrics'][metric_index]
+            metric_state[0] += number
+            metric_state[1] += 1
+            metric_state[2] = number if math.isnan(metric_state[2]) else min(metric_state[2], number)
+            metric_state[3] = number if math.isnan(metric_state[3]) else max(metric_state[3], number)
+
+    # Même ordre que NumPy: clés triées, vides en premier
+    sorted_keys = sorted(groups, key=lambda key: tuple('' if k is None else '\x01' + k for k in key))
+    group_keys = [list(key) for key in sorted_keys]
+    row_counts = [groups[key]['rows'] for key in sorted_keys]
+    columns = [row_counts]
+    for metric_index, (operation, column) in enumerate(metrics):
+        values = []
+        for key in sorted_keys:
+            total, count, minimum, maximum = groups[key]['metrics'][metric_index]
+            if column is None:
+                values.append(float(groups[key]['rows']))
+            elif operation == 'count':
+                values.append(float(count))
+            elif operation == 'sum':
+                values.append(total if count else math.nan)
+            elif operation == 'avg':
+                values.append(total / count if count else math.nan)
+            elif operation == 'min':
+                values.append(minimum)
+            else:
+                values.append(maximum)
+        columns.append(values)
+    return group_keys, columns
+
+
+def clean_number(value):
+    """NaN -> None pour la sérialisation JSON, entiers sans décimale"""
+    if value is None or math.isnan(value):
+        return None
+    if float(value).is_integer():
+        return int(value)
+    return round(value, 6)
+
+
+def aggregate_rows(queryset, sheet_cache, headers, group_by_params, metric_params):
+    """
+    Calculer les agrégats d'une requête de lignes (déjà filtrée).
+    Lève ValueError si un paramètre est invalide.
+    """
+    column_types = get_column_types(sheet_cache)
+    groups = parse_group_by(group_by_params, headers, column_types)
+    metrics = parse_metrics(metric_params or ['count'], headers, column_types)
+
+    needed = []
+    for column in [column for column, _ in groups] + [column for _, column in metrics if column]:
+        if column not in needed:
+            needed.append(column)
+    columns, row_count = load_columns(queryset, needed)
+
+    key_columns = [[group_key(value, period) for value in columns[column]] for column, period in groups]
+    metric_columns = {}
+    for _, column in metrics:
+        if column and column not in metric_columns:
+            numbers = [to_number(value) for value in columns[column]]
+            metric_columns[column] = np.array(numbers, dtype=float) if HAS_NUMPY else numbers
+
+    if HAS_NUMPY:
+        group_keys, results = aggregate_numpy(key_columns, metric_columns, metrics, row_count)
+    else:
+        group_keys, results = aggregate_python(key_columns, metric_columns, metrics, row_count)
+
+    labels = [metric_label(operation, column) for operation, column in metrics]
+    group_labels = [f"{column}:{period}" if period else column for column, period in groups]
+    rows = []
+    for index, keys in enumerate(group_keys):
+        rows.append({
+            "keys": dict(zip(group_labels, keys)),
+            "rows": int(results[0][index]),
+            "values": {label: clean_number(results[metric + 1][index]) for metric, label in enumerate(labels)}
+        })
+
+    return {
+        "group_by": group_labels,
+        "metrics": labels,
+        "groups": rows,
+        "total_groups": len(rows),
+        "rows_scanned": row_count,
+        "engine": "numpy" if HAS_NUMPY else "python"
+    }
@@ -0,0 +1,131 @@
+"""
+Journal des modifications d'entrées (modèle SheetChange) et synchronisation par différences
+
+Chaque ajout / modification / suppression d'entrée enregistre (version, _row_id, opération).
+Un client qui connaît la version de sa copie demande seulement les lignes modifiées depuis :
+
+    GET .../changes/?since=42 -> inserted / updated (avec leurs valeurs) / deleted (_row_id)
+
+Le journal est compacté (seules les CHANGE_LOG_WINDOW dernières versions, et au plus
+CHANGE_LOG_MAX_ROWS lignes, sont gardées) et vidé à la ré-ingestion du fichier : une version
+plus ancienne impose un rechargement complet.
+"""
+from django.db.models import F
+
+from .models import SheetChange, SheetDataCache, SheetRow
+
+# Nombre de versions conservées dans le journal de chaque feuille
+CHANGE_LOG_WINDOW = 1000
+
+# Compaction du journal dès que la fenêtre a avancé de N versions
+COMPACT_EVERY = 100
+
+# Nombre maximum de lignes du journal d'une feuille (une modification en masse = une seule version)
+CHANGE_LOG_MAX_ROWS = 20000
+
+# Taille des lots pour les insertions en masse
+BULK_BATCH_SIZE = 500
+
+
+def record_change(sheet_cache, row_id, operation):
+    """Enregistrer une modification (après incrément de la version de la feuille)"""
+    version = sheet_cache.version
+    SheetChange.objects.create(sheet=sheet_cache, version=version, row_id=row_id, operation=operation)
+    if compaction_due(sheet_cache):
+        compact_changes(sheet_cache)
+
+
+def record_changes(sheet_cache, row_ids, operation):
+    """Enregistrer la même modification de plusieurs lignes (une seule version pour le lot)"""
+    version = sheet_cache.version
+    SheetChange.objects.bulk_create(
+        [SheetChange(sheet=sheet_cache, version=version, row_id=row_id, operation=operation) for row_id in row_ids],
+        batch_size=BULK_BATCH_SIZE
+    )
+    if compaction_due(sheet_cache):
+        compact_changes(sheet_cache)
+    else:
+        trim_changes(sheet_cache)
+
+
+def compaction_due(sheet_cache):
+    """
+    La fenêtre a avancé d'au moins COMPACT_EVERY versions depuis la dernière compaction
+    (la version peut avancer sans passer par le journal : pas de test sur un multiple exact)
+    """
+    return sheet_cache.version - CHANGE_LOG_WINDOW - sheet_cache.changes_base_version >= COMPACT_EVERY
+
+
+def forget_changes(sheet_cache, floor):
+    """Oublier les modifications jusqu'à la version `floor` incluse"""
+    SheetChange.objects.filter(sheet=sheet_cache, version__lte=floor).delete()
+    SheetDataCache.objects.filter(pk=sheet_cache.pk, changes_base_version__lt=floor).update(
+        changes_base_version=floor
+    )
+    sheet_cache.changes_base_version = max(sheet_cache.changes_base_version, floor)
+
+
+def compact_changes(sheet_cache):
+    """Oublier les modifications plus anciennes que la fenêtre du journal"""
+    floor = sheet_cache.version - CHANGE_LOG_WINDOW
+    if floor > 0:
+        forget_changes(sheet_cache, floor)
+    trim_changes(sheet_cache)
+
+
+def trim_changes(sheet_cache):
+    """Garder au plus CHANGE_LOG_MAX_ROWS lignes : les versions les plus anciennes sont oubliées"""
+    changes = SheetChange.objects.filter(sheet=sheet_cache)
+    if changes.count() <= CHANGE_LOG_MAX_ROWS:
+        return
+    # Version de la première ligne en trop (les plus récentes d'abord) : oubliée avec les précédentes
+    floor = changes.order_by('-version').values_list('version', flat=True)[CHANGE_LOG_MAX_ROWS]
+    forget_changes(sheet_cache, floor)
+
+
+def reset_changes(sheet_cache):
+    """Vider le journal (ré-ingestion complète) : les clients devront tout recharger"""
+    SheetChange.objects.filter(sheet=sheet_cache).delete()
+    SheetDataCache.objects.filter(pk=sheet_cache.pk).update(changes_base_version=F('version'))
+
+
+def changes_since(sheet_cache, since, fields=None):
+    """
+    Lignes ajoutées, modifiées et supprimées depuis la version `since`.
+    full_reload=True si le journal ne couvre plus cette version.
+    """
+    from .sheet_rows import row_to_dict, row_values
+
+    version = sheet_cache.version
+    result = {
+        "version": version,
+        "since": since,
+        "full_reload": False,
+        "inserted": [],
+        "updated": [],
+        "deleted": []
+    }
+    if since < sheet_cache.changes_base_version or since > version:
+        result["full_reload"] = True
+        return result
+    if since == version:
+        return result
+
+    # Pour chaque ligne : connue du client (première opération autre qu'un ajout),
+    # existe encore (dernière opération autre qu'une suppression), supprimée entre-temps
+    history = {}
+    changes = SheetChange.objects.filter(sheet=sheet_cache, version__gt=since).order_by('version', 'pk')
+    for row_id, operation in changes.values_list('row_id', 'operation'):
+        known, _, deleted = history.get(row_id, (operation != 'insert', None, False))
+        history[row_id] = (known, operation != 'delete', deleted or operation == 'delete')
+
+    # Ligne ajoutée puis supprimée depuis `since` : le client ne l'a jamais eue, rien à signaler.
+    # Identifiant supprimé puis réattribué à un ajout : suppression de l'ancienne ligne + ajout.
+    inserted_ids = {row_id for row_id, (known, exists, deleted) in history.items() if exists and (not known or deleted)}
+    result["deleted"] = sorted(row_id for row_id, (known, exists, deleted) in history.items() if known and deleted)
+
+    changed_ids = [row_id for row_id, (_, exists, _) in history.items() if exists]
+    rows = SheetRow.objects.filter(sheet=sheet_cache, row_id__in=changed_ids).order_by('position')
+    for row_id, values in row_values(rows, fields):
+        result["inserted" if row_id in inserted_ids else "updated"].append(row_to_dict(row_id, values))
+    return result
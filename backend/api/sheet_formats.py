@@ -0,0 +1,246 @@
+"""
+Formats de sortie des données d'une feuille (négociation de contenu)
+
+    Accept: application/json                      ou ?format=json    (par défaut)
+    Accept: application/x-ndjson                  ou ?format=ndjson  une ligne JSON par entrée (diffusé)
+    Accept: text/csv                              ou ?format=csv     (diffusé)
+    Accept: application/msgpack                   ou ?format=msgpack colonnes, textes en dictionnaire
+    Accept: application/vnd.apache.arrow.stream   ou ?format=arrow   Arrow IPC, lots de lignes diffusés
+
+MessagePack et Arrow sont optionnels (paquets msgpack et pyarrow) : s'ils ne sont
+pas installés, la réponse est un 406 en JSON.
+Pour NDJSON, CSV et Arrow, les informations de la feuille (total, version, page
+suivante) sont envoyées dans les en-têtes X-Sheet-*.
+"""
+import csv
+import io
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+
+from .json_renderers import dumps, dumps_bytes
+from .sheet_aggregates import to_number
+
+# Import conditionnel de MessagePack
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+# Import conditionnel de PyArrow (Apache Arrow IPC)
+try:
+    import pyarrow as pa
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Nombre de lignes par morceau envoyé (CSV, NDJSON) ou par lot Arrow
+FORMAT_CHUNK_ROWS = 500
+
+# Informations de la réponse JSON recopiées dans les en-têtes des formats diffusés
+META_HEADERS = {
+    'version': 'X-Sheet-Version',
+    'total_rows': 'X-Sheet-Total-Rows',
+    'next_after': 'X-Sheet-Next-After',
+    'next_offset': 'X-Sheet-Next-Offset',
+    'has_more': 'X-Sheet-Has-More',
+}
+
+
+class SheetDataRenderer(BaseRenderer):
+    """
+    Renderer déclaré pour la négociation (Accept / ?format=). Les lignes sont produites
+    par sheet_data_response ; render() ne sert qu'aux réponses d'erreur, renvoyées en JSON.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return dumps_bytes(data)
+
+
+class NDJSONRenderer(SheetDataRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(SheetDataRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class MessagePackRenderer(SheetDataRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+
+
+class ArrowStreamRenderer(SheetDataRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+
+SHEET_DATA_RENDERERS = [NDJSONRenderer, CSVRenderer, MessagePackRenderer, ArrowStreamRenderer]
+
+SHEET_DATA_FORMATS = [renderer.format for renderer in SHEET_DATA_RENDERERS]
+
+
+def iter_ndjson(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(dumps_bytes(row))
+        if len(chunk) >= FORMAT_CHUNK_ROWS:
+            yield b'\n'.join(chunk) + b'\n'
+            chunk = []
+    if chunk:
+        yield b'\n'.join(chunk) + b'\n'
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    return value
+
+
+def iter_csv(columns, rows):
+    """CSV UTF-8 avec BOM (ouverture directe dans Excel), première colonne _row_id"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('﻿')
+    writer.writerow(['_row_id', *columns])
+
+    count = 0
+    for row in rows:
+        writer.writerow([row.get('_row_id'), *(csv_cell(row.get(column)) for column in columns)])
+        count += 1
+        if count % FORMAT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_column(values):
+    """Colonne MessagePack : textes en dictionnaire (valeurs distinctes + indices), sinon liste"""
+    if not any(isinstance(value, str) for value in values):
+        return values
+    if not all(value is None or isinstance(value, str) for value in values):
+        return values
+
+    dictionary = {}
+    indices = []
+    for value in values:
+        if value is None:
+            indices.append(None)
+        else:
+            indices.append(dictionary.setdefault(value, len(dictionary)))
+    return {"dictionary": list(dictionary), "indices": indices}
+
+
+def msgpack_payload(head, columns, rows):
+    """Document MessagePack orienté colonnes : {..., "row_ids": [...], "columns": {nom: colonne}}"""
+    row_ids = []
+    values = {column: [] for column in columns}
+    for row in rows:
+        row_ids.append(row.get('_row_id'))
+        for column in columns:
+            values[column].append(row.get(column))
+
+    return {
+        **head,
+        "row_count": len(row_ids),
+        "row_ids": row_ids,
+        "columns": {column: encode_column(column_values) for column, column_values in values.items()}
+    }
+
+
+def arrow_schema(head, columns, column_types):
+    """Schéma Arrow : nombres en float64, autres colonnes en textes encodés par dictionnaire"""
+    fields = [pa.field('_row_id', pa.int64())]
+    for column in columns:
+        if column_types.get(column) == 'number':
+            fields.append(pa.field(column, pa.float64()))
+        else:
+            fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+    return pa.schema(fields, metadata={'sheet': dumps(head)})
+
+
+def arrow_batch(schema, columns, column_types, rows):
+    arrays = [pa.array([row.get('_row_id') for row in rows], type=pa.int64())]
+    for column in columns:
+        cells = [row.get(column) for row in rows]
+        if column_types.get(column) == 'number':
+            numbers = [to_number(cell) for cell in cells]
+            arrays.append(pa.array([None if number != number else number for number in numbers], type=pa.float64()))
+        else:
+            texts = [None if cell is None else str(cell) for cell in cells]
+            arrays.append(pa.array(texts, type=pa.string()).dictionary_encode())
+    return pa.record_batch(arrays, schema=schema)
+
+
+def iter_arrow(head, columns, column_types, rows):
+    """Flux Arrow IPC : schéma puis un lot par FORMAT_CHUNK_ROWS lignes"""
+    schema = arrow_schema(head, columns, column_types)
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def flush():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    yield flush()
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= FORMAT_CHUNK_ROWS:
+            writer.write_batch(arrow_batch(schema, columns, column_types, batch))
+            batch = []
+            yield flush()
+    if batch:
+        writer.write_batch(arrow_batch(schema, columns, column_types, batch))
+    writer.close()
+    yield flush()
+
+
+def sheet_data_response(output_format, head, columns, column_types, rows):
+    """
+    Réponse des lignes `rows` (itérable de dicts avec _row_id) dans le format négocié.
+    head : informations de la réponse JSON (filename, version, total_rows, pagination...)
+    """
+    if output_format == 'msgpack':
+        if not HAS_MSGPACK:
+            return Response({"error": "Format MessagePack non disponible (paquet msgpack non installé)"}, status=406)
+        payload = msgpack.packb(msgpack_payload(head, columns, rows), default=str)
+        return HttpResponse(payload, content_type=MessagePackRenderer.media_type)
+
+    if output_format == 'arrow':
+        if not HAS_PYARROW:
+            return Response({"error": "Format Arrow non disponible (paquet pyarrow non installé)"}, status=406)
+        content = iter_arrow(head, columns, column_types, rows)
+        content_type = ArrowStreamRenderer.media_type
+    elif output_format == 'csv':
+        content = iter_csv(columns, rows)
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content = iter_ndjson(rows)
+        content_type = NDJSONRenderer.media_type
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    for key, header in META_HEADERS.items():
+        if head.get(key) is not None:
+            response[header] = str(head[key]).lower() if isinstance(head[key], bool) else str(head[key])
+    if head.get('filtered_rows') is not None:
+        response['X-Sheet-Filtered-Rows'] = str(head['filtered_rows'])
+    if output_format == 'csv':
+        # Nom de feuille échappé (guillemets) ou encodé (RFC 5987, filename*=) si non ASCII
+        response['Content-Disposition'] = content_disposition_header(False, f'{head.get("sheet_name", "feuille")}.csv')
+    return response
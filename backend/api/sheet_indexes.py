@@ -0,0 +1,182 @@
+"""
+Index secondaires par colonne (modèle SheetIndexEntry), activés colonne par colonne
+
+- colonnes text_only (navires, clients...) : index d'égalité sur la valeur normalisée
+- colonnes number / date : index trié, utilisable pour l'égalité et les intervalles
+
+Les filtres de get_sheet_data (filter[Colonne][op]=valeur) passent automatiquement
+par l'index quand la colonne est indexée, au lieu d'extraire la valeur du JSON
+de chaque ligne de la feuille.
+"""
+import math
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import SheetDataCache, SheetIndexEntry, SheetRow
+from .sheet_aggregates import to_number
+from .sheet_queries import get_column_types, parse_date, parse_number
+
+# Types de colonnes indexables et clé utilisée pour chacun
+INDEX_KEYS = {
+    'text_only': 'text_key',
+    'number': 'number_key',
+    'date': 'date_key',
+}
+
+# Opérateurs de filtre servis par l'index selon la clé
+INDEX_OPERATORS = {
+    'text_key': ['eq'],
+    'number_key': ['eq', 'gt', 'gte', 'lt', 'lte'],
+    'date_key': ['eq', 'gt', 'gte', 'lt', 'lte'],
+}
+
+# Taille des lots pour les insertions en masse
+BULK_BATCH_SIZE = 500
+
+TEXT_KEY_LENGTH = 255
+DATE_KEY_LENGTH = 32
+
+
+def get_indexed_columns(sheet_cache):
+    """Colonnes indexées de la feuille avec leur clé : {colonne: 'text_key' | 'number_key' | 'date_key'}"""
+    column_types = get_column_types(sheet_cache)
+    indexed = {}
+    for column in sheet_cache.indexed_columns or []:
+        key_field = INDEX_KEYS.get(column_types.get(column))
+        if key_field:
+            indexed[column] = key_field
+    return indexed
+
+
+def text_key(value):
+    """Clé d'égalité d'un texte (insensible à la casse), None si vide ou trop long"""
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    if not text or len(text) > TEXT_KEY_LENGTH:
+        return None
+    return text
+
+
+def cell_key(value, key_field):
+    """Clé d'index d'une cellule (None si la cellule n'est pas indexée)"""
+    if value is None:
+        return None
+    if key_field == 'number_key':
+        # Comme les filtres sur le JSON (JsonNumber) : nombres et textes numériques ("123")
+        number = to_number(value)
+        return None if math.isnan(number) else number
+    if key_field == 'date_key':
+        text = str(value).strip()
+        return text[:DATE_KEY_LENGTH] if text else None
+    return text_key(value)
+
+
+def row_entries(sheet_cache, row_pk, values, indexed):
+    """Entrées d'index (non sauvegardées) d'une ligne"""
+    entries = []
+    for column, key_field in indexed.items():
+        key = cell_key(values.get(column), key_field)
+        if key is not None:
+            entries.append(SheetIndexEntry(sheet=sheet_cache, column=column, row_id=row_pk, **{key_field: key}))
+    return entries
+
+
+def rebuild_sheet_indexes(sheet_cache, rows=None):
+    """
+    Reconstruire les index de toutes les colonnes indexées d'une feuille.
+    rows : itérable de (id SheetRow, valeurs) déjà en mémoire (sinon relues en base)
+    """
+    with transaction.atomic():
+        SheetIndexEntry.objects.filter(sheet=sheet_cache).delete()
+        indexed = get_indexed_columns(sheet_cache)
+        if not indexed:
+            return 0
+
+        if rows is None:
+            rows = SheetRow.objects.filter(sheet=sheet_cache).values_list('pk', 'values').iterator(chunk_size=BULK_BATCH_SIZE)
+
+        count = 0
+        pending = []
+        for row_pk, values in rows:
+            pending.extend(row_entries(sheet_cache, row_pk, values or {}, indexed))
+            if len(pending) >= BULK_BATCH_SIZE:
+                SheetIndexEntry.objects.bulk_create(pending, batch_size=BULK_BATCH_SIZE)
+                count += len(pending)
+                pending = []
+        if pending:
+            SheetIndexEntry.objects.bulk_create(pending, batch_size=BULK_BATCH_SIZE)
+            count += len(pending)
+    return count
+
+
+def reindex_row(sheet_cache, row):
+    """Mettre à jour les entrées d'index d'une ligne ajoutée ou modifiée"""
+    reindex_rows(sheet_cache, [row])
+
+
+def reindex_rows(sheet_cache, rows):
+    """Mettre à jour les entrées d'index de lignes ajoutées ou modifiées (en une fois)"""
+    indexed = get_indexed_columns(sheet_cache)
+    if not indexed or not rows:
+        return
+    SheetIndexEntry.objects.filter(row__in=[row.pk for row in rows]).delete()
+    entries = []
+    for row in rows:
+        entries.extend(row_entries(sheet_cache, row.pk, row.values, indexed))
+    SheetIndexEntry.objects.bulk_create(entries, batch_size=BULK_BATCH_SIZE)
+
+
+def set_indexed_columns(sheet_cache, columns):
+    """
+    Choisir les colonnes indexées d'une feuille puis reconstruire ses index.
+    Lève ValueError si une colonne est inconnue ou d'un type non indexable.
+    """
+    column_types = get_column_types(sheet_cache)
+    headers = sheet_cache.headers or []
+    selected = []
+    for column in columns:
+        if column not in headers:
+            raise ValueError(f"Colonne inconnue: {column}")
+        if column_types.get(column) not in INDEX_KEYS:
+            raise ValueError(f"La colonne '{column}' ne peut pas être indexée (types indexables: text_only, number, date)")
+        if column not in selected:
+            selected.append(column)
+
+    with transaction.atomic():
+        SheetDataCache.objects.filter(pk=sheet_cache.pk).update(indexed_columns=selected)
+        sheet_cache.indexed_columns = selected
+        count = rebuild_sheet_indexes(sheet_cache)
+    return count
+
+
+def index_condition(sheet_cache, column, key_field, operator, value):
+    """
+    Condition Q d'un filtre servie par l'index (mêmes règles que filter_condition),
+    None si le filtre ne peut pas utiliser l'index.
+    """
+    if operator not in INDEX_OPERATORS[key_field]:
+        return None
+
+    if key_field == 'text_key':
+        key = text_key(value)
+        if key is None:
+            return None
+        lookups = {'text_key': key}
+    elif key_field == 'number_key':
+        lookup = 'exact' if operator == 'eq' else operator
+        lookups = {f'number_key__{lookup}': parse_number(value)}
+    else:
+        date_value, has_time = parse_date(value)
+        if operator == 'eq' and not has_time:
+            # Toute la journée (intervalle plutôt que LIKE pour rester sur l'index trié)
+            lookups = {'date_key__gte': date_value, 'date_key__lte': f"{date_value} 23:59"}
+        else:
+            if operator in ('lte', 'gt') and not has_time:
+                date_value = f"{date_value} 23:59"
+            lookup = 'exact' if operator == 'eq' else operator
+            lookups = {f'date_key__{lookup}': date_value}
+
+    entries = SheetIndexEntry.objects.filter(sheet=sheet_cache, column=column, **lookups)
+    return Q(pk__in=entries.values('row_id'))
@@ -0,0 +1,239 @@
+"""
+Lecture d'un classeur Excel en une seule passe (sans accès à la base de données)
+
+Le classeur est ouvert une seule fois et chaque feuille parcourue une seule fois pour
+produire en même temps : en-têtes, nombre d'entrées, lignes à mettre en cache et
+statistiques de type de chaque colonne (columns_info).
+
+Toutes les lignes sont lues, quelle que soit la taille de la feuille : elles sont mises
+de côté par lots de CHUNK_SIZE dans un fichier temporaire (RowSpool), puis relues lot
+par lot pour l'écriture en base. La mémoire utilisée ne dépend pas du nombre de lignes.
+
+Les valeurs sont lues directement dans le XML du classeur (xlsx_reader.XlsxReader) ;
+openpyxl ne sert que de repli pour les fichiers que cette lecture ne gère pas.
+
+La lecture donne aussi l'empreinte du fichier et de chaque feuille : avec les empreintes
+déjà en cache (known_hashes), les feuilles inchangées ne sont pas relues.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from datetime import datetime, timedelta
+from datetime import time as time_of_day
+
+from openpyxl import load_workbook
+
+from .column_types import ColumnStats, is_required_field
+from .xlsx_reader import XlsxReader, XlsxReadError, hash_stream
+
+# Nombre de lignes par lot (fichier temporaire et écriture en base)
+CHUNK_SIZE = 500
+
+
+class RowSpool:
+    """Lignes d'une feuille mises de côté par lots dans un fichier temporaire"""
+
+    def __init__(self):
+        descriptor, self.path = tempfile.mkstemp(prefix='ingestion-', suffix='.rows')
+        self.file = os.fdopen(descriptor, 'wb')
+
+    def write(self, chunk):
+        pickle.dump(chunk, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        self.file.close()
+
+
+def iter_spool(path):
+    """Relire les lots de lignes d'un fichier temporaire, un à la fois"""
+    with open(path, 'rb') as spool:
+        while True:
+            try:
+                yield pickle.load(spool)
+            except EOFError:
+                return
+
+
+def discard_spool(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def serialize_value(value):
+    """Convertir les valeurs non-JSON en chaînes"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, time_of_day):
+        return value.strftime("%H:%M:%S")
+    if isinstance(value, timedelta):
+        total_seconds = int(value.total_seconds())
+        hours, remainder = divmod(total_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return value
+
+
+def header_names(first_row):
+    """En-têtes d'une feuille à partir des valeurs de sa première ligne"""
+    headers = []
+    for cell in first_row:
+        if cell:
+            headers.append(str(cell).strip().replace('\n', ' '))
+    return headers
+
+
+def scan_sheet(sheet_name, rows, spool, chunk_size=CHUNK_SIZE):
+    """
+    Parcourir une fois les lignes d'une feuille (tuples de valeurs, à partir de la ligne 1),
+    les entrées étant écrites par lots dans `spool`.
+    Retourne {"name", "headers", "columns_info", "entries"} : entries compte les lignes non vides.
+    """
+    rows = iter(rows)
+    headers = header_names(next(rows, ()))
+    stats = {header: ColumnStats() for header in headers}
+
+    chunk = []
+    entries = 0
+    for row_idx, row in enumerate(rows, start=2):
+        if not any(cell is not None for cell in row):
+            continue
+        entries += 1
+
+        row_data = {"_row_id": row_idx}
+        for col_idx, header in enumerate(headers):
+            # Ligne plus courte que les en-têtes (cellules vides en fin de ligne) : valeurs None
+            value = row[col_idx] if col_idx < len(row) else None
+            stats[header].add(value)
+            row_data[header] = serialize_value(value)
+        chunk.append(row_data)
+        if len(chunk) >= chunk_size:
+            spool.write(chunk)
+            chunk = []
+    if chunk:
+        spool.write(chunk)
+
+    columns_info = []
+    for idx, header in enumerate(headers, start=1):
+        column_stats = stats[header]
+        field_type, data_type = column_stats.column_type(header)
+        columns_info.append({
+            "index": idx,
+            "name": header,
+            "field_type": field_type,
+            "data_type": data_type,  # 'number', 'text', 'text_only', 'date', 'boolean', 'any'
+            "required": is_required_field(header),
+            "sample_values": column_stats.sample_values()  # Exemples de valeurs
+        })
+
+    return {
+        "name": sheet_name,
+        "headers": headers,
+        "columns_info": columns_info,
+        "entries": entries
+    }
+
+
+class OpenpyxlReader:
+    """Classeur ouvert avec openpyxl, avec la même interface que XlsxReader"""
+
+    def __init__(self, filepath):
+        self.workbook = load_workbook(filepath, read_only=True, data_only=True)
+        self.sheetnames = list(self.workbook.sheetnames)
+
+    def content_hashes(self):
+        # Pas d'empreinte par feuille : toutes les feuilles sont relues
+        return {}
+
+    def iter_rows(self, sheet_name):
+        return self.workbook[sheet_name].iter_rows(values_only=True)
+
+    def close(self):
+        self.workbook.close()
+
+
+def file_hash(filepath):
+    """Empreinte SHA-256 (hexadécimale) du contenu d'un fichier"""
+    with open(filepath, 'rb') as stream:
+        return hash_stream(hashlib.sha256(), stream).hexdigest()
+
+
+def content_hashes(filepath):
+    """
+    Empreintes actuelles d'un classeur : (empreinte du fichier, {feuille: empreinte}).
+    Pas d'empreintes de feuilles si la lecture directe ne gère pas le fichier.
+    """
+    try:
+        reader = XlsxReader(filepath)
+        try:
+            sheet_hashes = reader.content_hashes()
+        finally:
+            reader.close()
+    except XlsxReadError:
+        sheet_hashes = {}
+    return file_hash(filepath), sheet_hashes
+
+
+def read_workbook(filepath, sheet_names=None, known_hashes=None):
+    """
+    Lire un classeur en une passe : toutes ses feuilles, ou seulement `sheet_names`.
+    known_hashes : {feuille: empreinte} déjà en cache ; les feuilles dont l'empreinte
+    n'a pas changé ne sont pas relues (absentes de "sheets").
+    Retourne {"sheetnames": [...], "sheets": [résultats de scan_sheet + "hash"], "file_hash",
+    "hashes": {feuille: empreinte}, "read_ms": durée, "reader": lecteur} ;
+    les lignes de chaque feuille sont dans le fichier temporaire sheet["spool"] (voir iter_spool),
+    à supprimer par l'appelant (discard_workbook).
+    """
+    try:
+        return read_workbook_with(XlsxReader, filepath, sheet_names, known_hashes)
+    except XlsxReadError as e:
+        print(f"Lecture directe impossible pour {os.path.basename(filepath)} ({e}), lecture avec openpyxl")
+        return read_workbook_with(OpenpyxlReader, filepath, sheet_names, known_hashes)
+
+
+def read_workbook_with(reader_class, filepath, sheet_names=None, known_hashes=None):
+    started = time.perf_counter()
+    known_hashes = known_hashes or {}
+    sheets = []
+    try:
+        digest = file_hash(filepath)
+        reader = reader_class(filepath)
+        try:
+            sheetnames = reader.sheetnames
+            hashes = reader.content_hashes()
+            for sheet_name in sheetnames:
+                if sheet_names is not None and sheet_name not in sheet_names:
+                    continue
+                sheet_hash = hashes.get(sheet_name, '')
+                if sheet_hash and known_hashes.get(sheet_name) == sheet_hash:
+                    continue
+                spool = RowSpool()
+                try:
+                    sheet = scan_sheet(sheet_name, reader.iter_rows(sheet_name), spool)
+                finally:
+                    spool.close()
+                    sheets.append({"name": sheet_name, "spool": spool.path, "hash": sheet_hash})
+                sheets[-1].update(sheet)
+        finally:
+            reader.close()
+    except BaseException:
+        discard_workbook({"sheets": sheets})
+        raise
+
+    return {
+        "sheetnames": sheetnames,
+        "sheets": sheets,
+        "file_hash": digest,
+        "hashes": hashes,
+        "read_ms": round((time.perf_counter() - started) * 1000, 1),
+        "reader": 'openpyxl' if reader_class is OpenpyxlReader else 'xlsx'
+    }
+
+
+def discard_workbook(workbook):
+    """Supprimer les fichiers temporaires d'un classeur lu par read_workbook"""
+    for sheet in workbook.get("sheets", []):
+        discard_spool(sheet.get("spool"))
@@ -0,0 +1,367 @@
+"""
+Recherche, filtres et tri des lignes d'une feuille exécutés en base de données
+
+Les paramètres de get_sheet_data sont traduits en requête SQL sur le JSON des
+lignes (SheetRow.values), en s'appuyant sur le data_type de chaque colonne
+déterminé par analyze_column_data_type (columns_info).
+
+    ?q=texte                         recherche dans toutes les colonnes
+    ?sort=Tonnage&order=desc         tri sur une colonne
+    ?filter[Navires]=X               égalité (insensible à la casse pour le texte)
+    ?filter[Tonnage][gte]=1000       opérateurs: eq, ne, contains, gt, gte, lt, lte
+    ?fields=Navires,Tonnage          seulement ces colonnes (projection faite en SQL)
+
+Sur une colonne de type nombre, filtres et tri portent sur la valeur numérique de la
+cellule (JsonNumber) : nombre JSON ou texte numérique ("123", "1 250,5"), comme
+sheet_aggregates.to_number ; les cellules vides ou non numériques ne satisfont aucune
+comparaison et sont triées en dernier.
+
+Sur une colonne indexée (voir sheet_indexes), les filtres d'égalité et
+d'intervalle sont servis par l'index au lieu du JSON des lignes.
+"""
+import json
+import re
+from datetime import datetime
+
+from django.db.models import Case, F, FloatField, Func, IntegerField, JSONField, Q, TextField, Value, When
+from django.db.models.functions import Lower
+
+from .models import SheetRow
+
+FILTER_PARAM = re.compile(r'^filter\[(?P<column>.+?)\](?:\[(?P<operator>[a-z]+)\])?$')
+
+FILTER_OPERATORS = ['eq', 'ne', 'contains', 'gt', 'gte', 'lt', 'lte']
+
+# Nombre de colonnes par appel json_object / jsonb_build_object (limite d'arguments SQL)
+PROJECTION_CHUNK = 50
+
+# Texte numérique d'une cellule, une fois les espaces retirés ("1 250,5" -> 1250.5)
+NUMBER_TEXT_PATTERN = r'^-?[0-9]+([.,][0-9]+)?$'
+
+# Blancs retirés en début et fin de texte avant la conversion en nombre
+NUMBER_TEXT_TRIM = ' \t\n\r'
+
+# Formats de date acceptés dans les filtres (convertis en AAAA-MM-JJ, format du cache)
+DATE_INPUT_FORMATS = ['%Y-%m-%d %H:%M', '%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y']
+
+
+class JsonText(Func):
+    """
+    Valeur d'une clé du JSON des lignes, en texte (NULL si la clé est absente ou vaut null).
+    KeyTextTransform renvoie 'null' sous SQLite pour une valeur JSON null, d'où cette fonction.
+    """
+    output_field = TextField()
+
+    def __init__(self, key, field='values'):
+        self.key = key
+        super().__init__(F(field))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        lhs, params = compiler.compile(self.source_expressions[0])
+        return f"JSON_EXTRACT({lhs}, %s)", [*params, '$.' + json.dumps(self.key)]
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        lhs, params = compiler.compile(self.source_expressions[0])
+        return f"({lhs} ->> %s)", [*params, self.key]
+
+
+class JsonNumber(Func):
+    """
+    Valeur numérique d'une clé du JSON des lignes (mêmes règles que sheet_aggregates.to_number) :
+    nombre JSON, ou texte numérique converti ; NULL si vide, null, booléen ou non numérique.
+    """
+    output_field = FloatField()
+
+    def __init__(self, key, field='values'):
+        self.key = key
+        super().__init__(F(field))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        lhs, lhs_params = compiler.compile(self.source_expressions[0])
+        path = '$.' + json.dumps(self.key)
+        text = f"REPLACE(TRIM(JSON_EXTRACT({lhs}, %s), %s), ' ', '')"
+        sql = (
+            f"CASE WHEN JSON_TYPE({lhs}, %s) IN ('integer', 'real') THEN JSON_EXTRACT({lhs}, %s) "
+            f"WHEN JSON_TYPE({lhs}, %s) = 'text' AND {text} REGEXP %s "
+            f"THEN CAST(REPLACE({text}, ',', '.') AS REAL) END"
+        )
+        params = [
+            *lhs_params, path, *lhs_params, path,
+            *lhs_params, path, *lhs_params, path, NUMBER_TEXT_TRIM, NUMBER_TEXT_PATTERN,
+            *lhs_params, path, NUMBER_TEXT_TRIM,
+        ]
+        return sql, params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        lhs, lhs_params = compiler.compile(self.source_expressions[0])
+        text = f"replace(btrim(({lhs} ->> %s), %s), ' ', '')"
+        sql = (
+            f"CASE WHEN jsonb_typeof({lhs} -> %s) = 'number' THEN ({lhs} ->> %s)::double precision "
+            f"WHEN jsonb_typeof({lhs} -> %s) = 'string' AND {text} ~ %s "
+            f"THEN replace({text}, ',', '.')::double precision END"
+        )
+        params = [
+            *lhs_params, self.key, *lhs_params, self.key,
+            *lhs_params, self.key, *lhs_params, self.key, NUMBER_TEXT_TRIM, NUMBER_TEXT_PATTERN,
+            *lhs_params, self.key, NUMBER_TEXT_TRIM,
+        ]
+        return sql, params
+
+
+class JsonProject(Func):
+    """
+    Objet JSON réduit aux clés demandées, construit par la base de données
+    (seules ces colonnes sont transférées et décodées).
+    """
+    output_field = JSONField()
+
+    def __init__(self, keys, field='values'):
+        self.keys = list(keys)
+        super().__init__(F(field))
+
+    def chunks(self):
+        for start in range(0, len(self.keys), PROJECTION_CHUNK):
+            yield self.keys[start:start + PROJECTION_CHUNK]
+
+    def as_sql(self, compiler, connection, **extra_context):
+        lhs, lhs_params = compiler.compile(self.source_expressions[0])
+        sql, params = "JSON_OBJECT()", []
+        for keys in self.chunks():
+            # JSON_SET (et non JSON_PATCH) pour conserver les valeurs null
+            sql = f"JSON_SET({sql}, " + ", ".join([f"%s, JSON_EXTRACT({lhs}, %s)"] * len(keys)) + ")"
+            for key in keys:
+                path = '$.' + json.dumps(key)
+                params.extend([path, *lhs_params, path])
+        return sql, params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        lhs, lhs_params = compiler.compile(self.source_expressions[0])
+        parts, params = [], []
+        for keys in self.chunks():
+            parts.append("jsonb_build_object(" + ", ".join([f"%s::text, ({lhs} -> %s)"] * len(keys)) + ")")
+            for key in keys:
+                params.extend([key, *lhs_params, key])
+        return "(" + " || ".join(parts) + ")", params
+
+
+def split_params(values, headers):
+    """Accepter les paramètres répétés ou séparés par des virgules"""
+    items = []
+    for value in values:
+        if value in headers or ',' not in value:
+            items.append(value.strip())
+        else:
+            items.extend(item.strip() for item in value.split(',') if item.strip())
+    return items
+
+
+def parse_fields(query_params, headers):
+    """Colonnes demandées par ?fields= (dans l'ordre des en-têtes), None = toutes"""
+    values = query_params.getlist('fields')
+    if not values:
+        return None
+
+    requested = split_params(values, headers)
+    unknown = [field for field in requested if field not in headers]
+    if unknown:
+        raise ValueError(f"Colonne(s) inconnue(s) dans 'fields': {', '.join(unknown)}")
+    return [header for header in headers if header in requested]
+
+
+def get_column_types(sheet_cache):
+    """Associer chaque colonne à son data_type ('number', 'date', 'text', ...)"""
+    types = {}
+    for column in sheet_cache.columns_info or []:
+        if isinstance(column, dict) and column.get('name'):
+            types[column['name']] = column.get('data_type', 'any')
+    return types
+
+
+def parse_number(value):
+    """Convertir une valeur de filtre en nombre (virgule acceptée comme séparateur)"""
+    try:
+        return float(str(value).replace(' ', '').replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"Valeur numérique invalide: {value}")
+
+
+def parse_date(value):
+    """Convertir une valeur de filtre en date texte AAAA-MM-JJ[ HH:MM] comparable au cache"""
+    value = str(value).strip()
+    for date_format in DATE_INPUT_FORMATS:
+        try:
+            parsed = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        if '%H' in date_format:
+            return parsed.strftime("%Y-%m-%d %H:%M"), True
+        return parsed.strftime("%Y-%m-%d"), False
+    raise ValueError(f"Date invalide: {value}")
+
+
+def parse_filters(query_params, headers):
+    """Extraire les filtres filter[colonne][opérateur]=valeur des paramètres de la requête"""
+    filters = []
+    for key in query_params.keys():
+        match = FILTER_PARAM.match(key)
+        if not match:
+            continue
+
+        column = match.group('column')
+        operator = match.group('operator') or 'eq'
+        if column not in headers:
+            raise ValueError(f"Colonne inconnue: {column}")
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Opérateur inconnu: {operator}")
+
+        for value in query_params.getlist(key):
+            filters.append((column, operator, value))
+    return filters
+
+
+def parse_filter_object(filter_object, headers):
+    """
+    Filtres exprimés en JSON (opérations en lot), mêmes colonnes et opérateurs que filter[...] :
+    {"Navires": "X", "Tonnage": {"gte": 1000, "lt": 5000}}
+    """
+    if not isinstance(filter_object, dict):
+        raise ValueError("Le filtre doit être un objet {colonne: valeur ou {opérateur: valeur}}")
+
+    filters = []
+    for column, condition in filter_object.items():
+        if column not in headers:
+            raise ValueError(f"Colonne inconnue: {column}")
+        conditions = condition.items() if isinstance(condition, dict) else [('eq', condition)]
+        for operator, value in conditions:
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Opérateur inconnu: {operator}")
+            if value is None or isinstance(value, (dict, list)):
+                raise ValueError(f"Valeur de filtre invalide pour {column}")
+            filters.append((column, operator, str(value)))
+    return filters
+
+
+def filter_condition(alias, data_type, operator, value):
+    """Construire la condition Q d'un filtre selon le type de la colonne"""
+    if operator == 'contains':
+        return Q(**{f'{alias}_text__icontains': value})
+
+    if data_type == 'number':
+        # Comparaison numérique ; une cellule vide ou non numérique (NULL) ne satisfait que 'ne'
+        number = parse_number(value)
+        if operator == 'ne':
+            return ~Q(**{f'{alias}_number': number}) | Q(**{f'{alias}_number__isnull': True})
+        lookup = 'exact' if operator == 'eq' else operator
+        return Q(**{f'{alias}_number__{lookup}': number})
+
+    if data_type == 'date':
+        # Les dates sont stockées en texte "AAAA-MM-JJ HH:MM" : l'ordre texte est chronologique
+        date_value, has_time = parse_date(value)
+        if operator in ('eq', 'ne'):
+            lookup = 'exact' if has_time else 'startswith'
+            condition = Q(**{f'{alias}_text__{lookup}': date_value})
+            return ~condition if operator == 'ne' else condition
+        if operator in ('lte', 'gt') and not has_time:
+            # Inclure toute la journée pour une borne sans heure
+            date_value = f"{date_value} 23:59"
+        return Q(**{f'{alias}_text__{operator}': date_value}) & ~Q(**{f'{alias}_text': ''})
+
+    # Texte : égalité insensible à la casse, comparaisons alphabétiques (cellules vides exclues)
+    if operator in ('eq', 'ne'):
+        condition = Q(**{f'{alias}_text__iexact': value})
+        return ~condition if operator == 'ne' else condition
+    return Q(**{f'{alias}_text__{operator}': value}) & ~Q(**{f'{alias}_text': ''})
+
+
+def apply_search(queryset, headers, search):
+    """Recherche insensible à la casse dans toutes les colonnes"""
+    search = search.strip()
+    if not search or not headers:
+        return queryset
+
+    condition = Q()
+    annotations = {}
+    for index, header in enumerate(headers):
+        alias = f'_q{index}'
+        annotations[alias] = JsonText(header)
+        condition |= Q(**{f'{alias}__icontains': search})
+    return queryset.annotate(**annotations).filter(condition)
+
+
+def apply_filters(queryset, filters, column_types, sheet_cache=None, indexed=None):
+    """Appliquer les filtres par colonne (combinés par ET), par l'index de la colonne si possible"""
+    from .sheet_indexes import index_condition
+    
+    indexed = indexed or {}
+    for index, (column, operator, value) in enumerate(filters):
+        if column in indexed:
+            condition = index_condition(sheet_cache, column, indexed[column], operator, value)
+            if condition is not None:
+                queryset = queryset.filter(condition)
+                continue
+        
+        alias = f'_f{index}'
+        data_type = column_types.get(column, 'any')
+        annotations = {f'{alias}_text': JsonText(column)}
+        if data_type == 'number':
+            annotations[f'{alias}_number'] = JsonNumber(column)
+        queryset = queryset.annotate(**annotations)
+        queryset = queryset.filter(filter_condition(alias, data_type, operator, value))
+    return queryset
+
+
+def sort_expression(column, data_type):
+    """Expression de tri adaptée au type de la colonne"""
+    if data_type == 'number':
+        # Valeur numérique (nombres et textes numériques mêlés) : tri numérique
+        return JsonNumber(column)
+    if data_type == 'date':
+        return JsonText(column)
+    return Lower(JsonText(column))
+
+
+def apply_sort(queryset, column, data_type, order):
+    """Trier sur une colonne, les cellules vides (non numériques pour un nombre) toujours en dernier"""
+    if data_type == 'number':
+        queryset = queryset.annotate(_sort_number=JsonNumber(column))
+        empty = Q(_sort_number__isnull=True)
+    else:
+        queryset = queryset.annotate(_sort_text=JsonText(column))
+        empty = Q(_sort_text__isnull=True) | Q(_sort_text='')
+    queryset = queryset.annotate(
+        _sort_empty=Case(When(empty, then=Value(1)), default=Value(0), output_field=IntegerField())
+    )
+
+    expression = sort_expression(column, data_type)
+    if order == 'desc':
+        return queryset.order_by('_sort_empty', expression.desc(), '-row_id')
+    return queryset.order_by('_sort_empty', expression.asc(), 'row_id')
+
+
+def build_rows_queryset(sheet_cache, headers, query_params):
+    """
+    Construire la requête des lignes à partir de q / sort / order / filter[...].
+    Retourne (queryset, trié par colonne ?, filtré ?). Lève ValueError si un paramètre est invalide.
+    """
+    from .sheet_indexes import get_indexed_columns
+
+    queryset = SheetRow.objects.filter(sheet=sheet_cache)
+    column_types = get_column_types(sheet_cache)
+
+    search = query_params.get('q', '')
+    filters = parse_filters(query_params, headers)
+    queryset = apply_search(queryset, headers, search)
+    queryset = apply_filters(queryset, filters, column_types, sheet_cache, get_indexed_columns(sheet_cache))
+
+    sort_column = query_params.get('sort')
+    order = query_params.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"Ordre de tri invalide: {order}")
+
+    if sort_column:
+        if sort_column not in headers:
+            raise ValueError(f"Colonne de tri inconnue: {sort_column}")
+        queryset = apply_sort(queryset, sort_column, column_types.get(sort_column, 'any'), order)
+
+    is_filtered = bool(search.strip()) or bool(filters)
+    return queryset, bool(sort_column), is_filtered
@@ -0,0 +1,237 @@
+"""
+Agrégats pré-calculés des feuilles (modèle SheetRollup) pour le tableau de bord
+
+- par mois de la colonne date principale : nombre de lignes et somme des colonnes numériques
+  résumées (DASHBOARD_DATE_COLUMNS / DASHBOARD_MEASURES, sinon la première colonne date et
+  les DASHBOARD_MAX_MEASURES premières colonnes numériques de la feuille)
+- par catégorie de chaque colonne texte (data_type 'text_only' : navires, clients...) : nombre de lignes
+
+Croiser toutes les dates avec tous les nombres donnait des milliers d'agrégats par feuille
+et des centaines de requêtes par entrée modifiée. Une modification d'entrée applique
+seulement la différence entre l'ancienne et la nouvelle ligne, en quelques requêtes
+groupées (lecture, UPDATE ... CASE, INSERT, DELETE), indépendamment du nombre d'agrégats.
+La ré-ingestion d'un fichier (sync_all_files_cache) recalcule tout en une passe.
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import SheetDataCache, SheetRollup
+from .sheet_aggregates import group_key, to_number
+from .sheet_queries import get_column_types
+
+# Taille des lots pour les insertions en masse
+BULK_BATCH_SIZE = 500
+
+# Nombre de colonnes numériques sommées par mois si aucune n'est déclarée
+DEFAULT_MAX_MEASURES = 3
+
+
+def declared_or_first(columns, declared, limit):
+    """Colonnes déclarées présentes dans la feuille (dans l'ordre déclaré), sinon les `limit` premières"""
+    present = [column for column in declared if column in columns]
+    return present[:limit] if present else columns[:limit]
+
+
+def rollup_columns(sheet_cache):
+    """Colonnes agrégées d'une feuille : (date principale (0 ou 1), nombres sommés, catégories)"""
+    column_types = get_column_types(sheet_cache)
+    dates = [column for column, data_type in column_types.items() if data_type == 'date']
+    numbers = [column for column, data_type in column_types.items() if data_type == 'number']
+    categories = [column for column, data_type in column_types.items() if data_type == 'text_only']
+    dates = declared_or_first(dates, getattr(settings, 'DASHBOARD_DATE_COLUMNS', []), 1)
+    numbers = declared_or_first(
+        numbers,
+        getattr(settings, 'DASHBOARD_MEASURES', []),
+        getattr(settings, 'DASHBOARD_MAX_MEASURES', DEFAULT_MAX_MEASURES)
+    )
+    return dates, numbers, categories
+
+
+def row_contributions(values, columns):
+    """
+    Contribution d'une ligne aux agrégats :
+    {(kind, dimension, bucket, measure): (nombre de lignes, somme)}
+    """
+    contributions = {}
+    if not values:
+        return contributions
+
+    dates, numbers, categories = columns
+    for column in dates:
+        month = group_key(values.get(column), 'month')
+        if month is None:
+            continue
+        month = month[:255]
+        contributions[(SheetRollup.KIND_MONTH, column, month, '')] = (1, 0.0)
+        for measure in numbers:
+            number = to_number(values.get(measure))
+            if not math.isnan(number):
+                contributions[(SheetRollup.KIND_MONTH, column, month, measure)] = (1, number)
+
+    for column in categories:
+        category = group_key(values.get(column), None)
+        if category is not None:
+            contributions[(SheetRollup.KIND_CATEGORY, column, category[:255], '')] = (1, 0.0)
+
+    return contributions
+
+
+def touch_sheet(sheet_cache):
+    """Marquer les agrégats de la feuille comme à jour (horodatage de fraîcheur)"""
+    now = timezone.now()
+    SheetDataCache.objects.filter(pk=sheet_cache.pk).update(rollups_updated_at=now)
+    sheet_cache.rollups_updated_at = now
+
+
+def rebuild_sheet_rollups(sheet_cache, rows_values=None):
+    """
+    Recalculer tous les agrégats d'une feuille en une passe.
+    rows_values : valeurs des lignes déjà en mémoire (sinon relues en base)
+    """
+    if rows_values is None:
+        rows_values = sheet_cache.rows.values_list('values', flat=True).iterator(chunk_size=BULK_BATCH_SIZE)
+
+    columns = rollup_columns(sheet_cache)
+    totals = defaultdict(lambda: [0, 0.0])
+    for values in rows_values:
+        for key, (count, total) in row_contributions(values, columns).items():
+            state = totals[key]
+            state[0] += count
+            state[1] += total
+
+    rollups = [
+        SheetRollup(
+            sheet=sheet_cache,
+            kind=kind,
+            dimension=dimension,
+            bucket=bucket,
+            measure=measure,
+            count=count,
+            total=total
+        )
+        for (kind, dimension, bucket, measure), (count, total) in totals.items()
+    ]
+
+    with transaction.atomic():
+        SheetRollup.objects.filter(sheet=sheet_cache).delete()
+        SheetRollup.objects.bulk_create(rollups, batch_size=BULK_BATCH_SIZE)
+        touch_sheet(sheet_cache)
+    return len(rollups)
+
+
+def add_to_rollups(sheet_cache, deltas):
+    """
+    Ajouter (ou retirer) des contributions aux agrégats : deltas = {clé: (lignes, somme)}.
+    Les agrégats existants sont lus en une requête puis écrits en un UPDATE ... CASE par lot ;
+    les nouveaux sont créés en une insertion, ceux qui n'ont plus de ligne supprimés.
+    À appeler sous le verrou de la feuille (deux modifications ne lisent pas le même état).
+    """
+    existing = {
+        (rollup.kind, rollup.dimension, rollup.bucket, rollup.measure): rollup
+        for rollup in SheetRollup.objects.filter(
+            sheet=sheet_cache, dimension__in={dimension for _, dimension, _, _ in deltas}
+        )
+    }
+
+    now = timezone.now()
+    updated, created, emptied = [], [], []
+    for key, (count, total) in deltas.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            if count > 0:
+                kind, dimension, bucket, measure = key
+                created.append(SheetRollup(
+                    sheet=sheet_cache, kind=kind, dimension=dimension, bucket=bucket,
+                    measure=measure, count=count, total=total
+                ))
+            continue
+        rollup.count += count
+        rollup.total += total
+        rollup.updated_at = now
+        (updated if rollup.count > 0 else emptied).append(rollup)
+
+    if updated:
+        SheetRollup.objects.bulk_update(updated, ['count', 'total', 'updated_at'], batch_size=BULK_BATCH_SIZE)
+    if created:
+        SheetRollup.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+    if emptied:
+        SheetRollup.objects.filter(pk__in=[rollup.pk for rollup in emptied]).delete()
+
+
+def apply_row_change(sheet_cache, old_values, new_values):
+    """
+    Mettre à jour les agrégats après l'ajout (old_values=None), la modification
+    ou la suppression (new_values=None) d'une ligne.
+    """
+    apply_row_changes(sheet_cache, [(old_values, new_values)])
+
+
+def apply_row_changes(sheet_cache, changes):
+    """
+    Comme apply_row_change pour plusieurs lignes : changes = [(anciennes valeurs, nouvelles valeurs)].
+    Les différences sont cumulées par agrégat avant d'être écrites ensemble (add_to_rollups).
+    """
+    if sheet_cache.rollups_updated_at is None:
+        # Agrégats jamais calculés pour cette feuille : ils le seront en une fois à la lecture
+        return
+
+    columns = rollup_columns(sheet_cache)
+    deltas = defaultdict(lambda: [0, 0.0])
+    for old_values, new_values in changes:
+        for key, (count, total) in row_contributions(old_values, columns).items():
+            deltas[key][0] -= count
+            deltas[key][1] -= total
+        for key, (count, total) in row_contributions(new_values, columns).items():
+            deltas[key][0] += count
+            deltas[key][1] += total
+
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] != 0 or delta[1] != 0}
+    with transaction.atomic():
+        if deltas:
+            list(SheetDataCache.objects.select_for_update().filter(pk=sheet_cache.pk).values_list('pk', flat=True))
+            add_to_rollups(sheet_cache, deltas)
+        touch_sheet(sheet_cache)
+
+
+def ensure_rollups(sheets):
+    """Calculer les agrégats des feuilles qui n'en ont pas encore (données antérieures)"""
+    for sheet_cache in sheets:
+        if sheet_cache.rollups_updated_at is None:
+            rebuild_sheet_rollups(sheet_cache)
+
+
+def sheet_summary(sheet_cache, rollups, top_categories=10):
+    """Résumé d'une feuille pour le tableau de bord, à partir de ses agrégats uniquement"""
+    months = {}
+    categories = defaultdict(list)
+
+    for rollup in rollups:
+        if rollup.kind == SheetRollup.KIND_MONTH:
+            month = months.setdefault((rollup.dimension, rollup.bucket), {
+                "column": rollup.dimension,
+                "month": rollup.bucket,
+                "rows": 0,
+                "sums": {}
+            })
+            if rollup.measure:
+                month["sums"][rollup.measure] = round(rollup.total, 6)
+            else:
+                month["rows"] = rollup.count
+        else:
+            categories[rollup.dimension].append({"value": rollup.bucket, "rows": rollup.count})
+
+    for column, values in categories.items():
+        values.sort(key=lambda item: (-item["rows"], item["value"]))
+        categories[column] = values[:top_categories]
+
+    return {
+        "sheet_name": sheet_cache.sheet_name,
+        "rows": sheet_cache.rows_count,
+        "months": sorted(months.values(), key=lambda item: (item["column"], item["month"])),
+        "categories": dict(categories),
+        "updated_at": sheet_cache.rollups_updated_at.isoformat() if sheet_cache.rollups_updated_at else None
+    }
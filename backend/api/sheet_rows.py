@@ -0,0 +1,361 @@
+"""
+Stockage ligne par ligne des données des feuilles (modèle SheetRow)
+
+Chaque ajout / modification / suppression d'entrée ne touche qu'une seule
+ligne SQL au lieu de relire et réécrire tout le JSON de la feuille.
+"""
+import json
+
+from django.db import transaction
+from django.db.models import F, Max
+
+from .models import FileCache, SheetDataCache, SheetRow
+from .etags import bump_sheet_version
+from .sheet_changes import record_change, record_changes, reset_changes
+from .search_index import index_rows, unindex_rows
+from .sheet_queries import JsonProject
+from .sheet_rollups import apply_row_change, apply_row_changes, rebuild_sheet_rollups
+from .sheet_indexes import rebuild_sheet_indexes, reindex_row, reindex_rows
+
+# Taille des lots pour les insertions en masse
+BULK_BATCH_SIZE = 500
+
+# Nombre maximum de lignes par page (pagination par curseur)
+MAX_PAGE_SIZE = 1000
+
+
+def row_to_dict(row_id, values):
+    """Reconstituer une entrée telle que renvoyée par l'API (avec _row_id)"""
+    entry = {"_row_id": row_id}
+    entry.update(values)
+    return entry
+
+
+def parse_row_id(value):
+    """Convertir un _row_id reçu (int, float entier ou str) en entier, None si invalide"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        value = value.strip()
+        if value.endswith('.0'):
+            value = value[:-2]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_rows(sheet_cache, data):
+    """Construire les objets SheetRow (non sauvegardés) à partir d'entrées (liste ou itérable)"""
+    used_ids = set()
+    max_id = 1
+
+    for position, entry in enumerate(data):
+        if not isinstance(entry, dict):
+            continue
+        values = dict(entry)
+        row_id = parse_row_id(values.pop('_row_id', None))
+
+        # Les anciens ajouts en base pouvaient produire des doublons (len(data) + 2)
+        if row_id is None or row_id < 2 or row_id in used_ids:
+            row_id = max(max_id, position + 2)
+            while row_id in used_ids:
+                row_id += 1
+
+        used_ids.add(row_id)
+        max_id = max(max_id, row_id + 1)
+        yield SheetRow(sheet=sheet_cache, row_id=row_id, position=position, values=values)
+
+
+def replace_sheet_rows(sheet_cache, data):
+    """
+    Remplacer toutes les lignes d'une feuille (ré-ingestion complète du fichier).
+    data : entrées en liste ou en itérable lu au fur et à mesure ; elles sont insérées par
+    lots de BULK_BATCH_SIZE, sans jamais être toutes en mémoire.
+    """
+    count = 0
+    with transaction.atomic():
+        old_rows = SheetRow.objects.filter(sheet=sheet_cache)
+        unindex_rows(old_rows.values_list('pk', flat=True))
+        old_rows.delete()
+
+        pending = []
+        for row in build_rows(sheet_cache, data):
+            pending.append(row)
+            if len(pending) >= BULK_BATCH_SIZE:
+                count += insert_rows_batch(sheet_cache, pending)
+                pending = []
+        if pending:
+            count += insert_rows_batch(sheet_cache, pending)
+
+        # Index et agrégats recalculés en relisant les lignes par lots
+        rebuild_sheet_indexes(sheet_cache)
+        rebuild_sheet_rollups(sheet_cache)
+        bump_sheet_version(sheet_cache)
+        reset_changes(sheet_cache)
+        # Les _row_id (numéros de ligne du fichier) ont pu changer : copies des clients périmées
+        SheetDataCache.objects.filter(pk=sheet_cache.pk).update(rows_renumbered_version=sheet_cache.version)
+        sheet_cache.rows_renumbered_version = sheet_cache.version
+    return count
+
+
+def insert_rows_batch(sheet_cache, rows):
+    """Insérer un lot de lignes neuves et les indexer pour la recherche"""
+    rows = SheetRow.objects.bulk_create(rows)
+    if rows[0].pk is None:
+        # Base sans RETURNING sur les insertions en masse : relire les ids
+        saved_rows = list(SheetRow.objects.filter(
+            sheet=sheet_cache, row_id__in=[row.row_id for row in rows]
+        ).values_list('pk', 'values'))
+    else:
+        saved_rows = [(row.pk, row.values) for row in rows]
+    index_rows(saved_rows)
+    return len(rows)
+
+
+def absorb_legacy_data(sheet_cache):
+    """Découper l'ancien blob `data` (import data_export.json) en lignes SheetRow"""
+    data = sheet_cache.data
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            data = []
+    if not isinstance(data, list) or not data:
+        return 0
+
+    with transaction.atomic():
+        count = replace_sheet_rows(sheet_cache, data)
+        SheetDataCache.objects.filter(pk=sheet_cache.pk).update(data=[], rows_count=count)
+
+    sheet_cache.data = []
+    sheet_cache.rows_count = count
+    return count
+
+
+def row_values(queryset, fields=None):
+    """(row_id, valeurs) des lignes, réduites en base aux colonnes `fields` si demandé"""
+    if fields is None:
+        return queryset.values_list('row_id', 'values')
+    return queryset.annotate(_projected=JsonProject(fields)).values_list('row_id', '_projected')
+
+
+def iter_sheet_rows(sheet_cache, queryset=None, fields=None, chunk_size=BULK_BATCH_SIZE):
+    """
+    Parcourir toutes les lignes d'une feuille (ou d'une requête filtrée) dans l'ordre d'affichage,
+    lues par lots depuis la base sans jamais les charger toutes en mémoire
+    """
+    if queryset is None:
+        queryset = SheetRow.objects.filter(sheet=sheet_cache)
+    if not queryset.query.order_by:
+        queryset = queryset.order_by('position')
+    for row_id, values in row_values(queryset, fields).iterator(chunk_size=chunk_size):
+        yield row_to_dict(row_id, values)
+
+
+def load_sheet_rows_page(sheet_cache, limit, after=None, queryset=None, fields=None):
+    """
+    Charger une page de lignes par curseur (keyset) sur _row_id.
+    Retourne (lignes, curseur suivant ou None s'il n'y a plus de lignes).
+    """
+    if queryset is None:
+        queryset = SheetRow.objects.filter(sheet=sheet_cache)
+    if after is not None:
+        queryset = queryset.filter(row_id__gt=after)
+
+    # Une ligne de plus pour savoir s'il reste une page suivante
+    rows = list(row_values(queryset.order_by('row_id'), fields)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    data = [row_to_dict(row_id, values) for row_id, values in rows]
+    next_after = rows[-1][0] if has_more and rows else None
+    return data, next_after
+
+
+def load_sheet_rows_offset(queryset, limit, offset=0, fields=None):
+    """
+    Charger une page de lignes d'une requête triée par colonne (pagination par décalage).
+    Retourne (lignes, décalage suivant ou None s'il n'y a plus de lignes).
+    """
+    rows = list(row_values(queryset, fields)[offset:offset + limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    data = [row_to_dict(row_id, values) for row_id, values in rows]
+    return data, offset + limit if has_more else None
+
+
+def insert_sheet_row(sheet_cache, values):
+    """Ajouter une ligne en fin de feuille (un seul INSERT)"""
+    values = {key: value for key, value in values.items() if key != '_row_id'}
+
+    with transaction.atomic():
+        # Verrouiller la feuille pour attribuer un _row_id unique en cas d'ajouts simultanés
+        list(SheetDataCache.objects.select_for_update().filter(pk=sheet_cache.pk).values_list('pk', flat=True))
+
+        bounds = SheetRow.objects.filter(sheet=sheet_cache).aggregate(
+            max_id=Max('row_id'),
+            max_position=Max('position')
+        )
+        row_id = (bounds['max_id'] or 1) + 1  # ligne 1 = en-têtes
+        position = bounds['max_position'] + 1 if bounds['max_position'] is not None else 0
+
+        row = SheetRow.objects.create(sheet=sheet_cache, row_id=row_id, position=position, values=values)
+        SheetDataCache.objects.filter(pk=sheet_cache.pk).update(rows_count=F('rows_count') + 1)
+        index_rows([(row.pk, row.values)])
+        reindex_row(sheet_cache, row)
+        apply_row_change(sheet_cache, None, row.values)
+        bump_sheet_version(sheet_cache)
+        record_change(sheet_cache, row.row_id, 'insert')
+
+    return row
+
+
+def insert_sheet_rows(sheet_cache, values_list):
+    """
+    Ajouter plusieurs lignes en fin de feuille en une transaction :
+    insertions en masse, une seule incrémentation de version. Retourne les lignes créées.
+    """
+    values_list = [
+        {key: value for key, value in values.items() if key != '_row_id'}
+        for values in values_list
+    ]
+    if not values_list:
+        return []
+
+    with transaction.atomic():
+        list(SheetDataCache.objects.select_for_update().filter(pk=sheet_cache.pk).values_list('pk', flat=True))
+
+        bounds = SheetRow.objects.filter(sheet=sheet_cache).aggregate(
+            max_id=Max('row_id'),
+            max_position=Max('position')
+        )
+        first_id = (bounds['max_id'] or 1) + 1
+        first_position = bounds['max_position'] + 1 if bounds['max_position'] is not None else 0
+
+        rows = SheetRow.objects.bulk_create([
+            SheetRow(sheet=sheet_cache, row_id=first_id + offset, position=first_position + offset, values=values)
+            for offset, values in enumerate(values_list)
+        ], batch_size=BULK_BATCH_SIZE)
+        if rows[0].pk is None:
+            # Base sans RETURNING sur les insertions en masse : relire les lignes
+            rows = list(SheetRow.objects.filter(sheet=sheet_cache, row_id__gte=first_id).order_by('row_id'))
+
+        SheetDataCache.objects.filter(pk=sheet_cache.pk).update(rows_count=F('rows_count') + len(rows))
+        index_rows([(row.pk, row.values) for row in rows])
+        reindex_rows(sheet_cache, rows)
+        apply_row_changes(sheet_cache, [(None, row.values) for row in rows])
+        bump_sheet_version(sheet_cache)
+        record_changes(sheet_cache, [row.row_id for row in rows], 'insert')
+
+    return rows
+
+
+def update_sheet_row(sheet_cache, row_id, values):
+    """Modifier les champs d'une ligne (un seul UPDATE), None si la ligne n'existe pas"""
+    with transaction.atomic():
+        row = SheetRow.objects.select_for_update().filter(sheet=sheet_cache, row_id=row_id).first()
+        if row is None:
+            return None
+
+        old_values = dict(row.values)
+        for key, value in values.items():
+            if key != '_row_id':
+                row.values[key] = value
+        row.save(update_fields=['values'])
+        index_rows([(row.pk, row.values)])
+        reindex_row(sheet_cache, row)
+        apply_row_change(sheet_cache, old_values, row.values)
+        bump_sheet_version(sheet_cache)
+        record_change(sheet_cache, row.row_id, 'update')
+
+    return row
+
+
+def delete_sheet_row(sheet_cache, row_id):
+    """Supprimer une ligne (un seul DELETE), False si la ligne n'existe pas"""
+    with transaction.atomic():
+        row = SheetRow.objects.select_for_update().filter(sheet=sheet_cache, row_id=row_id).first()
+        if row is None:
+            return False
+
+        unindex_rows([row.pk])
+        row.delete()
+        SheetDataCache.objects.filter(pk=sheet_cache.pk).update(rows_count=F('rows_count') - 1)
+        apply_row_change(sheet_cache, row.values, None)
+        bump_sheet_version(sheet_cache)
+        record_change(sheet_cache, row.row_id, 'delete')
+
+    return True
+
+
+def update_sheet_rows(sheet_cache, queryset, values):
+    """
+    Modifier les mêmes champs de plusieurs lignes en une transaction
+    (mises à jour en masse, une seule incrémentation de version). Retourne les lignes modifiées.
+    """
+    values = {key: value for key, value in values.items() if key != '_row_id'}
+
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().order_by('row_id'))
+        if not rows:
+            return []
+
+        changes = []
+        for row in rows:
+            old_values = dict(row.values)
+            row.values.update(values)
+            changes.append((old_values, row.values))
+        SheetRow.objects.bulk_update(rows, ['values'], batch_size=BULK_BATCH_SIZE)
+
+        index_rows([(row.pk, row.values) for row in rows])
+        reindex_rows(sheet_cache, rows)
+        apply_row_changes(sheet_cache, changes)
+        bump_sheet_version(sheet_cache)
+        record_changes(sheet_cache, [row.row_id for row in rows], 'update')
+
+    return rows
+
+
+def delete_sheet_rows(sheet_cache, queryset):
+    """Supprimer plusieurs lignes en une transaction. Retourne les _row_id supprimés."""
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().order_by('row_id').values_list('pk', 'row_id', 'values'))
+        if not rows:
+            return []
+
+        pks = [pk for pk, _, _ in rows]
+        unindex_rows(pks)
+        for start in range(0, len(pks), BULK_BATCH_SIZE):
+            SheetRow.objects.filter(pk__in=pks[start:start + BULK_BATCH_SIZE]).delete()
+        SheetDataCache.objects.filter(pk=sheet_cache.pk).update(rows_count=F('rows_count') - len(rows))
+        apply_row_changes(sheet_cache, [(values, None) for _, _, values in rows])
+        bump_sheet_version(sheet_cache)
+        record_changes(sheet_cache, [row_id for _, row_id, _ in rows], 'delete')
+
+    return [row_id for _, row_id, _ in rows]
+
+
+def adjust_entry_counts(file_cache, sheet_name, delta, user=None):
+    """
+    Nombres d'entrées du fichier (total_entries) et de la feuille (sheets_details) après
+    l'ajout (delta > 0) ou la suppression (delta < 0) d'entrées, dans la transaction de l'appelant
+    """
+    locked = FileCache.objects.select_for_update().only('sheets_details').get(pk=file_cache.pk)
+    sheets_details = locked.sheets_details or {}
+    if isinstance(sheets_details, str):
+        try:
+            sheets_details = json.loads(sheets_details)
+        except json.JSONDecodeError:
+            sheets_details = {}
+    details = dict(sheets_details.get(sheet_name) or {})
+    details['entries'] = max(0, details.get('entries', 0) + delta)
+    sheets_details = dict(sheets_details, **{sheet_name: details})
+
+    updates = {'total_entries': F('total_entries') + delta, 'sheets_details': sheets_details}
+    if user is not None:
+        updates['last_modified_by'] = user
+    FileCache.objects.filter(pk=file_cache.pk).update(**updates)
@@ -0,0 +1,73 @@
+"""
+Validation côté serveur des entrées d'une feuille (mêmes règles que le formulaire SheetDetail)
+
+- text_only : le champ doit contenir du texte, pas uniquement des chiffres
+- number : le champ ne doit pas contenir de lettres
+- date : YYYY-MM-DD (éventuellement suivi de l'heure), DD/MM/YYYY ou DD-MM-YYYY
+Les champs vides sont toujours acceptés.
+"""
+import re
+
+from .xlsx_append import check_cell_value
+
+NUMERIC_RE = re.compile(r'^-?[0-9]+([.,][0-9]+)?$')
+LETTERS_RE = re.compile(r'[a-zA-ZÀ-ÿ]')
+DATE_RES = (
+    re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}'),    # YYYY-MM-DD (et datetime-local)
+    re.compile(r'^[0-9]{2}/[0-9]{2}/[0-9]{4}$'),   # DD/MM/YYYY
+    re.compile(r'^[0-9]{2}-[0-9]{2}-[0-9]{4}$'),   # DD-MM-YYYY
+)
+
+
+def is_empty(value):
+    return value is None or str(value).strip() == ''
+
+
+def validate_value(value, data_type):
+    """Message d'erreur pour une valeur d'une colonne du type donné, None si elle est valide"""
+    if is_empty(value):
+        return None
+
+    text = str(value).strip()
+    is_numeric = bool(NUMERIC_RE.match(re.sub(r'\s', '', text)))
+    has_letters = bool(LETTERS_RE.search(text))
+
+    if data_type == 'text_only':
+        if is_numeric and not has_letters:
+            return "Ce champ doit contenir du texte (lettres), pas uniquement des chiffres"
+    elif data_type == 'number':
+        if has_letters:
+            return "Ce champ doit contenir un nombre, pas du texte"
+    elif data_type == 'date':
+        if not any(pattern.match(text) for pattern in DATE_RES):
+            return "Ce champ doit contenir une date valide"
+    return None
+
+
+def validate_row(values, headers, column_types, for_file=False, partial=False):
+    """
+    Erreurs d'une entrée : {colonne: message} (vide si l'entrée est valide).
+    for_file : vérifier aussi que les valeurs pourront être écrites dans le fichier Excel.
+    partial : modification de quelques colonnes (des valeurs vides effacent les cellules).
+    """
+    if not isinstance(values, dict):
+        return {"_row": "L'entrée doit être un objet {colonne: valeur}"}
+    if not partial and all(is_empty(value) for key, value in values.items() if key != '_row_id'):
+        return {"_row": "Ligne vide"}
+
+    errors = {}
+    for column, value in values.items():
+        if column == '_row_id':
+            continue
+        if headers and column not in headers:
+            errors[column] = "Colonne inconnue"
+            continue
+        message = validate_value(value, column_types.get(column))
+        if message is None and for_file:
+            try:
+                check_cell_value(value)
+            except ValueError as e:
+                message = str(e)
+        if message:
+            errors[column] = message
+    return errors
@@ -0,0 +1,44 @@
+"""
+Réponses JSON diffusées au fil de l'eau (StreamingHttpResponse)
+
+Pour une feuille complète, les lignes sont lues en base par lots et encodées
+par paquets : la mémoire utilisée reste constante quelle que soit la taille
+de la feuille, au lieu de construire tout le dict puis toute la chaîne JSON.
+"""
+from django.http import StreamingHttpResponse
+
+from .json_renderers import dumps_bytes
+
+# Nombre de lignes encodées par morceau envoyé
+STREAM_CHUNK_ROWS = 200
+
+JSON_CONTENT_TYPE = 'application/json'
+
+
+def iter_json_object(head, rows_key, rows, tail=None):
+    """
+    Produire le JSON {**head, rows_key: [lignes...], **tail()} morceau par morceau (bytes).
+    tail reçoit le nombre de lignes envoyées et renvoie les derniers champs.
+    """
+    prefix = dumps_bytes(head)[:-1]
+    yield prefix + (b',' if head else b'') + dumps_bytes(rows_key) + b':['
+
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(dumps_bytes(row))
+        count += 1
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+            yield (b'' if count == len(chunk) else b',') + b','.join(chunk)
+            chunk = []
+    if chunk:
+        yield (b'' if count == len(chunk) else b',') + b','.join(chunk)
+
+    extra = tail(count) if tail else {}
+    yield b']' + ((b',' + dumps_bytes(extra)[1:]) if extra else b'}')
+
+
+def stream_json_response(head, rows_key, rows, tail=None, status=200):
+    """StreamingHttpResponse JSON contenant la liste `rows` diffusée ligne par ligne"""
+    content = iter_json_object(head, rows_key, rows, tail)
+    return StreamingHttpResponse(content, status=status, content_type=JSON_CONTENT_TYPE)
@@ -1,3 +1,1234 @@
-from django.test import TestCase
+import datetime
+import importlib
+import io
+import json
+import math
+import os
+import re
+import tempfile
+import unittest
+import uuid
+import zipfile
+import zlib
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import quote, urlencode
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from openpyxl.comments import Comment
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .edit_journal import flush_pending_edits, journal_edit
+from . import file_watcher
+from .etags import sheet_etag
+from .ingestion import ingest_workbook, modified_since_cache
+from .json_renderers import HAS_ORJSON, FastJSONParser, FastJSONRenderer, dumps_bytes
+from .middleware import CompressionMiddleware, available_encodings, choose_encoding
+from .models import FileCache, PendingEdit, SheetDataCache, SheetRollup, SheetRow
+from .sheet_formats import HAS_PYARROW
+from .sheet_indexes import get_indexed_columns, set_indexed_columns
+from .sheet_parser import RowSpool, discard_spool, iter_spool, scan_sheet
+from .sheet_queries import build_rows_queryset
+from .sheet_rollups import apply_row_change, rebuild_sheet_rollups
+from .sheet_changes import changes_since
+from .sheet_rows import (
+    delete_sheet_row, delete_sheet_rows, insert_sheet_row, insert_sheet_rows, parse_row_id, replace_sheet_rows,
+    update_sheet_row
+)
+from .streaming import iter_json_object
+from .views import journal_sheet_cache, sync_all_files_cache
+from .xlsx_append import XlsxPatchError, append_rows_to_sheet, rewrite_archive, sheet_part_name
+from .xlsx_reader import XlsxReader
+
+
+def make_file_cache(filename='test.xlsx', **fields):
+    """Fichier en cache sans fichier physique (données importées via l'API)"""
+    fields.setdefault('file_modified', timezone.now())
+    return FileCache.objects.create(filename=filename, name=filename.replace('.xlsx', ''), file_path='', **fields)
+
+
+def make_sheet(rows, column_types, filename='test.xlsx', sheet_name='S'):
+    """Feuille en cache : column_types = {en-tête: data_type}, lignes numérotées à partir de 2"""
+    headers = list(column_types)
+    file_cache = make_file_cache(
+        filename, sheets_count=1, sheets_json=[sheet_name], total_entries=len(rows),
+        sheets_details={sheet_name: {'columns': len(headers), 'entries': len(rows)}}
+    )
+    sheet = SheetDataCache.objects.create(
+        file_cache=file_cache, sheet_name=sheet_name, headers=headers, rows_count=len(rows),
+        columns_info=[
+            {'index': index, 'name': header, 'data_type': data_type}
+            for index, (header, data_type) in enumerate(column_types.items(), start=1)
+        ]
+    )
+    replace_sheet_rows(sheet, [dict(values, _row_id=row_id) for row_id, values in enumerate(rows, start=2)])
+    return file_cache, sheet
+
+
+def api_client():
+    user, _ = User.objects.get_or_create(username='tests')
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+class SplitSheetBlobsTests(TestCase):
+    """Migration 0007 : découpage de l'ancien JSON `data` en lignes SheetRow"""
+
+    def split(self, data):
+        migration = importlib.import_module('api.migrations.0007_sheetrow')
+        file_cache = make_file_cache(f'legacy{FileCache.objects.count()}.xlsx')
+        sheet = SheetDataCache.objects.create(file_cache=file_cache, sheet_name='S', data=data)
+        migration.split_sheet_blobs(apps, None)
+        sheet.refresh_from_db()
+        return sheet, list(SheetRow.objects.filter(sheet=sheet).order_by('position').values_list('row_id', 'values'))
+
+    def test_row_ids_are_kept(self):
+        sheet, rows = self.split([{'_row_id': 2, 'A': 'x'}, {'_row_id': 5, 'A': 'y'}])
+        self.assertEqual(rows, [(2, {'A': 'x'}), (5, {'A': 'y'})])
+        self.assertEqual(sheet.data, [])
+        self.assertEqual(sheet.rows_count, 2)
+
+    def test_legacy_row_ids_are_parsed(self):
+        _, rows = self.split([{'_row_id': '3.0', 'A': 'x'}, {'_row_id': 4.0, 'A': 'y'}, {'_row_id': ' 6 ', 'A': 'z'}])
+        self.assertEqual([row_id for row_id, _ in rows], [3, 4, 6])
+
+    def test_missing_invalid_or_header_row_ids_are_renumbered(self):
+        _, rows = self.split([
+            {'A': 'no id'},
+            {'_row_id': 'abc', 'A': 'invalid'},
+            {'_row_id': 1, 'A': 'header row'},
+            {'_row_id': 0, 'A': 'zero'},
+            {'_row_id': 2.5, 'A': 'fraction'},
+        ])
+        row_ids = [row_id for row_id, _ in rows]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(len(set(row_ids)), 5)
+        self.assertTrue(all(row_id >= 2 for row_id in row_ids))
+        self.assertEqual([values['A'] for _, values in rows], ['no id', 'invalid', 'header row', 'zero', 'fraction'])
+
+    def test_duplicate_row_ids_are_renumbered(self):
+        _, rows = self.split([{'_row_id': 2}, {'_row_id': 2}, {'_row_id': 3}])
+        self.assertEqual(len({row_id for row_id, _ in rows}), 3)
+
+    def test_invalid_blobs_are_skipped(self):
+        _, rows = self.split('not json')
+        self.assertEqual(rows, [])
+        _, rows = self.split([None, 'text', {'_row_id': 2, 'A': 'x'}])
+        self.assertEqual(rows, [(2, {'A': 'x'})])
+
+
+# Cellules d'une colonne nombre telles qu'elles arrivent en base : nombres du fichier,
+# textes saisis dans le formulaire, cellules vides ou non numériques
+MIXED_ROWS = [
+    {'Tonnage': 1000, 'Date B/L': '2025-01-15 00:00'},   # 2
+    {'Tonnage': 250.5, 'Date B/L': '2025-02-01 10:30'},  # 3
+    {'Tonnage': None, 'Date B/L': None},                 # 4
+    {'Tonnage': '123', 'Date B/L': '2025-01-31 23:00'},  # 5
+    {'Tonnage': '1 500,5', 'Date B/L': '2025-03-10'},    # 6
+    {'Tonnage': 'abc', 'Date B/L': ''},                  # 7
+    {},                                                  # 8
+    {'Tonnage': 600000, 'Date B/L': '2024-12-31 08:00'},  # 9
+]
+MIXED_TYPES = {'Tonnage': 'number', 'Date B/L': 'date'}
+
+
+class SheetFilterTests(TestCase):
+    """Filtres et tri de get_sheet_data exécutés en base (SQLite)"""
+
+    def setUp(self):
+        self.file_cache, self.sheet = make_sheet(MIXED_ROWS, MIXED_TYPES)
+
+    def row_ids(self, **params):
+        queryset, _, _ = build_rows_queryset(self.sheet, self.sheet.headers, QueryDict(urlencode(params)))
+        if 'sort' not in params:
+            queryset = queryset.order_by('row_id')
+        return list(queryset.values_list('row_id', flat=True))
+
+    def test_number_range_excludes_empty_and_text_cells(self):
+        self.assertEqual(self.row_ids(**{'filter[Tonnage][gte]': '500000'}), [9])
+        self.assertEqual(self.row_ids(**{'filter[Tonnage][gte]': '200'}), [2, 3, 6, 9])
+        self.assertEqual(self.row_ids(**{'filter[Tonnage][lt]': '200'}), [5])
+        self.assertEqual(self.row_ids(**{'filter[Tonnage][lte]': '1500,5'}), [2, 3, 5, 6])
+
+    def test_number_equality_on_numbers_and_numeric_text(self):
+        self.assertEqual(self.row_ids(**{'filter[Tonnage]': '123'}), [5])
+        self.assertEqual(self.row_ids(**{'filter[Tonnage][eq]': '1000.0'}), [2])
+        self.assertEqual(self.row_ids(**{'filter[Tonnage][ne]': '1000'}), [3, 4, 5, 6, 7, 8, 9])
+
+    def assertSorted(self, row_ids, expected, empty):
+        """Valeurs dans l'ordre attendu, puis les cellules vides (dans un ordre quelconque)"""
+        self.assertEqual(row_ids[:len(expected)], expected)
+        self.assertEqual(set(row_ids[len(expected):]), set(empty))
+
+    def test_number_sort_mixes_numbers_and_numeric_text(self):
+        self.assertSorted(self.row_ids(sort='Tonnage'), [5, 3, 2, 6, 9], [4, 7, 8])
+        self.assertSorted(self.row_ids(sort='Tonnage', order='desc'), [9, 6, 2, 3, 5], [4, 7, 8])
+
+    def test_date_filters(self):
+        self.assertEqual(self.row_ids(**{'filter[Date B/L][gte]': '2025-02-01'}), [3, 6])
+        # Borne sans heure : toute la journée incluse
+        self.assertEqual(self.row_ids(**{'filter[Date B/L][lte]': '31/01/2025'}), [2, 5, 9])
+        self.assertEqual(self.row_ids(**{'filter[Date B/L]': '2025-01-15'}), [2])
+        self.assertEqual(self.row_ids(**{'filter[Date B/L][lt]': '2025-01-01'}), [9])
+
+    def test_date_sort_puts_empty_cells_last(self):
+        self.assertSorted(self.row_ids(sort='Date B/L'), [9, 2, 5, 3, 6], [4, 7, 8])
+        self.assertSorted(self.row_ids(sort='Date B/L', order='desc'), [6, 3, 5, 2, 9], [4, 7, 8])
+
+    def test_invalid_filter_value(self):
+        with self.assertRaises(ValueError):
+            self.row_ids(**{'filter[Tonnage][gte]': 'beaucoup'})
+
+    def test_bulk_delete_by_filter_keeps_empty_and_text_cells(self):
+        response = api_client().post(
+            '/api/files/test.xlsx/sheets/S/bulk-delete/', {'filter': {'Tonnage': {'gte': 1000}}}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['row_ids'], [2, 6, 9])
+        self.assertEqual(
+            list(SheetRow.objects.filter(sheet=self.sheet).order_by('row_id').values_list('row_id', flat=True)),
+            [3, 4, 5, 7, 8]
+        )
+
+
+class SheetPagingTests(TestCase):
+    """Pagination par clé (?limit=&after=) de get_sheet_data"""
+
+    def setUp(self):
+        rows = [{'Navires': f'NAVIRE {index}', 'Tonnage': index * 10} for index in range(7)]
+        make_sheet(rows, {'Navires': 'text_only', 'Tonnage': 'number'}, filename='pages.xlsx')
+        self.url = '/api/files/pages.xlsx/sheets/S/data/'
+        self.client = api_client()
+
+    def page(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_follow_next_after(self):
+        row_ids = []
+        after = None
+        while True:
+            page = self.page(limit=3, **({'after': after} if after is not None else {}))
+            self.assertEqual(page['total_rows'], 7)
+            self.assertLessEqual(len(page['data']), 3)
+            row_ids += [row['_row_id'] for row in page['data']]
+            if not page['has_more']:
+                self.assertIsNone(page['next_after'])
+                break
+            after = page['next_after']
+            self.assertEqual(after, row_ids[-1])
+        self.assertEqual(row_ids, list(range(2, 9)))
+
+    def test_page_after_a_deleted_row(self):
+        SheetRow.objects.filter(sheet__file_cache__filename='pages.xlsx', row_id=5).delete()
+        page = self.page(limit=2, after=4)
+        self.assertEqual([row['_row_id'] for row in page['data']], [6, 7])
+        self.assertTrue(page['has_more'])
+
+    def test_limit_is_capped_and_invalid_values_rejected(self):
+        self.assertEqual(self.page(limit=100000)['limit'], 1000)
+        for params in ({'limit': 0}, {'limit': 'dix'}, {'after': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class StreamedSheetTests(TestCase):
+    """Feuille complète diffusée par morceaux : même document JSON qu'en une fois"""
+
+    def setUp(self):
+        rows = [{'Navires': f'NAVIRE {index}', 'Tonnage': index} for index in range(520)]
+        make_sheet(rows, {'Navires': 'text_only', 'Tonnage': 'number'}, filename='stream.xlsx')
+        self.url = '/api/files/stream.xlsx/sheets/S/data/'
+        self.client = api_client()
+
+    def test_iter_json_object_matches_json(self):
+        rows = [{'a': index, 'b': 'é"\n'} for index in range(5)]
+        cases = [
+            ({'x': 1}, rows, lambda count: {'total': count}),
+            ({'x': 1}, rows, None),
+            ({}, rows, lambda count: {}),
+            ({}, [], lambda count: {'total': count}),
+        ]
+        for chunk_rows in (1, 2, 5, 200):
+            for head, items, tail in cases:
+                with self.subTest(chunk_rows=chunk_rows, head=head, rows=len(items)), \
+                        mock.patch('api.streaming.STREAM_CHUNK_ROWS', chunk_rows):
+                    content = b''.join(iter_json_object(head, 'data', iter(items), tail))
+                    expected = dict(head, data=items, **(tail(len(items)) if tail else {}))
+                    self.assertEqual(json.loads(content), expected)
+
+    def test_full_sheet_is_streamed(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 3)
+        content = json.loads(b''.join(chunks))
+        self.assertEqual(content['total_rows'], 520)
+        self.assertNotIn('filtered_rows', content)
+        self.assertEqual([row['_row_id'] for row in content['data']], list(range(2, 522)))
+        self.assertEqual(content['data'][-1], {'_row_id': 521, 'Navires': 'NAVIRE 519', 'Tonnage': 519})
+
+    def test_filtered_rows_are_counted_after_the_array(self):
+        response = self.client.get(self.url, {'filter[Tonnage][gte]': '300'}, HTTP_ACCEPT_ENCODING='identity')
+        content = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((content['total_rows'], content['filtered_rows']), (520, 220))
+        self.assertEqual(len(content['data']), 220)
+
+
+class SheetProjectionTests(TestCase):
+    """Projection ?fields= : seules les colonnes demandées sont lues et renvoyées"""
+
+    COLUMN_TYPES = {'Navires': 'text_only', 'Tonnage': 'number', 'Prix, HT': 'number', 'Client': 'text_only'}
+
+    def setUp(self):
+        rows = [
+            {'Navires': 'ATLAS', 'Tonnage': 100, 'Prix, HT': 9.5, 'Client': 'CARGILL'},
+            {'Navires': 'VEGA', 'Tonnage': None, 'Client': 'SOCIETE'},
+        ]
+        make_sheet(rows, self.COLUMN_TYPES, filename='fields.xlsx')
+        self.url = '/api/files/fields.xlsx/sheets/S/data/'
+        self.client = api_client()
+
+    def test_page_in_header_order(self):
+        response = self.client.get(self.url, {'limit': 10, 'fields': 'Client,Navires'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['headers'], ['Navires', 'Client'])
+        self.assertEqual(response.data['data'], [
+            {'_row_id': 2, 'Navires': 'ATLAS', 'Client': 'CARGILL'},
+            {'_row_id': 3, 'Navires': 'VEGA', 'Client': 'SOCIETE'},
+        ])
+
+    def test_repeated_fields_and_header_with_comma(self):
+        response = self.client.get(self.url, {'limit': 10, 'fields': ['Prix, HT', 'Tonnage']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['fields'], ['Tonnage', 'Prix, HT'])
+        self.assertEqual(response.data['data'][0], {'_row_id': 2, 'Tonnage': 100, 'Prix, HT': 9.5})
+        self.assertNotIn('Navires', response.data['data'][1])
+
+    def test_full_load(self):
+        response = self.client.get(self.url, {'fields': 'Navires'}, HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(content['data'], [{'_row_id': 2, 'Navires': 'ATLAS'}, {'_row_id': 3, 'Navires': 'VEGA'}])
+
+    def test_unknown_field(self):
+        response = self.client.get(self.url, {'limit': 10, 'fields': 'Navires,Inconnue'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Inconnue', response.data['error'])
+
+
+class IndexedFilterTests(TestCase):
+    """Un filtre donne les mêmes lignes, que la colonne soit indexée ou non"""
+
+    FILTERS = [
+        ('Tonnage', 'eq', '123'),
+        ('Tonnage', 'eq', '1000'),
+        ('Tonnage', 'gte', '200'),
+        ('Tonnage', 'gt', '1500,5'),
+        ('Tonnage', 'lt', '500000'),
+        ('Tonnage', 'lte', '123'),
+        ('Date B/L', 'eq', '2025-01-15'),
+        ('Date B/L', 'gte', '2025-01-31'),
+        ('Date B/L', 'lte', '31/01/2025'),
+        ('Date B/L', 'lt', '2025-02-01 10:30'),
+        ('Navires', 'eq', 'atlas'),
+        ('Navires', 'eq', 'ORION'),
+    ]
+
+    def setUp(self):
+        names = ['Atlas', 'orion', None, 'ATLAS', 'Vega', '', 'Orion', 'atlas']
+        rows = [dict(values, Navires=name) for values, name in zip(MIXED_ROWS, names)]
+        column_types = dict(MIXED_TYPES, Navires='text_only')
+        _, self.plain = make_sheet(rows, column_types, filename='plain.xlsx')
+        _, self.indexed = make_sheet(rows, column_types, filename='indexed.xlsx')
+        set_indexed_columns(self.indexed, ['Tonnage', 'Date B/L', 'Navires'])
+
+    def row_ids(self, sheet, column, operator, value):
+        params = QueryDict(urlencode({f'filter[{column}][{operator}]': value}))
+        queryset, _, _ = build_rows_queryset(sheet, sheet.headers, params)
+        return list(queryset.order_by('row_id').values_list('row_id', flat=True))
+
+    def test_index_is_used(self):
+        self.assertEqual(get_indexed_columns(self.plain), {})
+        self.assertEqual(
+            get_indexed_columns(self.indexed),
+            {'Tonnage': 'number_key', 'Date B/L': 'date_key', 'Navires': 'text_key'}
+        )
+
+    def test_same_rows_with_and_without_index(self):
+        for column, operator, value in self.FILTERS:
+            with self.subTest(column=column, operator=operator, value=value):
+                expected = self.row_ids(self.plain, column, operator, value)
+                self.assertTrue(expected)
+                self.assertEqual(self.row_ids(self.indexed, column, operator, value), expected)
+
+
+class ConditionalGetTests(TestCase):
+    """ETag des lectures : fort sans compression, faible (W/) compressé, 304 dans les deux cas"""
+
+    url = '/api/files/etag.xlsx/sheets/S/data/?limit=100'
+
+    def setUp(self):
+        rows = [{'Navires': f'NAVIRE {index % 7}', 'Tonnage': index * 10} for index in range(80)]
+        self.file_cache, self.sheet = make_sheet(rows, {'Navires': 'text_only', 'Tonnage': 'number'}, filename='etag.xlsx')
+        self.client = api_client()
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, **headers)
+
+    def test_strong_etag_without_compression(self):
+        response = self.get(HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['ETag'], sheet_etag(self.sheet))
+
+    def test_weak_etag_when_compressed(self):
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/' + sheet_etag(self.sheet))
+
+    def test_weak_or_strong_if_none_match_gives_304(self):
+        etag = sheet_etag(self.sheet)
+        for if_none_match in (etag, 'W/' + etag, f'"other", W/{etag}', '*'):
+            with self.subTest(if_none_match=if_none_match):
+                response = self.get(HTTP_IF_NONE_MATCH=if_none_match, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertIn(response['ETag'], (etag, 'W/' + etag))
+
+    def test_write_changes_etag(self):
+        old_etag = sheet_etag(self.sheet)
+        response = self.client.post('/api/files/etag.xlsx/sheets/S/add/', {'Navires': 'NOUVEAU', 'Tonnage': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.get(HTTP_IF_NONE_MATCH=old_etag, HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        self.sheet.refresh_from_db()
+        self.assertEqual(response['ETag'], sheet_etag(self.sheet))
+        self.assertNotEqual(response['ETag'], old_etag)
+
+    @override_settings(FILE_WATCHER='off')
+    def test_files_list_etag(self):
+        response = self.get('/api/files/', HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.get('/api/files/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        FileCache.objects.filter(pk=self.file_cache.pk).update(version=F('version') + 1)
+        response = self.get('/api/files/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+def decompress(data, coding):
+    if coding == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if coding == 'br':
+        import brotli
+        return brotli.decompress(data)
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class CompressionTests(TestCase):
+    """Compression négociée des réponses de l'API (zstd, brotli, gzip)"""
+
+    def setUp(self):
+        rows = [{'Navires': f'NAVIRE {index % 7}', 'Client': 'SOCIETE GENERALE', 'Tonnage': index} for index in range(600)]
+        make_sheet(rows, {'Navires': 'text_only', 'Client': 'text_only', 'Tonnage': 'number'}, filename='gz.xlsx')
+        self.url = '/api/files/gz.xlsx/sheets/S/data/'
+        self.client = api_client()
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip'), 'gzip')
+        self.assertEqual(choose_encoding('gzip, deflate, br, zstd'), available_encodings()[0])
+        self.assertEqual(choose_encoding('gzip;q=1.0, br;q=0.5, zstd;q=0'), 'gzip')
+        self.assertEqual(choose_encoding('*'), available_encodings()[0])
+        for accept_encoding in (None, '', 'identity', 'deflate', 'gzip;q=0', '*;q=0'):
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertIsNone(choose_encoding(accept_encoding))
+
+    def test_streamed_sheet_in_each_encoding(self):
+        plain = b''.join(self.client.get(self.url, HTTP_ACCEPT_ENCODING='identity').streaming_content)
+        for coding in available_encodings():
+            with self.subTest(coding=coding):
+                response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=coding)
+                self.assertEqual(response['Content-Encoding'], coding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertFalse(response.has_header('Content-Length'))
+                compressed = b''.join(response.streaming_content)
+                self.assertLess(len(compressed), len(plain) // 4)
+                self.assertEqual(decompress(compressed, coding), plain)
+
+    def test_each_chunk_is_decodable_on_arrival(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        received = b''
+        for chunk in response.streaming_content:
+            received += decompressor.decompress(chunk)
+            if received:
+                break
+        self.assertTrue(received.startswith(b'{"filename":"gz.xlsx"'))
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get(self.url, {'limit': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response.json()['data'][0]['_row_id'], 2)
+
+    def test_compressed_files_and_other_paths_are_untouched(self):
+        middleware = CompressionMiddleware(lambda request: response)
+        request = RequestFactory().get('/api/files/gz.xlsx/download/', HTTP_ACCEPT_ENCODING='gzip')
+        response = HttpResponse(b'PK' + b'\0' * 4096, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertNotIn('Content-Encoding', middleware(request))
+
+        request = RequestFactory().get('/admin/', HTTP_ACCEPT_ENCODING='gzip')
+        response = HttpResponse(b'x' * 4096, content_type='text/html')
+        self.assertNotIn('Content-Encoding', middleware(request))
+
+
+class SheetChangesTests(TestCase):
+    """Journal des modifications : différences renvoyées au client et compaction"""
+
+    def setUp(self):
+        self.file_cache, self.sheet = make_sheet(
+            [{'Navire': name} for name in 'ABC'], {'Navire': 'text_only'}, filename='changes.xlsx'
+        )
+        self.since = self.sheet.version
+
+    def changes(self):
+        self.sheet.refresh_from_db()
+        return changes_since(self.sheet, self.since)
+
+    def test_row_added_then_deleted_is_not_reported(self):
+        row = insert_sheet_row(self.sheet, {'Navire': 'D'})
+        delete_sheet_row(self.sheet, row.row_id)
+        delete_sheet_row(self.sheet, 3)
+        changes = self.changes()
+        self.assertEqual(changes['inserted'], [])
+        self.assertEqual(changes['deleted'], [3])
+
+    def test_reused_row_id_is_deleted_then_inserted(self):
+        update_sheet_row(self.sheet, 4, {'Navire': 'C2'})
+        delete_sheet_row(self.sheet, 4)
+        row = insert_sheet_row(self.sheet, {'Navire': 'E'})
+        self.assertEqual(row.row_id, 4)
+        changes = self.changes()
+        self.assertEqual(changes['deleted'], [4])
+        self.assertEqual(changes['inserted'], [{'_row_id': 4, 'Navire': 'E'}])
+        self.assertEqual(changes['updated'], [])
+
+    def test_log_is_compacted_when_versions_skip_the_boundary(self):
+        window = mock.patch('api.sheet_changes.CHANGE_LOG_WINDOW', 4)
+        every = mock.patch('api.sheet_changes.COMPACT_EVERY', 3)
+        with window, every:
+            for _ in range(10):
+                # Version avancée sans passer par le journal (écriture du fichier, par exemple),
+                # de façon à ce que le journal ne voie jamais un multiple de COMPACT_EVERY
+                skip = 2 if (self.sheet.version + 2) % 3 == 0 else 1
+                SheetDataCache.objects.filter(pk=self.sheet.pk).update(version=F('version') + skip)
+                self.sheet.refresh_from_db()
+                update_sheet_row(self.sheet, 2, {'Navire': 'A'})
+                self.assertNotEqual(self.sheet.version % 3, 0)
+        self.sheet.refresh_from_db()
+        self.assertLess(self.sheet.version - self.sheet.changes_base_version, 4 + 3)
+        self.assertFalse(self.sheet.changes.filter(version__lte=self.sheet.changes_base_version).exists())
+        self.assertTrue(changes_since(self.sheet, self.since)['full_reload'])
+
+    def test_bulk_writes_keep_the_log_bounded(self):
+        with mock.patch('api.sheet_changes.CHANGE_LOG_MAX_ROWS', 5):
+            rows = insert_sheet_rows(self.sheet, [{'Navire': str(index)} for index in range(4)])
+            last_version = self.sheet.version
+            delete_sheet_rows(self.sheet, SheetRow.objects.filter(sheet=self.sheet, row_id__in=[row.row_id for row in rows]))
+        self.sheet.refresh_from_db()
+        self.assertEqual(self.sheet.changes.count(), 4)
+        self.assertEqual(self.sheet.changes_base_version, last_version)
+
+
+class SheetAggregatesTests(TestCase):
+    """Agrégations par groupes (/aggregate/), avec et sans NumPy"""
+
+    url = '/api/files/test.xlsx/sheets/S/aggregate/'
+
+    def setUp(self):
+        self.file_cache, self.sheet = make_sheet(MIXED_ROWS, MIXED_TYPES)
+        self.client = api_client()
+
+    def aggregate(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            group['keys']['Date B/L:month']: (group['rows'], group['values'])
+            for group in response.data['groups']
+        }
+
+    def test_sum_avg_and_count_by_month(self):
+        groups = self.aggregate({'group_by': 'Date B/L:month', 'metric': ['sum:Tonnage', 'max:Tonnage', 'count:Tonnage']})
+        # Texte numérique ('123', '1 500,5') compté, texte libre ('abc') ignoré
+        self.assertEqual(groups['2025-01'], (2, {'sum:Tonnage': 1123, 'max:Tonnage': 1000, 'count:Tonnage': 2}))
+        self.assertEqual(groups['2025-03'], (1, {'sum:Tonnage': 1500.5, 'max:Tonnage': 1500.5, 'count:Tonnage': 1}))
+        self.assertEqual(groups['2024-12'][1]['sum:Tonnage'], 600000)
+        self.assertEqual(groups[None][0], 3)
+        self.assertEqual(sum(rows for rows, _ in groups.values()), len(MIXED_ROWS))
+
+    def test_filters_apply_before_aggregation(self):
+        groups = self.aggregate({'group_by': 'Date B/L:month', 'metric': 'sum:Tonnage', 'filter[Tonnage][lt]': '1000'})
+        self.assertEqual(groups, {'2025-01': (1, {'sum:Tonnage': 123}), '2025-02': (1, {'sum:Tonnage': 250.5})})
+
+    def test_python_fallback_matches_numpy(self):
+        params = {'group_by': 'Date B/L:year', 'metric': ['sum:Tonnage', 'avg:Tonnage', 'min:Tonnage', 'count']}
+        response = self.client.get(self.url, params)
+        with mock.patch('api.sheet_aggregates.HAS_NUMPY', False):
+            fallback = self.client.get(self.url, params)
+        self.assertEqual(fallback.data['engine'], 'python')
+        self.assertEqual(fallback.data['groups'], response.data['groups'])
+
+    def test_invalid_parameters(self):
+        for params in (
+            {'metric': 'median:Tonnage'},
+            {'metric': 'sum:Inconnue'},
+            {'metric': 'sum'},
+            {'group_by': 'Tonnage:month'},
+            {'group_by': 'Date B/L:week'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class SheetRollupsTests(TestCase):
+    """Agrégats du tableau de bord : colonnes limitées et mises à jour groupées"""
+
+    COLUMN_TYPES = {
+        'Date B/L': 'date', 'Arrivée': 'date', 'Tonnage': 'number', 'Prix': 'number',
+        'Fret': 'number', 'Taxe': 'number', 'Navire': 'text_only'
+    }
+
+    def setUp(self):
+        rows = [
+            {
+                'Date B/L': f'2025-0{index % 3 + 1}-1{index % 9}', 'Arrivée': f'2025-0{index % 4 + 4}-01',
+                'Tonnage': index * 10, 'Prix': index, 'Fret': 1.5, 'Taxe': 2, 'Navire': f'NAVIRE {index % 5}'
+            }
+            for index in range(30)
+        ]
+        self.file_cache, self.sheet = make_sheet(rows, self.COLUMN_TYPES, filename='rollups.xlsx')
+
+    def rollups(self):
+        return sorted(
+            (rollup.kind, rollup.dimension, rollup.bucket, rollup.measure, rollup.count, round(rollup.total, 6))
+            for rollup in SheetRollup.objects.filter(sheet=self.sheet)
+        )
+
+    def test_main_date_and_first_measures_only(self):
+        rollups = SheetRollup.objects.filter(sheet=self.sheet)
+        self.assertEqual(set(rollups.values_list('dimension', flat=True)), {'Date B/L', 'Navire'})
+        self.assertEqual(set(rollups.values_list('measure', flat=True)), {'', 'Tonnage', 'Prix', 'Fret'})
+
+    @override_settings(DASHBOARD_DATE_COLUMNS=['Inconnue', 'Arrivée'], DASHBOARD_MEASURES=['Taxe'])
+    def test_declared_columns(self):
+        rebuild_sheet_rollups(self.sheet)
+        rollups = SheetRollup.objects.filter(sheet=self.sheet)
+        self.assertEqual(set(rollups.values_list('dimension', flat=True)), {'Arrivée', 'Navire'})
+        self.assertEqual(set(rollups.values_list('measure', flat=True)), {'', 'Taxe'})
+
+    def test_incremental_changes_match_rebuild(self):
+        row = insert_sheet_row(self.sheet, {'Date B/L': '2025-09-01', 'Tonnage': 5, 'Navire': 'NOUVEAU'})
+        update_sheet_row(self.sheet, 3, {'Date B/L': '2025-10-02', 'Prix': 100, 'Navire': 'NAVIRE 0'})
+        delete_sheet_row(self.sheet, 4)
+        delete_sheet_row(self.sheet, row.row_id)
+        incremental = self.rollups()
+        rebuild_sheet_rollups(self.sheet)
+        self.assertEqual(incremental, self.rollups())
+
+    def test_one_row_change_uses_a_few_queries(self):
+        old_values = SheetRow.objects.get(sheet=self.sheet, row_id=2).values
+        new_values = dict(old_values, **{'Date B/L': '2025-12-01', 'Tonnage': 1, 'Prix': 2, 'Navire': 'AUTRE'})
+        with CaptureQueriesContext(connection) as queries:
+            apply_row_change(self.sheet, old_values, new_values)
+        # Verrou, lecture, UPDATE groupé, INSERT, horodatage (+ points de sauvegarde)
+        self.assertLessEqual(len(queries), 8)
+
+
+class SearchTests(TestCase):
+    """Recherche plein texte : mêmes résultats avec ou sans accents, sous SQLite comme sous PostgreSQL"""
+
+    def setUp(self):
+        make_sheet(
+            [{'Navire': 'Équipe Atlas', 'Client': 'Société Générale'}, {'Navire': 'ORION', 'Client': 'Cargill'}],
+            {'Navire': 'text_only', 'Client': 'text_only'}, filename='search.xlsx'
+        )
+        self.client = api_client()
+
+    def search(self, query):
+        response = self.client.get('/api/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_accents_and_case_are_ignored(self):
+        for query in ('equipe', 'Équipe', 'EQUIPE', 'équ', 'societe generale'):
+            with self.subTest(query=query):
+                self.assertEqual([result['_row_id'] for result in self.search(query)], [2])
+
+    def test_snippet_is_highlighted(self):
+        [result] = self.search('orion')
+        self.assertEqual(result['filename'], 'search.xlsx')
+        self.assertIn('<mark>ORION</mark>', result['snippet'])
+
+    def test_short_query_is_rejected(self):
+        self.assertEqual(self.client.get('/api/search/', {'q': 'a'}).status_code, 400)
+
+
+class SheetFormatTests(TestCase):
+    """Formats de sortie diffusés (CSV, Arrow)"""
+
+    sheet_name = 'Écarts "2025"'
+
+    def setUp(self):
+        make_sheet([{'Navires': 'ATLAS', 'Tonnage': 12.5}, {'Navires': 'VEGA', 'Tonnage': None}],
+                   {'Navires': 'text_only', 'Tonnage': 'number'}, filename='formats.xlsx', sheet_name=self.sheet_name)
+        self.url = f'/api/files/formats.xlsx/sheets/{quote(self.sheet_name)}/data/'
+        self.client = api_client()
+
+    def test_csv_content_disposition_is_encoded(self):
+        response = self.client.get(self.url + '?format=csv', HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Disposition'],
+            "inline; filename*=utf-8''%C3%89carts%20%222025%22.csv"
+        )
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(content.splitlines()[1:], ['2,ATLAS,12.5', '3,VEGA,'])
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow non installé")
+    def test_arrow_stream(self):
+        import pyarrow as pa
+
+        response = self.client.get(self.url + '?format=arrow', HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        table = pa.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(table.column('Navires').to_pylist(), ['ATLAS', 'VEGA'])
+        self.assertEqual(table.column('Tonnage').to_pylist(), [12.5, None])
+
+
+class IngestionTests(TestCase):
+    """Lecture par lots (fichier temporaire) et mise en cache de toutes les lignes"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.spools = os.path.join(self.folder.name, 'spools')
+        os.mkdir(self.spools)
+        patcher = mock.patch('tempfile.tempdir', self.spools)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rows_are_spooled_in_chunks(self):
+        rows = [('Navires', 'Tonnage'), ('ATLAS', 1), (None, None), ('VEGA',), ('ORION', 3), ('LYRA', 4), ('', 5)]
+        spool = RowSpool()
+        try:
+            sheet = scan_sheet('S', rows, spool, chunk_size=2)
+        finally:
+            spool.close()
+        chunks = list(iter_spool(spool.path))
+        discard_spool(spool.path)
+
+        self.assertEqual(sheet['entries'], 5)
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(chunks[0][1], {'_row_id': 4, 'Navires': 'VEGA', 'Tonnage': None})
+        self.assertEqual(chunks[-1][0]['_row_id'], 7)
+        self.assertEqual(os.listdir(self.spools), [])
+
+    def test_large_sheets_are_cached_entirely(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Grande'
+        ws.append(['Navires', 'Tonnage'])
+        for index in range(5200):
+            ws.append([f'NAVIRE {index % 13}', index])
+        wb.create_sheet('Petite').append(['Client'])
+        wb['Petite'].append(['CARGILL'])
+        path = os.path.join(self.folder.name, 'grand.xlsx')
+        wb.save(path)
+
+        file_cache = ingest_workbook(path)
+        sheet = SheetDataCache.objects.get(file_cache=file_cache, sheet_name='Grande')
+        self.assertEqual(sheet.rows_count, 5200)
+        self.assertEqual(SheetRow.objects.filter(sheet=sheet).count(), 5200)
+        self.assertEqual(SheetRow.objects.get(sheet=sheet, row_id=5201).values, {'Navires': 'NAVIRE 12', 'Tonnage': 5199})
+        self.assertEqual(file_cache.total_entries, 5201)
+        self.assertEqual(file_cache.sheets_details['Grande'], {'columns': 2, 'entries': 5200})
+        self.assertEqual(os.listdir(self.spools), [])
+
+
+# Filtre personnalisé qu'openpyxl refuse de relire (valeur non numérique sans joker)
+UNREADABLE_AUTOFILTER = (
+    b'<autoFilter ref="A1:C6"><filterColumn colId="0"><customFilters>'
+    b'<customFilter operator="notEqual" val=" "/></customFilters></filterColumn></autoFilter>'
+)
+
+
+@override_settings(EDIT_JOURNAL_FLUSH_INTERVAL=0)
+class EditJournalFlushTests(TestCase):
+    """Écriture des modifications du journal dans le fichier (XML des feuilles)"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, 'journal.xlsx')
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'S'
+        ws.append(['Navire', 'Tonnage', 'Double'])
+        for row, (ship, tonnage) in enumerate([('A', 10), ('B', 20), ('C', 30), ('D', 40), ('E', 50)], start=2):
+            ws.append([ship, tonnage, f'=B{row}*2'])
+        ws['A5'].comment = Comment('Retard', 'tests')
+        ws['B3'].number_format = '0.00'
+        wb.save(self.path)
+        wb.close()
+
+        # Formule partagée C2:C6 (cellule maîtresse C2), comme l'enregistre Excel
+        def share(match):
+            row = int(match.group(1))
+            return b'<f t="shared" ref="C2:C6" si="0">B2*2</f>' if row == 2 else b'<f t="shared" si="0"/>'
+        self.patch_sheet(lambda xml: re.sub(rb'<f>B(\d)\*2</f>', share, xml))
+
+    def patch_sheet(self, patch):
+        with zipfile.ZipFile(self.path) as archive:
+            sheet_xml = archive.read('xl/worksheets/sheet1.xml')
+        rewrite_archive(self.path, {'xl/worksheets/sheet1.xml': patch(sheet_xml)})
+
+    def flush(self, *edits):
+        file_cache = ingest_workbook(self.path)
+        for operation, row_id, values in edits:
+            journal_edit(file_cache, 'S', operation, row_id, values)
+        self.assertEqual(flush_pending_edits(file_cache), len(edits))
+        self.assertFalse(PendingEdit.objects.exists())
+        return file_cache
+
+    def cached_ships(self):
+        rows = SheetRow.objects.filter(sheet__sheet_name='S').order_by('position')
+        return [(row.row_id, row.values.get('Navire')) for row in rows]
+
+    def test_update_delete_and_insert(self):
+        self.flush(('update', 3, {'Tonnage': 99}), ('delete', 2, None), ('insert', 7, {'Navire': 'F', 'Tonnage': 60}))
+
+        wb = load_workbook(self.path)
+        ws = wb['S']
+        self.assertEqual(
+            [tuple(row) for row in ws.iter_rows(min_row=2, max_col=3, values_only=True)],
+            [('B', 99, '=B2*2'), ('C', 30, '=B3*2'), ('D', 40, '=B4*2'), ('E', 50, '=B5*2'), ('F', 60, None)]
+        )
+        # Style gardé par la cellule modifiée, commentaire remonté avec sa ligne
+        self.assertEqual(ws['B2'].number_format, '0.00')
+        self.assertEqual(ws['A4'].comment.text, 'Retard')
+        self.assertEqual(ws.auto_filter.ref, None)
+        wb.close()
+        self.assertEqual(self.cached_ships(), [(2, 'B'), (3, 'C'), (4, 'D'), (5, 'E'), (6, 'F')])
+
+    def test_counts_follow_reread(self):
+        file_cache = self.flush(('delete', 2, None), ('delete', 4, None))
+        file_cache.refresh_from_db()
+        self.assertEqual(file_cache.total_entries, 3)
+        self.assertEqual(file_cache.sheets_details, {'S': {'columns': 3, 'entries': 3}})
+
+    def test_renumbered_rows_reject_writes_from_older_copy(self):
+        ingest_workbook(self.path)
+        client = api_client()
+        url = '/api/files/journal.xlsx/sheets/S/'
+        with mock.patch('api.views.EXCEL_FOLDER', self.folder.name):
+            version = client.get(url + 'data/', {'limit': 100}).data['version']
+            self.assertEqual(client.post(url + 'add/', {'Navire': 'F', 'Tonnage': 60}, format='json').status_code, 200)
+            self.assertEqual(client.delete(f"{url}delete/?row_id=3&base_version={version}").status_code, 200)
+            version = client.get(url + 'changes/', {'since': version}).data['version']
+
+            # Écriture du journal : la suppression décale les lignes suivantes (D passe de 5 à 4)
+            flush_pending_edits(FileCache.objects.get(filename='journal.xlsx'))
+            self.assertEqual(self.cached_ships(), [(2, 'A'), (3, 'C'), (4, 'D'), (5, 'E'), (6, 'F')])
+
+            # Modification de D par son ancien _row_id : refusée au lieu de modifier E
+            response = client.put(
+                f"{url}update/?base_version={version}", {'_row_id': 5, 'Navire': 'D2'}, format='json'
+            )
+            self.assertEqual(response.status_code, 409)
+            self.assertTrue(response.data['full_reload'])
+            self.assertEqual(self.cached_ships(), [(2, 'A'), (3, 'C'), (4, 'D'), (5, 'E'), (6, 'F')])
+            self.assertTrue(client.get(url + 'changes/', {'since': version}).data['full_reload'])
+
+            # Après rechargement, le nouveau _row_id est accepté
+            version = client.get(url + 'data/', {'limit': 100}).data['version']
+            response = client.put(
+                f"{url}update/?base_version={version}", {'_row_id': 4, 'Navire': 'D2'}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cached_ships(), [(2, 'A'), (3, 'C'), (4, 'D2'), (5, 'E'), (6, 'F')])
+
+    def test_cleared_value_keeps_cell_style(self):
+        self.flush(('update', 3, {'Tonnage': ''}))
+        wb = load_workbook(self.path)
+        self.assertIsNone(wb['S']['B3'].value)
+        self.assertEqual(wb['S']['B3'].number_format, '0.00')
+        wb.close()
+
+    def test_workbook_openpyxl_cannot_load(self):
+        self.patch_sheet(lambda xml: xml.replace(b'</sheetData>', b'</sheetData>' + UNREADABLE_AUTOFILTER))
+        with self.assertRaises(Exception):
+            load_workbook(self.path)
+
+        self.flush(('update', 4, {'Navire': 'Z'}), ('delete', 3, None), ('insert', 7, {'Navire': 'F', 'Tonnage': 60}))
+
+        reader = XlsxReader(self.path)
+        rows = [tuple(row[:2]) for row in reader.iter_rows('S')]
+        reader.close()
+        self.assertEqual(rows, [('Navire', 'Tonnage'), ('A', 10), ('Z', 30), ('D', 40), ('E', 50), ('F', 60)])
+        with zipfile.ZipFile(self.path) as archive:
+            self.assertIn(b'<autoFilter ref="A1:C5">', archive.read('xl/worksheets/sheet1.xml'))
+        self.assertEqual(self.cached_ships(), [(2, 'A'), (3, 'Z'), (4, 'D'), (5, 'E'), (6, 'F')])
+
+    def test_unchanged_file_is_not_stale(self):
+        # Date à la nanoseconde : arrondie à la microseconde en base
+        os.utime(self.path, ns=(1_760_000_000_123_456_400, 1_760_000_000_123_456_400))
+        file_cache = ingest_workbook(self.path)
+        file_cache.refresh_from_db()
+        self.assertFalse(modified_since_cache(file_cache, os.stat(self.path)))
+
+        # Date changée, contenu identique : feuille reprise du cache sans relecture
+        os.utime(self.path, (1_760_000_100, 1_760_000_100))
+        self.assertTrue(modified_since_cache(file_cache, os.stat(self.path)))
+        with mock.patch('api.views.update_file_cache') as update_file_cache:
+            _, sheet_cache = journal_sheet_cache(self.path, 'journal.xlsx', 'S')
+        update_file_cache.assert_not_called()
+        self.assertEqual(sheet_cache.sheet_name, 'S')
+        file_cache.refresh_from_db()
+        self.assertFalse(modified_since_cache(file_cache, os.stat(self.path)))
+
+    def test_stuck_journal_does_not_block_download_or_sync(self):
+        file_cache = ingest_workbook(self.path)
+        journal_edit(file_cache, 'S', 'delete', 2)
+        failure = mock.patch('api.edit_journal.apply_edits', side_effect=OSError('écriture impossible'))
+        folder = mock.patch('api.views.EXCEL_FOLDER', self.folder.name)
+        with failure, folder:
+            response = api_client().get('/api/files/journal.xlsx/download/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Pending-Edits'], '1')
+            response.close()
+
+            # Fichier modifié ailleurs : relu malgré le journal bloqué
+            wb = load_workbook(self.path)
+            wb['S'].append(['F', 60])
+            wb.save(self.path)
+            wb.close()
+            stat = os.stat(self.path)
+            os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+            sync_all_files_cache(workers=1)
+
+        file_cache.refresh_from_db()
+        self.assertEqual(file_cache.total_entries, 6)
+        self.assertEqual(PendingEdit.objects.count(), 1)
+
+
+class FileWatcherTests(TestCase):
+    """Surveillance du dossier : synchronisation initiale et retour à la relecture périodique"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        wb = Workbook()
+        wb.active.title = 'S'
+        wb.active.append(['Navire', 'Tonnage'])
+        wb.active.append(['A', 10])
+        wb.save(os.path.join(self.folder.name, 'surveille.xlsx'))
+        wb.close()
+
+    @override_settings(FILE_WATCHER='poll', INGESTION_WORKERS=1)
+    def test_first_files_list_is_synced(self):
+        folder = mock.patch('api.views.EXCEL_FOLDER', self.folder.name)
+        fresh_process = mock.patch.object(file_watcher, '_watcher', None)
+        with folder, fresh_process, mock.patch.object(file_watcher.threading, 'Thread') as thread:
+            response = api_client().get('/api/files/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([f['filename'] for f in response.data['files']], ['surveille.xlsx'])
+        self.assertEqual(response.data['files'][0]['total_entries'], 1)
+        # Le thread ne refait pas la synchronisation initiale
+        thread.return_value.start.assert_called_once()
+        _, _, watch, snapshot, _ = thread.call_args.kwargs['args']
+        self.assertIsNone(watch)
+        self.assertEqual(list(snapshot), ['surveille.xlsx'])
+
+    def test_lost_inotify_polls_from_current_folder(self):
+        class Stop(BaseException):
+            pass
+
+        lost_watch = mock.Mock()
+        lost_watch.wait_for_change.return_value = False
+        old_snapshot = {'ancien.xlsx': (0, 0)}
+        sync = mock.Mock()
+        waiting = mock.patch.object(file_watcher, 'wait_for_snapshot_change', side_effect=Stop)
+        with waiting as wait, mock.patch.object(file_watcher, 'connection'), self.assertRaises(Stop):
+            file_watcher.run_watcher(self.folder.name, sync, lost_watch, old_snapshot, 5)
+        lost_watch.close.assert_called_once()
+        sync.assert_called_once()
+        self.assertEqual(wait.call_args.args[1], file_watcher.folder_snapshot(self.folder.name))
+
+
+class BulkEntriesTests(TestCase):
+    """Ajouts et suppressions en lot (mode base de données)"""
+
+    def setUp(self):
+        self.file_cache, self.sheet = make_sheet(
+            [{'Navires': 'ATLAS', 'Tonnage': 100}, {'Navires': 'VEGA', 'Tonnage': 200}],
+            {'Navires': 'text_only', 'Tonnage': 'number'}, filename='bulk.xlsx'
+        )
+        self.url = '/api/files/bulk.xlsx/sheets/S/'
+        self.client = api_client()
+
+    def assertCounts(self, entries):
+        self.file_cache.refresh_from_db()
+        self.assertEqual(self.file_cache.total_entries, entries)
+        self.assertEqual(self.file_cache.sheets_details['S']['entries'], entries)
+        self.assertEqual(SheetRow.objects.filter(sheet=self.sheet).count(), entries)
+
+    def test_one_invalid_row_rejects_the_batch(self):
+        rows = [{'Navires': 'ORION', 'Tonnage': 300}, {'Navires': 'LYRA', 'Tonnage': 'beaucoup'}]
+        response = self.client.post(self.url + 'bulk-add/', {'rows': rows}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['inserted'], 0)
+        self.assertEqual([result['valid'] for result in response.data['results']], [True, False])
+        self.assertIn('Tonnage', response.data['results'][1]['errors'])
+        self.assertCounts(2)
+
+    def test_add_and_delete_update_file_and_sheet_counts(self):
+        rows = [{'Navires': 'ORION', 'Tonnage': 300}, {'Navires': 'LYRA', 'Tonnage': 400}]
+        response = self.client.post(self.url + 'bulk-add/', {'rows': rows}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertCounts(4)
+
+        response = self.client.post(self.url + 'bulk-delete/', {'filter': {'Tonnage': {'gte': 200}}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], 3)
+        self.assertCounts(1)
+
+
+class RowIdTests(TestCase):
+    """_row_id reçu en entier, flottant ou texte : toujours normalisé en entier"""
+
+    def setUp(self):
+        self.file_cache, self.sheet = make_sheet(
+            [{'Navires': 'ATLAS'}, {'Navires': 'VEGA'}, {'Navires': 'ORION'}],
+            {'Navires': 'text_only'}, filename='ids.xlsx'
+        )
+        self.url = '/api/files/ids.xlsx/sheets/S/'
+        self.client = api_client()
+
+    def navire(self, row_id):
+        return SheetRow.objects.get(sheet=self.sheet, row_id=row_id).values['Navires']
+
+    def test_parse_row_id(self):
+        for value, expected in ((3, 3), (3.0, 3), ('3', 3), (' 3.0 ', 3), (3.5, None), ('3,0', None),
+                                ('abc', None), (True, None), (None, None)):
+            with self.subTest(value=value):
+                self.assertEqual(parse_row_id(value), expected)
+
+    def test_update_and_delete_by_float_or_text_id(self):
+        for row_id, name in ((3.0, 'VEGA 2'), ('3.0', 'VEGA 3'), ('3', 'VEGA 4')):
+            with self.subTest(row_id=row_id):
+                response = self.client.put(self.url + 'update/', {'_row_id': row_id, 'Navires': name}, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.navire(3), name)
+
+        self.assertEqual(self.client.delete(self.url + 'delete/?row_id=4.0').status_code, 200)
+        self.assertFalse(SheetRow.objects.filter(sheet=self.sheet, row_id=4).exists())
+
+    def test_invalid_or_header_ids_are_rejected(self):
+        for row_id in (2.5, 'deux', 1, True):
+            with self.subTest(row_id=row_id):
+                response = self.client.put(self.url + 'update/', {'_row_id': row_id, 'Navires': 'X'}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.delete(self.url + 'delete/?row_id=1').status_code, 400)
+        self.assertEqual([self.navire(row_id) for row_id in (2, 3, 4)], ['ATLAS', 'VEGA', 'ORION'])
+
+
+@unittest.skipUnless(HAS_ORJSON, "orjson non installé")
+class FastJSONTests(unittest.TestCase):
+    """Renderer / parser orjson : même sortie que ceux de DRF"""
+
+    DATA = {
+        'datetime': datetime.datetime(2025, 1, 15, 10, 30, 5, 123456, tzinfo=datetime.timezone.utc),
+        'naive': datetime.datetime(2025, 1, 15, 10, 30),
+        'date': datetime.date(2025, 1, 15),
+        'time': datetime.time(8, 0, 30),
+        'duration': datetime.timedelta(days=1, seconds=5),
+        'decimal': Decimal('1500.50'),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'text': 'Société « Générale »\u2028\u2029',
+        'rows': [{'_row_id': 2, 'Tonnage': 12.5, 'Vide': None, 'Oui': True}],
+        3: 'clé entière',
+    }
+
+    def test_same_output_as_drf(self):
+        self.assertEqual(FastJSONRenderer().render(self.DATA), JSONRenderer().render(self.DATA))
+        self.assertEqual(dumps_bytes(self.DATA['rows']), JSONRenderer().render(self.DATA['rows']))
+
+    def test_values_orjson_rejects(self):
+        big = {'big': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(big), JSONRenderer().render(big))
+        self.assertEqual(dumps_bytes(big), b'{"big":1180591620717411303424}')
+        self.assertEqual(FastJSONRenderer().render({'nan': math.nan, 'inf': math.inf}), b'{"nan":null,"inf":null}')
+
+    def test_parser(self):
+        parse = lambda content: FastJSONParser().parse(io.BytesIO(content))
+        self.assertEqual(parse('{"Navires": "ÉTOILE", "Tonnage": 1.5}'.encode()), {'Navires': 'ÉTOILE', 'Tonnage': 1.5})
+        for content in (b'{"a": ', b'{"a": NaN}', b''):
+            with self.subTest(content=content), self.assertRaises(ParseError):
+                parse(content)
+
+
+class XlsxAppendTests(unittest.TestCase):
+    """Ajout de lignes par modification du XML de la feuille"""
+
+    HEADERS = [(1, 'Navires'), (2, 'Tonnage'), (4, 'Remarque')]
+
+    def test_rows_follow_the_last_row(self):
+        sheet_xml = (
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            b'<dimension ref="A1:C3"/><sheetData>'
+            b'<row r="1"><c r="A1" t="s"><v>0</v></c></row><row r="3"><c r="A3"><v>1</v></c></row>'
+            b'</sheetData></worksheet>'
+        )
+        entries = [{'Navires': 'A & B <C>', 'Tonnage': 12.5}, {'Remarque': True, 'Inconnue': 'x'}]
+        patched, row_numbers = append_rows_to_sheet(sheet_xml, self.HEADERS, entries)
+        self.assertEqual(row_numbers, [4, 5])
+        self.assertIn(b'<dimension ref="A1:D5"/>', patched)
+        self.assertIn(
+            b'<row r="4"><c r="A4" t="inlineStr"><is><t>A &amp; B &lt;C&gt;</t></is></c>'
+            b'<c r="B4"><v>12.5</v></c></row><row r="5"><c r="D5" t="b"><v>1</v></c></row></sheetData>',
+            patched
+        )
+
+    def test_empty_sheet_data(self):
+        sheet_xml = b'<worksheet><dimension ref="A1"/><sheetData/></worksheet>'
+        patched, row_numbers = append_rows_to_sheet(sheet_xml, self.HEADERS, [{'Navires': ' ATLAS '}])
+        self.assertEqual(row_numbers, [1])
+        self.assertEqual(
+            patched,
+            b'<worksheet><dimension ref="A1:A1"/><sheetData><row r="1"><c r="A1" t="inlineStr">'
+            b'<is><t xml:space="preserve"> ATLAS </t></is></c></row></sheetData></worksheet>'
+        )
+
+    def test_unsupported_layout_and_values(self):
+        with self.assertRaises(XlsxPatchError):
+            append_rows_to_sheet(b'<x:worksheet><x:sheetData></x:sheetData></x:worksheet>', self.HEADERS, [{}])
+        with self.assertRaises(ValueError):
+            append_rows_to_sheet(b'<worksheet><sheetData/></worksheet>', self.HEADERS, [{'Navires': 'bip\x07'}])
+
+    def test_openpyxl_reads_the_appended_rows(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Navires'
+        ws.append(['Navires', 'Tonnage', None, 'Remarque'])
+        ws.append(['ATLAS', 100, None, 'ok'])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'append.xlsx')
+            wb.save(path)
+            with zipfile.ZipFile(path) as archive:
+                part = sheet_part_name(archive, 'Navires')
+                sheet_xml = archive.read(part)
+            patched, _ = append_rows_to_sheet(sheet_xml, self.HEADERS, [{'Navires': 'VEGA', 'Tonnage': 7, 'Remarque': 'été'}])
+            rewrite_archive(path, {part: patched})
+
+            result = load_workbook(path)
+            rows = [trimmed(row) for row in result['Navires'].iter_rows(values_only=True)]
+            result.close()
+        self.assertEqual(rows[1:], [('ATLAS', 100, None, 'ok'), ('VEGA', 7, None, 'été')])
+
+
+def trimmed(row):
+    """Ligne sans ses cellules vides finales (openpyxl complète les lignes jusqu'à la dimension)"""
+    row = list(row)
+    while row and row[-1] is None:
+        row.pop()
+    return tuple(row)
+
+
+class XlsxReaderTests(unittest.TestCase):
+    """Lecture directe des valeurs : mêmes lignes qu'openpyxl (read_only, values_only)"""
+
+    def compare_with_openpyxl(self, wb):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'reader.xlsx')
+            wb.save(path)
+
+            expected_wb = load_workbook(path, read_only=True, data_only=True)
+            expected = {
+                ws.title: [trimmed(row) for row in ws.iter_rows(values_only=True)] for ws in expected_wb.worksheets
+            }
+            expected_wb.close()
+
+            reader = XlsxReader(path)
+            actual = {sheet_name: [trimmed(row) for row in reader.iter_rows(sheet_name)] for sheet_name in reader.sheetnames}
+            reader.close()
+        self.assertEqual(actual, expected)
+        return actual
+
+    def test_values_match_openpyxl(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Valeurs'
+        ws.append(['Texte', 'Entier', 'Décimal', 'Booléen', 'Date', 'Date et heure', 'Pourcentage', 'Formule'])
+        ws.append(['ATLAS', 12, 12.5, True, datetime.date(2025, 3, 1), datetime.datetime(2025, 3, 1, 14, 30), 0.25, '=B2*2'])
+        ws.append(['  espaces  ', -3, 1e-7, False, None, None, None, None])
+        # Ligne 4 absente, cellule isolée en ligne 5
+        ws['D5'] = 'ATLAS'
+        ws['G2'].number_format = '0.00%'
+        ws['E2'].number_format = 'dd/mm/yyyy'
+        wb.create_sheet('Vide')
+
+        actual = self.compare_with_openpyxl(wb)
+        self.assertEqual(actual['Valeurs'][1][4], datetime.datetime(2025, 3, 1))
+        self.assertEqual(actual['Valeurs'][3], ())
+
+    def test_1904_calendar(self):
+        wb = Workbook()
+        wb.epoch = CALENDAR_MAC_1904
+        wb.active.append(['Date'])
+        wb.active.append([datetime.date(2024, 2, 29)])
+        actual = self.compare_with_openpyxl(wb)
+        self.assertEqual(actual['Sheet'][1], (datetime.datetime(2024, 2, 29),))
+
+    def test_sheet_hash_depends_on_its_own_shared_strings(self):
+        def hashes(second_sheet_values):
+            wb = Workbook()
+            wb.active.title = 'A'
+            wb.active.append(['Navire', 'ATLAS'])
+            wb.create_sheet('B').append(second_sheet_values)
+            with tempfile.TemporaryDirectory() as folder:
+                path = os.path.join(folder, 'hash.xlsx')
+                wb.save(path)
+                reader = XlsxReader(path)
+                try:
+                    return reader.content_hashes()
+                finally:
+                    reader.close()
+
+        reference = hashes(['VEGA'])
+        self.assertEqual(reference, hashes(['VEGA']))
+        for values in (['VEGA', 'ORION'], ['LYRA'], ['ATLAS']):
+            changed = hashes(values)
+            self.assertEqual(changed['A'], reference['A'])
+            self.assertNotEqual(changed['B'], reference['B'])
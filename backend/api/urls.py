@@ -31,6 +31,11 @@ from .views_users import (
     CustomTokenObtainPairView
 )
 from .views_setup import setup_database
+from .views_search import search_entries
+from .views_aggregates import get_sheet_aggregates, get_dashboard
+from .views_indexes import sheet_indexes
+from .views_changes import get_sheet_changes
+from .views_bulk import add_sheet_entries, delete_sheet_entries, update_sheet_entries
 
 router = DefaultRouter()
 router.register(r'excel-files', ExcelFileViewSet, basename='excel-file')
@@ -52,12 +57,24 @@ urlpatterns = [
     path("files/<str:filename>/sheets/create/", add_sheet_to_file, name="add_sheet_to_file"),
     path("files/<str:filename>/sheets/<str:sheet_name>/columns/", get_sheet_columns, name="get_sheet_columns"),
     path("files/<str:filename>/sheets/<str:sheet_name>/data/", get_sheet_data, name="get_sheet_data"),
+    path("files/<str:filename>/sheets/<str:sheet_name>/changes/", get_sheet_changes, name="get_sheet_changes"),
+    path("files/<str:filename>/sheets/<str:sheet_name>/aggregate/", get_sheet_aggregates, name="get_sheet_aggregates"),
+    path("files/<str:filename>/sheets/<str:sheet_name>/indexes/", sheet_indexes, name="sheet_indexes"),
     path("files/<str:filename>/sheets/<str:sheet_name>/add/", add_sheet_entry, name="add_sheet_entry"),
+    path("files/<str:filename>/sheets/<str:sheet_name>/bulk-add/", add_sheet_entries, name="add_sheet_entries"),
     path("files/<str:filename>/sheets/<str:sheet_name>/update/", update_sheet_entry, name="update_sheet_entry"),
     path("files/<str:filename>/sheets/<str:sheet_name>/delete/", delete_sheet_entry, name="delete_sheet_entry"),
+    path("files/<str:filename>/sheets/<str:sheet_name>/bulk-update/", update_sheet_entries, name="update_sheet_entries"),
+    path("files/<str:filename>/sheets/<str:sheet_name>/bulk-delete/", delete_sheet_entries, name="delete_sheet_entries"),
     path("files/<str:filename>/download/", download_excel, name="download_excel"),
     path("files/<str:filename>/delete/", delete_excel_file, name="delete_excel_file"),
     
+    # Tableau de bord (agrégats pré-calculés)
+    path("dashboard/", get_dashboard, name="get_dashboard"),
+    
+    # Recherche plein texte dans tous les fichiers
+    path("search/", search_entries, name="search_entries"),
+    
     # Gestion des fichiers archivés
     path("files/archived/", get_archived_files, name="get_archived_files"),
     path("files/archived/<int:file_id>/restore/", restore_excel_file, name="restore_excel_file"),
@@ -1,17 +1,38 @@
 from django.shortcuts import render
 from django.http import HttpResponse, FileResponse
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from datetime import datetime
 import os
 import glob
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 
 from .models import ExcelFile, ExcelColumn, FileCache, SheetDataCache
+from .sheet_rows import (
+    iter_sheet_rows,
+    load_sheet_rows_page,
+    load_sheet_rows_offset,
+    insert_sheet_row,
+    update_sheet_row,
+    delete_sheet_row,
+    adjust_entry_counts,
+    parse_row_id,
+    MAX_PAGE_SIZE
+)
+from .sheet_queries import build_rows_queryset, get_column_types, parse_fields
+from .etags import file_etag, files_etag, not_modified, row_ids_conflict, sheet_etag, with_etag
+from .streaming import stream_json_response
+from .edit_journal import check_values, edit_lock, flush_pending_edits, journal_edit, try_flush_pending_edits
+from .sheet_formats import SHEET_DATA_FORMATS, SHEET_DATA_RENDERERS, sheet_data_response
+from .ingestion import ingest_sheets, ingest_workbook, ingest_workbooks, modified_since_cache, touch_if_unchanged
+from .file_watcher import ensure_watcher
+from .column_types import guess_field_type, is_required_field
 from .serializers import (
     ExcelFileSerializer, 
     ExcelFileCreateSerializer, 
@@ -31,66 +52,12 @@ if not os.path.exists(ARCHIVE_FOLDER):
 
 
 def update_file_cache(filepath, filename=None, last_modified_by=None):
-    """Mettre à jour le cache pour un fichier spécifique"""
+    """Mettre à jour le cache d'un fichier et de toutes ses feuilles (une seule lecture du classeur)"""
     if filename is None:
         filename = os.path.basename(filepath)
     
     try:
-        wb = load_workbook(filepath, read_only=True)
-        
-        # Compter le total des entrées et détails par feuille
-        total_entries = 0
-        sheets_info = []
-        sheets_details = {}
-        
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            
-            # Compter les colonnes
-            columns_count = 0
-            for cell in ws[1]:
-                if cell.value:
-                    columns_count += 1
-            
-            # Compter les lignes
-            row_count = 0
-            for row in ws.iter_rows(min_row=2, max_row=5000, values_only=True):
-                if any(cell is not None for cell in row):
-                    row_count += 1
-            
-            total_entries += row_count
-            sheets_info.append(sheet_name)
-            sheets_details[sheet_name] = {
-                'columns': columns_count,
-                'entries': row_count
-            }
-        
-        file_stat = os.stat(filepath)
-        
-        # Préparer les données à mettre à jour
-        defaults = {
-            'name': filename.replace('.xlsx', ''),
-            'file_path': filepath,
-            'sheets_count': len(wb.sheetnames),
-            'sheets_json': sheets_info,
-            'sheets_details': sheets_details,
-            'total_entries': total_entries,
-            'file_size': file_stat.st_size,
-            'file_modified': datetime.fromtimestamp(file_stat.st_mtime)
-        }
-        
-        # Ajouter le dernier utilisateur qui a modifié si fourni
-        if last_modified_by:
-            defaults['last_modified_by'] = last_modified_by
-        
-        # Mettre à jour ou créer le cache
-        cache, created = FileCache.objects.update_or_create(
-            filename=filename,
-            defaults=defaults
-        )
-        
-        wb.close()
-        return cache
+        return ingest_workbook(filepath, filename, last_modified_by)
     except Exception as e:
         print(f"Erreur cache pour {filename}: {e}")
         return None
@@ -98,95 +65,8 @@ def update_file_cache(filepath, filename=None, last_modified_by=None):
 
 def cache_sheet_data(file_cache, filepath, sheet_name):
     """Mettre en cache les données d'une feuille avec analyse des types de colonnes"""
-    from datetime import time, timedelta
-    
-    def serialize_value(value):
-        """Convertir les valeurs non-JSON en chaînes"""
-        if value is None:
-            return None
-        if isinstance(value, datetime):
-            return value.strftime("%Y-%m-%d %H:%M")
-        if isinstance(value, time):
-            return value.strftime("%H:%M:%S")
-        if isinstance(value, timedelta):
-            total_seconds = int(value.total_seconds())
-            hours, remainder = divmod(total_seconds, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        return value
-    
     try:
-        wb = load_workbook(filepath, read_only=True, data_only=True)
-        
-        if sheet_name not in wb.sheetnames:
-            wb.close()
-            return None
-        
-        ws = wb[sheet_name]
-        
-        # Récupérer les en-têtes
-        headers = []
-        first_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
-        
-        for cell in first_row:
-            if cell:
-                col_name = str(cell).strip().replace('\n', ' ')
-                headers.append(col_name)
-        
-        # Collecter toutes les valeurs par colonne pour l'analyse
-        column_values = {header: [] for header in headers}
-        
-        # Récupérer les données et collecter les valeurs par colonne
-        data = []
-        raw_rows = []  # Stocker les lignes brutes pour l'analyse
-        
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, max_row=1000, values_only=True), start=2):
-            if any(cell is not None for cell in row):
-                row_data = {"_row_id": row_idx}
-                for col_idx, value in enumerate(row):
-                    if col_idx < len(headers):
-                        header = headers[col_idx]
-                        # Collecter la valeur brute pour l'analyse
-                        column_values[header].append(value)
-                        # Sérialiser pour le stockage
-                        row_data[header] = serialize_value(value)
-                data.append(row_data)
-        
-        wb.close()
-        
-        # Analyser chaque colonne pour déterminer son type réel
-        columns_info = []
-        for idx, header in enumerate(headers, start=1):
-            values = column_values.get(header, [])
-            
-            # Analyser les données réelles de la colonne (en passant aussi le nom pour fallback)
-            field_type, data_type = analyze_column_data_type(values, header)
-            
-            # Collecter des exemples de valeurs non-null
-            sample_vals = [str(v)[:50] for v in values[:5] if v is not None and str(v).strip() != ''][:3]
-            
-            columns_info.append({
-                "index": idx,
-                "name": header,
-                "field_type": field_type,
-                "data_type": data_type,  # 'number', 'text', 'text_only', 'date', 'boolean', 'any'
-                "required": is_required_field(header),
-                "sample_values": sample_vals  # Exemples de valeurs
-            })
-        
-        # Sauvegarder dans le cache
-        sheet_cache, created = SheetDataCache.objects.update_or_create(
-            file_cache=file_cache,
-            sheet_name=sheet_name,
-            defaults={
-                'headers': headers,
-                'columns_info': columns_info,
-                'data': data,
-                'rows_count': len(data)
-            }
-        )
-        
-        return sheet_cache
+        return ingest_sheets(file_cache, filepath, [sheet_name]).get(sheet_name)
     except Exception as e:
         print(f"Erreur cache feuille {sheet_name}: {e}")
         import traceback
@@ -194,12 +74,17 @@ def cache_sheet_data(file_cache, filepath, sheet_name):
         return None
 
 
-def sync_all_files_cache():
-    """Synchroniser le cache avec tous les fichiers du dossier"""
+def sync_all_files_cache(workers=None):
+    """
+    Synchroniser le cache avec tous les fichiers du dossier.
+    Les fichiers modifiés sont relus en parallèle (workers processus, voir ingest_workbooks),
+    en ne relisant que les feuilles dont le contenu a changé (empreintes).
+    """
     pattern = os.path.join(EXCEL_FOLDER, '*.xlsx')
     files = glob.glob(pattern)
     
     existing_filenames = set()
+    to_update = []
     
     for filepath in files:
         filename = os.path.basename(filepath)
@@ -210,39 +95,84 @@ def sync_all_files_cache():
         # Vérifier si le fichier a été modifié depuis le dernier cache
         try:
             file_stat = os.stat(filepath)
-            file_modified = datetime.fromtimestamp(file_stat.st_mtime)
-            
             cache = FileCache.objects.filter(filename=filename).first()
-            # Comparer les dates (ignorer le timezone pour la comparaison)
-            needs_update = cache is None
-            if cache and cache.file_modified:
-                # Convertir en timestamp pour comparaison fiable
-                cache_ts = cache.file_modified.timestamp() if hasattr(cache.file_modified, 'timestamp') else 0
-                file_ts = file_modified.timestamp()
-                needs_update = file_ts > cache_ts
+            needs_update = cache is None or modified_since_cache(cache, file_stat)
             
             if needs_update:
-                # Mettre à jour le cache du fichier
-                file_cache = update_file_cache(filepath, filename)
-                
-                # Mettre à jour aussi le cache des données de chaque feuille
-                if file_cache and file_cache.sheets_json:
-                    for sheet_name in file_cache.sheets_json:
-                        cache_sheet_data(file_cache, filepath, sheet_name)
+                # Modifications en attente écrites d'abord dans le fichier relu (relu même en cas d'échec)
+                if cache:
+                    try_flush_pending_edits(cache)
+                to_update.append(filepath)
         except Exception as e:
             print(f"Erreur sync cache pour {filename}: {e}")
     
+    # Mettre à jour le cache des fichiers modifiés et de leurs feuilles
+    if to_update:
+        ingest_workbooks(to_update, workers, incremental=True)
+    
     # NE PAS supprimer les fichiers du cache si aucun fichier physique n'est trouvé
     # Cela permet de garder les données importées via l'API même si les fichiers
     # physiques ne sont pas présents (ex: en production sur Render)
     if existing_filenames:
         # Seulement supprimer si on a trouvé au moins un fichier physique
-        FileCache.objects.filter(is_deleted=False).exclude(filename__in=existing_filenames).update(is_deleted=True)
+        FileCache.objects.filter(is_deleted=False).exclude(filename__in=existing_filenames).update(
+            is_deleted=True,
+            version=F('version') + 1
+        )
     
     # Supprimer les caches de feuilles orphelins
     SheetDataCache.objects.filter(file_cache__isnull=True).delete()
 
 
+def find_file_cache(filename):
+    """Retrouver un fichier en cache à partir du nom reçu dans l'URL"""
+    from urllib.parse import unquote
+    
+    decoded_filename = unquote(filename)
+    file_cache = FileCache.objects.filter(filename=decoded_filename).first()
+    if not file_cache:
+        file_cache = FileCache.objects.filter(filename=filename).first()
+    if not file_cache:
+        file_cache = FileCache.objects.filter(filename=f"{decoded_filename}.xlsx").first()
+    if not file_cache:
+        file_cache = FileCache.objects.filter(name__icontains=decoded_filename.replace('.xlsx', '')).first()
+    return file_cache
+
+
+def find_sheet_cache(file_cache, sheet_name, queryset=None):
+    """Retrouver une feuille en cache à partir du nom reçu dans l'URL"""
+    from urllib.parse import unquote
+    
+    if queryset is None:
+        queryset = SheetDataCache.objects.defer('data')
+    sheet_cache = queryset.filter(file_cache=file_cache, sheet_name=unquote(sheet_name)).first()
+    if not sheet_cache:
+        sheet_cache = queryset.filter(file_cache=file_cache, sheet_name=sheet_name).first()
+    return sheet_cache
+
+
+def journal_sheet_cache(filepath, filename, sheet_name):
+    """
+    Fichier et feuille en cache pour une modification en mode fichier (journal d'écriture différée).
+    Le fichier est (re)mis en cache s'il est absent ou modifié sur le disque depuis.
+    """
+    file_cache = FileCache.objects.filter(filename=filename).first()
+    sheet_cache = find_sheet_cache(file_cache, sheet_name) if file_cache else None
+    
+    is_stale = file_cache is None or modified_since_cache(file_cache, os.stat(filepath))
+    # Date changée sans changement de contenu (copie, touch) : ni écriture ni relecture
+    if is_stale and sheet_cache is not None and touch_if_unchanged(filepath, file_cache):
+        is_stale = False
+    if sheet_cache is None or is_stale:
+        if file_cache:
+            try_flush_pending_edits(file_cache)
+        file_cache = update_file_cache(filepath, filename)
+        if file_cache is None or sheet_name not in (file_cache.sheets_json or []):
+            return file_cache, None
+        sheet_cache = find_sheet_cache(file_cache, sheet_name)
+    return file_cache, sheet_cache
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_current_user(request):
@@ -254,21 +184,23 @@ def get_current_user(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_excel_files(request):
-    """Récupérer la liste des fichiers Excel disponibles (depuis le cache) - VERSION SIMPLE ET RAPIDE"""
+    """
+    Récupérer la liste des fichiers Excel disponibles (depuis le cache) - VERSION SIMPLE ET RAPIDE
+    Lecture de la base uniquement : le cache est tenu à jour en arrière-plan (file_watcher).
+    """
     try:
-        # PAS de synchronisation sur Render - juste récupérer depuis la base
-        # Synchroniser seulement en local si des fichiers physiques existent
-        is_render = os.environ.get('RENDER', False)
-        if not is_render:
-            try:
-                if os.path.exists(EXCEL_FOLDER) and glob.glob(os.path.join(EXCEL_FOLDER, '*.xlsx')):
-                    sync_all_files_cache()
-            except:
-                pass  # Ignorer les erreurs de sync
+        # Surveillance du dossier démarrée au premier appel (désactivée sur Render, voir FILE_WATCHER)
+        ensure_watcher(EXCEL_FOLDER, sync_all_files_cache)
         
         # Récupérer depuis le cache - TRÈS RAPIDE
         cached_files = FileCache.objects.filter(is_deleted=False)
         
+        # Liste inchangée depuis la dernière lecture du client : 304
+        etag = files_etag(cached_files)
+        cached_response = not_modified(request, etag)
+        if cached_response:
+            return cached_response
+        
         excel_files = []
         for cache in cached_files:
             try:
@@ -296,10 +228,10 @@ def get_excel_files(request):
                 print(f"Erreur fichier {cache.id}: {e}")
                 continue
         
-        return Response({
+        return with_etag(Response({
             "files": excel_files,
             "total_files": len(excel_files)
-        })
+        }), etag)
         
     except Exception as e:
         print(f"Erreur get_excel_files: {e}")
@@ -344,6 +276,11 @@ def get_file_sheets(request, filename):
             cache = FileCache.objects.filter(name__icontains=decoded_filename.replace('.xlsx', '')).first()
         
         if cache:
+            etag = file_etag(cache)
+            cached_response = not_modified(request, etag)
+            if cached_response:
+                return cached_response
+            
             # Parser sheets_json si c'est une chaîne
             sheets_list = cache.sheets_json
             if isinstance(sheets_list, str):
@@ -370,11 +307,11 @@ def get_file_sheets(request, filename):
                         "entries_count": details.get('entries', 0)
                     })
             
-            return Response({
+            return with_etag(Response({
                 "filename": cache.filename,
                 "file_name": cache.name,
                 "sheets": sheets
-            })
+            }), etag)
         
         return Response({"error": f"Fichier non trouvé: {filename}"}, status=404)
         
@@ -394,17 +331,22 @@ def get_sheet_columns(request, filename, sheet_name):
         file_cache = FileCache.objects.filter(filename=filename).first()
         
         if file_cache:
-            sheet_cache = SheetDataCache.objects.filter(
+            sheet_cache = SheetDataCache.objects.defer('data').filter(
                 file_cache=file_cache, 
                 sheet_name=sheet_name
             ).first()
             
             if sheet_cache and sheet_cache.columns_info:
-                return Response({
+                etag = sheet_etag(sheet_cache, 'columns')
+                cached_response = not_modified(request, etag)
+                if cached_response:
+                    return cached_response
+                
+                return with_etag(Response({
                     "filename": filename,
                     "sheet_name": sheet_name,
                     "columns": sheet_cache.columns_info
-                })
+                }), etag)
             
             # Cache la feuille si pas encore fait
             filepath = os.path.join(EXCEL_FOLDER, filename)
@@ -455,223 +397,24 @@ def get_sheet_columns(request, filename, sheet_name):
         return Response({"error": str(e)}, status=500)
 
 
-def analyze_column_data_type(column_values, column_name=""):
-    """
-    Analyser les valeurs d'une colonne pour déterminer son type réel.
-    Retourne: (field_type, data_type)
-    - field_type: 'number', 'datetime-local', 'text', 'textarea', 'select-yesno'
-    - data_type: 'number', 'date', 'text', 'text_only', 'boolean', 'any'
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + SHEET_DATA_RENDERERS)
+def get_sheet_data(request, filename, sheet_name):
     """
-    from datetime import time, timedelta
-    import re
-    
-    if not column_values:
-        # Pas de données, utiliser le nom de la colonne
-        return guess_field_type(column_name)
+    Récupérer les données d'une feuille (depuis le cache - instantané)
     
-    # Filtrer les valeurs non-nulles
-    non_null_values = [v for v in column_values if v is not None and str(v).strip() != '']
+    Pagination optionnelle par curseur sur _row_id :
+    ?limit=200 (max 1000) et ?after=<_row_id de la dernière ligne reçue>
     
-    if not non_null_values:
-        # Toutes les valeurs sont nulles, utiliser le nom de la colonne
-        return guess_field_type(column_name)
+    Recherche, filtres et tri exécutés en base (voir sheet_queries) :
+    ?q=texte, ?sort=Colonne&order=asc|desc, ?filter[Colonne][gte]=valeur
+    Avec un tri par colonne, la pagination se fait par ?offset= au lieu de ?after=
     
-    # Compteurs pour chaque type
-    date_count = 0
-    number_count = 0
-    text_count = 0
-    long_text_count = 0
-    oui_non_count = 0
-    total = len(non_null_values)
+    Projection : ?fields=Navires,Tonnage ne renvoie que ces colonnes
     
-    for value in non_null_values:
-        # Vérifier si c'est une date/datetime
-        if isinstance(value, datetime):
-            date_count += 1
-            continue
-        if isinstance(value, time):
-            date_count += 1
-            continue
-        if isinstance(value, timedelta):
-            number_count += 1  # Les durées sont considérées comme des nombres
-            continue
-            
-        # Vérifier si c'est un nombre
-        if isinstance(value, (int, float)):
-            number_count += 1
-            continue
-        
-        # Convertir en string pour analyse
-        str_value = str(value).strip()
-        
-        # Vérifier Oui/Non
-        if str_value.lower() in ['oui', 'non', 'yes', 'no', 'o', 'n']:
-            oui_non_count += 1
-            continue
-        
-        # Vérifier si c'est une date en format string
-        date_patterns = [
-            r'^\d{2}/\d{2}/\d{4}$',  # DD/MM/YYYY
-            r'^\d{4}-\d{2}-\d{2}',   # YYYY-MM-DD
-            r'^\d{2}-\d{2}-\d{4}$',  # DD-MM-YYYY
-            r'^\d{2}\.\d{2}\.\d{4}$' # DD.MM.YYYY
-        ]
-        is_date_string = any(re.match(pattern, str_value) for pattern in date_patterns)
-        if is_date_string:
-            date_count += 1
-            continue
-        
-        # Vérifier si c'est un nombre en format string
-        # Accepte les nombres avec virgule ou point comme séparateur décimal
-        number_pattern = r'^-?\d+([.,]\d+)?$'
-        if re.match(number_pattern, str_value.replace(' ', '')):
-            number_count += 1
-            continue
-        
-        # C'est du texte
-        if len(str_value) > 100:
-            long_text_count += 1
-        else:
-            text_count += 1
-    
-    # Déterminer le type dominant (au moins 60% des valeurs)
-    threshold = 0.6
-    
-    if total > 0 and date_count / total >= threshold:
-        return 'datetime-local', 'date'
-    
-    if total > 0 and number_count / total >= threshold:
-        return 'number', 'number'
-    
-    if total > 0 and oui_non_count / total >= threshold:
-        return 'select-yesno', 'boolean'
-    
-    if total > 0 and long_text_count / total >= 0.4:
-        return 'textarea', 'text'
-    
-    # Si les données sont du texte, vérifier si c'est du "text_only" 
-    # (noms de navires, clients, etc. qui ne doivent pas être des nombres)
-    name_lower = column_name.lower()
-    text_only_keywords = [
-        'navire', 'navires', 'ship', 'vessel',
-        'client', 'customer', 
-        'fournisseur', 'supplier', 'vendeur',
-        'origine', 'origin', 'provenance',
-        'destination', 'dest',
-        'region', 'région',
-        'port', 'quai', 'terminal',
-        'agent', 'agents', 'transitaire', 'armateur',
-        'surveillant', 'surveill',
-        'qualité', 'qualite', 'quality',
-        'type', 'catégorie', 'categorie',
-        'incoterm', 'incoterme',
-        'facturation',
-        'famille'
-    ]
-    if any(word in name_lower for word in text_only_keywords):
-        return 'text', 'text_only'
-    
-    # Par défaut c'est du texte libre
-    return 'text', 'any'
-
-
-def guess_field_type(column_name):
-    """Deviner le type de champ en fonction du nom de la colonne (fallback quand pas de données)"""
-    name_lower = column_name.lower().strip()
-    
-    # Numéro de ligne (N°, N, #)
-    if name_lower in ['n°', 'n', '#', 'no', 'num', 'numero', 'numéro']:
-        return 'number', 'number'
-    
-    # Dates - patterns étendus
-    date_keywords = [
-        'date', 'arrivée', 'arrivee', 'arriv', 
-        'debut', 'début', 'fin', 
-        'accostage', 'appareillage', 
-        'nor', 'quai libre', 
-        'pose passerelle', 'ordre',
-        'connection', 'déconnection', 'deconnection',
-        'draft', 'notice'
-    ]
-    if any(word in name_lower for word in date_keywords):
-        return 'datetime-local', 'date'
-    
-    # Nombres - patterns étendus
-    number_keywords = [
-        'tonnage', 'tonne', 'poids', 'masse',
-        'nombre', 'nbr', 'nb',
-        '%', 'h2o', 'h2so4', 'p2o5', 'k2o',
-        'fob', 'fret', 'cfr', 'pu', 'p.u',
-        'cours', 'valeur', 'montant', 'prix', 'tarif', 'total',
-        'loa', 'jour', 'jr',
-        'cadence', 'performance', 'taux',
-        'attente', 'séjour', 'sejour', 'durée', 'duree',
-        'surestaries', 'surrestaries', 
-        'temps', 'humidité', 'humidite', 'humidit',
-        'quantité', 'quantite', 'qte',
-        'volume', 'surface',
-        'acconnage', 'assurance',
-        'fwd', 'aft', 'trim',
-        'fresh water', 'fw',
-        'mouvements', 'mvt',
-        'concentration', 'concent'
-    ]
-    if any(word in name_lower for word in number_keywords):
-        return 'number', 'number'
-    
-    # Texte long - patterns étendus
-    long_text_keywords = [
-        'remarques', 'remarque',
-        'commentaire', 'commentaires', 'comment',
-        'description', 'desc',
-        'evenements', 'événements', 'evenement',
-        'observation', 'observations', 'observ',
-        'cause', 'conflit',
-        'etat', 'état'
-    ]
-    if any(word in name_lower for word in long_text_keywords):
-        return 'textarea', 'text'
-    
-    # Sélection Oui/Non
-    if 'oui/non' in name_lower or 'oui non' in name_lower:
-        return 'select-yesno', 'boolean'
-    
-    # Texte obligatoire (noms propres qui ne doivent pas être des nombres)
-    text_only_keywords = [
-        'navire', 'navires', 'ship', 'vessel',
-        'client', 'customer', 
-        'fournisseur', 'supplier', 'vendeur',
-        'origine', 'origin', 'provenance',
-        'destination', 'dest',
-        'region', 'région',
-        'port de chargement',
-        'agent', 'agents', 'transitaire', 'armateur',
-        'surveillant', 'surveill',
-        'qualité', 'qualite', 'quality',
-        'type', 'catégorie', 'categorie', 'cat',
-        'incoterm', 'incoterme',
-        'facturation',
-        'famille',
-        'dum', 'ei', 'cde', 'n° ei', 'n° cde'
-    ]
-    if any(word in name_lower for word in text_only_keywords):
-        return 'text', 'text_only'
-    
-    # Par défaut: texte libre (accepte tout)
-    return 'text', 'any'
-
-
-def is_required_field(column_name):
-    """Déterminer si un champ est obligatoire"""
-    name_lower = column_name.lower()
-    required_fields = ['n°', 'n', 'navires', 'date b/l', 'date bl', 'tonnage']
-    return any(field in name_lower for field in required_fields)
-
-
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_sheet_data(request, filename, sheet_name):
-    """Récupérer les données d'une feuille (depuis le cache - instantané)"""
+    Formats (en-tête Accept ou ?format=) : json, ndjson, csv, msgpack, arrow (voir sheet_formats)
+    """
     try:
         import json as json_module
         from urllib.parse import unquote
@@ -680,6 +423,28 @@ def get_sheet_data(request, filename, sheet_name):
         decoded_filename = unquote(filename)
         decoded_sheet_name = unquote(sheet_name)
         
+        # Paramètres de pagination (absents = toute la feuille, comme avant)
+        limit = request.query_params.get('limit')
+        after = request.query_params.get('after')
+        offset = request.query_params.get('offset')
+        if limit is not None:
+            limit = parse_row_id(limit)
+            if limit is None or limit <= 0:
+                return Response({"error": "Paramètre 'limit' invalide"}, status=400)
+            limit = min(limit, MAX_PAGE_SIZE)
+        if after is not None:
+            after = parse_row_id(after)
+            if after is None:
+                return Response({"error": "Paramètre 'after' invalide"}, status=400)
+            if limit is None:
+                limit = MAX_PAGE_SIZE
+        if offset is not None:
+            offset = parse_row_id(offset)
+            if offset is None or offset < 0:
+                return Response({"error": "Paramètre 'offset' invalide"}, status=400)
+            if limit is None:
+                limit = MAX_PAGE_SIZE
+        
         # Chercher le fichier dans le cache
         file_cache = FileCache.objects.filter(filename=decoded_filename).first()
         if not file_cache:
@@ -690,19 +455,31 @@ def get_sheet_data(request, filename, sheet_name):
             file_cache = FileCache.objects.filter(name__icontains=decoded_filename.replace('.xlsx', '')).first()
         
         if file_cache:
-            # Chercher la feuille
-            sheet_cache = SheetDataCache.objects.filter(
+            # Chercher la feuille (sans charger l'ancien blob de données)
+            sheets = SheetDataCache.objects.defer('data')
+            sheet_cache = sheets.filter(
                 file_cache=file_cache, 
                 sheet_name=decoded_sheet_name
             ).first()
             
             if not sheet_cache:
-                sheet_cache = SheetDataCache.objects.filter(
+                sheet_cache = sheets.filter(
                     file_cache=file_cache, 
                     sheet_name=sheet_name
                 ).first()
             
             if sheet_cache:
+                # Format négocié (JSON par défaut)
+                output_format = getattr(request.accepted_renderer, 'format', 'json')
+                if output_format not in SHEET_DATA_FORMATS:
+                    output_format = 'json'
+                
+                # Version inchangée : 304 sans lire aucune ligne
+                etag = sheet_etag(sheet_cache, 'data' if output_format == 'json' else f'data-{output_format}')
+                cached_response = not_modified(request, etag)
+                if cached_response:
+                    return cached_response
+                
                 # Parser headers si c'est une chaîne JSON
                 headers = sheet_cache.headers
                 if isinstance(headers, str):
@@ -711,21 +488,75 @@ def get_sheet_data(request, filename, sheet_name):
                     except:
                         headers = []
                 
-                # Parser data si c'est une chaîne JSON
-                data = sheet_cache.data
-                if isinstance(data, str):
-                    try:
-                        data = json_module.loads(data)
-                    except:
-                        data = []
+                # Recherche / filtres / tri traduits en requête SQL
+                try:
+                    queryset, is_sorted, is_filtered = build_rows_queryset(
+                        sheet_cache, headers, request.query_params
+                    )
+                    fields = parse_fields(request.query_params, headers)
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=400)
                 
-                return Response({
+                response_data = {
                     "filename": file_cache.filename,
                     "sheet_name": sheet_cache.sheet_name,
-                    "headers": headers,
-                    "data": data,
-                    "total_rows": sheet_cache.rows_count or len(data)
-                })
+                    "headers": fields if fields is not None else headers,
+                    "version": sheet_cache.version
+                }
+                if fields is not None:
+                    response_data["fields"] = fields
+                
+                columns = fields if fields is not None else headers
+                
+                if limit is None and output_format != 'json':
+                    # Feuille complète dans un autre format (lignes lues par lots)
+                    response_data["total_rows"] = sheet_cache.rows_count
+                    rows = iter_sheet_rows(sheet_cache, queryset, fields)
+                    response = sheet_data_response(output_format, response_data, columns, get_column_types(sheet_cache), rows)
+                    return with_etag(response, etag) if response.status_code == 200 else response
+                
+                if limit is None:
+                    # Feuille complète : lignes lues par lots et diffusées au fil de l'eau
+                    def tail(count):
+                        extra = {"total_rows": sheet_cache.rows_count or count}
+                        if is_filtered:
+                            extra["filtered_rows"] = count
+                        return extra
+                    
+                    rows = iter_sheet_rows(sheet_cache, queryset, fields)
+                    return with_etag(stream_json_response(response_data, "data", rows, tail), etag)
+                
+                if is_sorted:
+                    if after is not None:
+                        return Response({"error": "Utiliser 'offset' et non 'after' avec un tri par colonne"}, status=400)
+                    # Fenêtre d'une requête triée par colonne
+                    offset = offset or 0
+                    data, next_offset = load_sheet_rows_offset(queryset, limit, offset, fields)
+                    response_data.update({
+                        "offset": offset,
+                        "next_offset": next_offset,
+                        "has_more": next_offset is not None
+                    })
+                else:
+                    # Une seule fenêtre de lignes (lecture indexée sur sheet + row_id)
+                    data, next_after = load_sheet_rows_page(sheet_cache, limit, after, queryset, fields)
+                    response_data.update({
+                        "after": after,
+                        "next_after": next_after,
+                        "has_more": next_after is not None
+                    })
+                
+                response_data["total_rows"] = sheet_cache.rows_count
+                response_data["limit"] = limit
+                if is_filtered:
+                    response_data["filtered_rows"] = queryset.count()
+                
+                if output_format != 'json':
+                    response = sheet_data_response(output_format, response_data, columns, get_column_types(sheet_cache), data)
+                    return with_etag(response, etag) if response.status_code == 200 else response
+                
+                response_data["data"] = data
+                return with_etag(Response(response_data), etag)
         
         return Response({"error": f"Données non trouvées pour {filename}/{sheet_name}"}, status=404)
         
@@ -741,7 +572,6 @@ def get_sheet_data(request, filename, sheet_name):
 def add_sheet_entry(request, filename, sheet_name):
     """Ajouter une nouvelle entrée dans une feuille"""
     try:
-        import json as json_module
         from urllib.parse import unquote
         
         decoded_filename = unquote(filename)
@@ -749,37 +579,23 @@ def add_sheet_entry(request, filename, sheet_name):
         filepath = os.path.join(EXCEL_FOLDER, decoded_filename)
         
         # Mode 1: Fichier physique existe (développement local)
+        # Base mise à jour tout de suite, écriture dans le fichier différée (voir edit_journal)
         if os.path.exists(filepath):
-            wb = load_workbook(filepath)
-            
-            if decoded_sheet_name not in wb.sheetnames:
-                wb.close()
+            file_cache, sheet_cache = journal_sheet_cache(filepath, decoded_filename, decoded_sheet_name)
+            if not sheet_cache:
                 return Response({"error": f"Feuille '{decoded_sheet_name}' non trouvée"}, status=404)
             
-            ws = wb[decoded_sheet_name]
-            
-            headers = []
-            for cell in ws[1]:
-                if cell.value:
-                    headers.append(str(cell.value).strip().replace('\n', ' '))
-            
-            next_row = ws.max_row + 1
-            entry_data = request.data
-            
-            for col_idx, header in enumerate(headers, start=1):
-                value = entry_data.get(header, "")
-                if value == "" or value is None:
-                    value = None
-                ws.cell(row=next_row, column=col_idx, value=value)
-            
-            wb.save(filepath)
-            wb.close()
+            try:
+                check_values(request.data)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
             
-            file_cache = update_file_cache(filepath, decoded_filename, last_modified_by=request.user)
-            if file_cache:
-                cache_sheet_data(file_cache, filepath, decoded_sheet_name)
+            with edit_lock(file_cache), transaction.atomic():
+                row = insert_sheet_row(sheet_cache, dict(request.data))
+                journal_edit(file_cache, sheet_cache.sheet_name, 'insert', row.row_id, row.values, request.user)
+                adjust_entry_counts(file_cache, sheet_cache.sheet_name, 1, request.user)
             
-            return Response({"message": "Entrée ajoutée avec succès", "row_number": next_row})
+            return Response({"message": "Entrée ajoutée avec succès", "row_number": row.row_id})
         
         # Mode 2: Pas de fichier physique (production Render) - sauvegarder en base
         else:
@@ -799,34 +615,14 @@ def add_sheet_entry(request, filename, sheet_name):
             if not sheet_cache:
                 return Response({"error": "Feuille non trouvée en base"}, status=404)
             
-            # Charger les données existantes
-            data = sheet_cache.data
-            if isinstance(data, str):
-                try:
-                    data = json_module.loads(data)
-                except:
-                    data = []
-            if not isinstance(data, list):
-                data = []
-            
-            # Ajouter la nouvelle entrée
-            new_entry = dict(request.data)
-            new_entry['_row_id'] = len(data) + 2  # +2 car ligne 1 = headers
-            data.append(new_entry)
-            
-            # Sauvegarder en base
-            sheet_cache.data = data
-            sheet_cache.rows_count = len(data)
-            sheet_cache.save()
-            
-            # Mettre à jour le total du fichier
-            file_cache.total_entries = sum(
-                s.rows_count for s in SheetDataCache.objects.filter(file_cache=file_cache)
-            )
-            file_cache.last_modified_by = request.user
-            file_cache.save()
+            # Ajouter la nouvelle entrée (un seul INSERT, sans relire la feuille)
+            with transaction.atomic():
+                row = insert_sheet_row(sheet_cache, dict(request.data))
+                
+                # Mettre à jour le total du fichier
+                adjust_entry_counts(file_cache, sheet_cache.sheet_name, 1, request.user)
             
-            return Response({"message": "Entrée ajoutée avec succès (base de données)", "row_number": new_entry['_row_id']})
+            return Response({"message": "Entrée ajoutée avec succès (base de données)", "row_number": row.row_id})
         
     except Exception as e:
         import traceback
@@ -837,42 +633,48 @@ def add_sheet_entry(request, filename, sheet_name):
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_sheet_entry(request, filename, sheet_name):
-    """Modifier une entrée existante dans une feuille"""
+    """
+    Modifier une entrée existante dans une feuille
+    ?base_version= : version de la copie du client, 409 si les lignes ont été renumérotées depuis
+    """
     try:
-        import json as json_module
         from urllib.parse import unquote
         
         row_id = request.data.get('_row_id')
         if not row_id:
             return Response({"error": "ID de ligne requis"}, status=400)
         
+        # _row_id entier (numéro de ligne Excel, la ligne 1 contient les en-têtes)
+        row_id = parse_row_id(row_id)
+        if row_id is None or row_id < 2:
+            return Response({"error": "ID de ligne invalide"}, status=400)
+        
         decoded_filename = unquote(filename)
         decoded_sheet_name = unquote(sheet_name)
         filepath = os.path.join(EXCEL_FOLDER, decoded_filename)
         
-        # Mode 1: Fichier physique existe
+        # Mode 1: Fichier physique existe (écriture différée, voir edit_journal)
         if os.path.exists(filepath):
-            wb = load_workbook(filepath)
-            if decoded_sheet_name not in wb.sheetnames:
-                wb.close()
+            file_cache, sheet_cache = journal_sheet_cache(filepath, decoded_filename, decoded_sheet_name)
+            if not sheet_cache:
                 return Response({"error": f"Feuille non trouvée"}, status=404)
             
-            ws = wb[decoded_sheet_name]
-            headers = [str(c.value).strip() for c in ws[1] if c.value]
-            
-            for col_idx, header in enumerate(headers, start=1):
-                if header in request.data and header != '_row_id':
-                    value = request.data[header]
-                    if value == "" or value is None:
-                        value = None
-                    ws.cell(row=int(row_id), column=col_idx, value=value)
-            
-            wb.save(filepath)
-            wb.close()
+            try:
+                check_values(request.data)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
             
-            file_cache = update_file_cache(filepath, decoded_filename, last_modified_by=request.user)
-            if file_cache:
-                cache_sheet_data(file_cache, filepath, decoded_sheet_name)
+            with edit_lock(file_cache), transaction.atomic():
+                conflict = row_ids_conflict(request, sheet_cache)
+                if conflict:
+                    return conflict
+                
+                row = update_sheet_row(sheet_cache, row_id, request.data)
+                if row is None:
+                    return Response({"error": "Ligne non trouvée"}, status=404)
+                
+                journal_edit(file_cache, sheet_cache.sheet_name, 'update', row_id, request.data, request.user)
+                FileCache.objects.filter(pk=file_cache.pk).update(last_modified_by=request.user)
             
             return Response({"message": "Entrée modifiée avec succès"})
         
@@ -890,26 +692,17 @@ def update_sheet_entry(request, filename, sheet_name):
             if not sheet_cache:
                 return Response({"error": "Feuille non trouvée"}, status=404)
             
-            data = sheet_cache.data
-            if isinstance(data, str):
-                try:
-                    data = json_module.loads(data)
-                except:
-                    data = []
-            
-            # Trouver et modifier la ligne
-            for i, row in enumerate(data):
-                if row.get('_row_id') == row_id or row.get('_row_id') == int(row_id):
-                    for key, value in request.data.items():
-                        if key != '_row_id':
-                            data[i][key] = value
-                    break
-            
-            sheet_cache.data = data
-            sheet_cache.save()
-            
-            file_cache.last_modified_by = request.user
-            file_cache.save()
+            # Modifier uniquement la ligne concernée (un seul UPDATE)
+            with transaction.atomic():
+                conflict = row_ids_conflict(request, sheet_cache)
+                if conflict:
+                    return conflict
+                
+                row = update_sheet_row(sheet_cache, row_id, request.data)
+                if row is None:
+                    return Response({"error": "Ligne non trouvée"}, status=404)
+                
+                FileCache.objects.filter(pk=file_cache.pk).update(last_modified_by=request.user)
             
             return Response({"message": "Entrée modifiée avec succès (base de données)"})
         
@@ -922,34 +715,41 @@ def update_sheet_entry(request, filename, sheet_name):
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_sheet_entry(request, filename, sheet_name):
-    """Supprimer une entrée d'une feuille"""
+    """
+    Supprimer une entrée d'une feuille
+    ?base_version= : version de la copie du client, 409 si les lignes ont été renumérotées depuis
+    """
     try:
-        import json as json_module
         from urllib.parse import unquote
         
         row_id = request.query_params.get('row_id')
         if not row_id:
             return Response({"error": "ID de ligne requis"}, status=400)
         
+        row_id = parse_row_id(row_id)
+        if row_id is None or row_id < 2:
+            return Response({"error": "ID de ligne invalide"}, status=400)
+        
         decoded_filename = unquote(filename)
         decoded_sheet_name = unquote(sheet_name)
         filepath = os.path.join(EXCEL_FOLDER, decoded_filename)
         
-        # Mode 1: Fichier physique existe
+        # Mode 1: Fichier physique existe (écriture différée, voir edit_journal)
         if os.path.exists(filepath):
-            wb = load_workbook(filepath)
-            if decoded_sheet_name not in wb.sheetnames:
-                wb.close()
+            file_cache, sheet_cache = journal_sheet_cache(filepath, decoded_filename, decoded_sheet_name)
+            if not sheet_cache:
                 return Response({"error": "Feuille non trouvée"}, status=404)
             
-            ws = wb[decoded_sheet_name]
-            ws.delete_rows(int(row_id))
-            wb.save(filepath)
-            wb.close()
-            
-            file_cache = update_file_cache(filepath, decoded_filename, last_modified_by=request.user)
-            if file_cache:
-                cache_sheet_data(file_cache, filepath, decoded_sheet_name)
+            with edit_lock(file_cache), transaction.atomic():
+                conflict = row_ids_conflict(request, sheet_cache)
+                if conflict:
+                    return conflict
+                
+                if not delete_sheet_row(sheet_cache, row_id):
+                    return Response({"error": "Ligne non trouvée"}, status=404)
+                
+                journal_edit(file_cache, sheet_cache.sheet_name, 'delete', row_id, user=request.user)
+                adjust_entry_counts(file_cache, sheet_cache.sheet_name, -1, request.user)
             
             return Response({"message": "Entrée supprimée avec succès"})
         
@@ -967,23 +767,16 @@ def delete_sheet_entry(request, filename, sheet_name):
             if not sheet_cache:
                 return Response({"error": "Feuille non trouvée"}, status=404)
             
-            data = sheet_cache.data
-            if isinstance(data, str):
-                try:
-                    data = json_module.loads(data)
-                except:
-                    data = []
-            
-            # Supprimer la ligne par _row_id
-            data = [row for row in data if row.get('_row_id') != int(row_id) and row.get('_row_id') != row_id]
-            
-            sheet_cache.data = data
-            sheet_cache.rows_count = len(data)
-            sheet_cache.save()
-            
-            file_cache.total_entries = sum(s.rows_count for s in SheetDataCache.objects.filter(file_cache=file_cache))
-            file_cache.last_modified_by = request.user
-            file_cache.save()
+            # Supprimer uniquement la ligne concernée (un seul DELETE)
+            with transaction.atomic():
+                conflict = row_ids_conflict(request, sheet_cache)
+                if conflict:
+                    return conflict
+                
+                if not delete_sheet_row(sheet_cache, row_id):
+                    return Response({"error": "Ligne non trouvée"}, status=404)
+                
+                adjust_entry_counts(file_cache, sheet_cache.sheet_name, -1, request.user)
             
             return Response({"message": "Entrée supprimée avec succès (base de données)"})
         
@@ -996,18 +789,25 @@ def delete_sheet_entry(request, filename, sheet_name):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def download_excel(request, filename):
-    """Télécharger un fichier Excel"""
+    """Télécharger un fichier Excel (modifications en attente écrites avant l'envoi)"""
     try:
         filepath = os.path.join(EXCEL_FOLDER, filename)
         
         if not os.path.exists(filepath):
             return Response({"error": "Fichier non trouvé"}, status=404)
         
+        # Le fichier envoyé contient toutes les modifications acquittées, sauf si leur écriture
+        # échoue : il est alors envoyé tel quel avec le nombre de modifications non écrites
+        file_cache = FileCache.objects.filter(filename=filename).first()
+        unwritten = try_flush_pending_edits(file_cache) if file_cache else 0
+        
         response = FileResponse(
             open(filepath, 'rb'),
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        if unwritten:
+            response['X-Pending-Edits'] = str(unwritten)
         return response
         
     except Exception as e:
@@ -1046,35 +846,24 @@ def import_excel_file(request):
         # Vérifier que c'est un fichier Excel valide
         try:
             wb = load_workbook(uploaded_file)
-            sheets_info = []
-            
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                # Compter les colonnes
-                headers = [cell.value for cell in ws[1] if cell.value]
-                # Compter les lignes
-                row_count = 0
-                for row in ws.iter_rows(min_row=2, max_row=5000, values_only=True):
-                    if any(cell is not None for cell in row):
-                        row_count += 1
-                
-                sheets_info.append({
-                    "name": sheet_name,
-                    "columns": len(headers),
-                    "rows": row_count
-                })
             
             # Sauvegarder le fichier
             wb.save(filepath)
             wb.close()
             
-            # Mettre à jour le cache des métadonnées (avec l'utilisateur qui importe)
+            # Mettre en cache le fichier et TOUTES ses feuilles (avec l'utilisateur qui importe)
             file_cache = update_file_cache(filepath, filename, last_modified_by=request.user)
             
-            # Mettre en cache TOUTES les données des feuilles
-            if file_cache:
-                for sheet_name in file_cache.sheets_json:
-                    cache_sheet_data(file_cache, filepath, sheet_name)
+            # Colonnes et nombre exact de lignes de chaque feuille, comptés à l'ingestion
+            sheets_details = file_cache.sheets_details if file_cache else {}
+            sheets_info = [
+                {
+                    "name": sheet_name,
+                    "columns": sheets_details.get(sheet_name, {}).get('columns', 0),
+                    "rows": sheets_details.get(sheet_name, {}).get('entries', 0)
+                }
+                for sheet_name in (file_cache.sheets_json if file_cache else [])
+            ]
             
             return Response({
                 "message": "Fichier importé avec succès",
@@ -1147,12 +936,8 @@ def create_excel_file(request):
         wb.save(filepath)
         wb.close()
         
-        # Mettre à jour le cache des métadonnées (avec l'utilisateur qui crée)
-        file_cache = update_file_cache(filepath, file_name, last_modified_by=request.user)
-        
-        # Mettre en cache les données de la feuille
-        if file_cache:
-            cache_sheet_data(file_cache, filepath, "Données")
+        # Mettre en cache le fichier et sa feuille (avec l'utilisateur qui crée)
+        update_file_cache(filepath, file_name, last_modified_by=request.user)
         
         return Response({
             "message": "Fichier créé avec succès",
@@ -1183,6 +968,11 @@ def add_sheet_to_file(request, filename):
         if not columns or len(columns) == 0:
             return Response({"error": "Au moins une colonne est requise"}, status=400)
         
+        # Modifications en attente écrites avant de réécrire tout le classeur
+        file_cache = FileCache.objects.filter(filename=filename).first()
+        if file_cache:
+            flush_pending_edits(file_cache)
+        
         wb = load_workbook(filepath)
         
         # Vérifier si la feuille existe déjà
@@ -1250,6 +1040,9 @@ def delete_excel_file(request, filename):
         
         # Déplacer le fichier vers l'archive (si le fichier physique existe)
         if os.path.exists(filepath):
+            # Archive complète : modifications en attente écrites avant le déplacement
+            if file_cache:
+                flush_pending_edits(file_cache)
             shutil.move(filepath, archive_path)
         
         # Mettre à jour ou créer le cache avec les informations de suppression
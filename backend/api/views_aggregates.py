@@ -0,0 +1,127 @@
+"""
+Agrégations par groupes sur les données d'une feuille (totaux par navire, client, mois...)
+et tableau de bord de l'accueil (agrégats pré-calculés, sans lecture des lignes)
+"""
+import time
+from collections import defaultdict
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import FileCache, SheetDataCache, SheetRollup
+from .sheet_aggregates import aggregate_rows
+from .sheet_rollups import ensure_rollups, sheet_summary
+from .sheet_queries import build_rows_queryset
+from .views import find_file_cache, find_sheet_cache
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_sheet_aggregates(request, filename, sheet_name):
+    """
+    GET .../aggregate/?group_by=Navires&metric=sum:Tonnage&metric=count
+    - group_by: colonnes de regroupement ('Date B/L:month' pour regrouper une date par mois)
+    - metric: sum / avg / min / max sur une colonne numérique, count (lignes ou valeurs non vides)
+    Les filtres de get_sheet_data (q, filter[...]) s'appliquent avant l'agrégation.
+    """
+    try:
+        file_cache = find_file_cache(filename)
+        sheet_cache = find_sheet_cache(file_cache, sheet_name) if file_cache else None
+        if not sheet_cache:
+            return Response({"error": f"Données non trouvées pour {filename}/{sheet_name}"}, status=404)
+        
+        headers = sheet_cache.headers if isinstance(sheet_cache.headers, list) else []
+        
+        try:
+            started = time.perf_counter()
+            queryset, _, _ = build_rows_queryset(sheet_cache, headers, request.query_params)
+            result = aggregate_rows(
+                queryset,
+                sheet_cache,
+                headers,
+                request.query_params.getlist('group_by'),
+                request.query_params.getlist('metric')
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        
+        return Response({
+            "filename": file_cache.filename,
+            "sheet_name": sheet_cache.sheet_name,
+            **result,
+            "took_ms": round(elapsed_ms, 2)
+        })
+        
+    except Exception as e:
+        print(f"Erreur get_sheet_aggregates: {e}")
+        import traceback
+        traceback.print_exc()
+        return Response({"error": str(e)}, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_dashboard(request):
+    """
+    GET /api/dashboard/ - Statistiques de tous les fichiers actifs pour l'accueil
+    (lignes et sommes par mois, répartition par catégorie), lues dans les agrégats
+    pré-calculés. updated_at indique la fraîcheur des agrégats.
+    Paramètre optionnel: file (limiter à un fichier)
+    """
+    try:
+        started = time.perf_counter()
+        
+        files = FileCache.objects.filter(is_deleted=False).only('id', 'filename', 'name', 'total_entries')
+        filename = request.query_params.get('file')
+        if filename:
+            files = files.filter(filename=filename)
+        files = list(files)
+        
+        sheets = list(
+            SheetDataCache.objects.filter(file_cache__in=files)
+            .only('id', 'file_cache_id', 'sheet_name', 'columns_info', 'rows_count', 'rollups_updated_at')
+            .order_by('file_cache_id', 'id')
+        )
+        # Feuilles importées avant les agrégats : calcul unique
+        ensure_rollups(sheets)
+        
+        rollups_by_sheet = defaultdict(list)
+        for rollup in SheetRollup.objects.filter(sheet__in=sheets):
+            rollups_by_sheet[rollup.sheet_id].append(rollup)
+        
+        sheets_by_file = defaultdict(list)
+        for sheet_cache in sheets:
+            sheets_by_file[sheet_cache.file_cache_id].append(
+                sheet_summary(sheet_cache, rollups_by_sheet[sheet_cache.id])
+            )
+        
+        dashboard_files = []
+        freshness = []
+        for file_cache in files:
+            file_sheets = sheets_by_file[file_cache.id]
+            sheets_updated = [sheet["updated_at"] for sheet in file_sheets if sheet["updated_at"]]
+            freshness.extend(sheets_updated)
+            dashboard_files.append({
+                "filename": file_cache.filename,
+                "name": file_cache.name,
+                "total_entries": file_cache.total_entries,
+                "sheets": file_sheets,
+                "updated_at": max(sheets_updated) if sheets_updated else None
+            })
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return Response({
+            "files": dashboard_files,
+            "total_files": len(dashboard_files),
+            "total_entries": sum(file_cache.total_entries or 0 for file_cache in files),
+            "updated_at": max(freshness) if freshness else None,
+            "took_ms": round(elapsed_ms, 2)
+        })
+        
+    except Exception as e:
+        print(f"Erreur get_dashboard: {e}")
+        import traceback
+        traceback.print_exc()
+        return Response({"error": str(e)}, status=500)
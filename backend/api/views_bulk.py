@@ -0,0 +1,249 @@
+"""
+Opérations en lot sur les entrées d'une feuille (une transaction, une écriture du fichier)
+
+    POST .../bulk-add/      {"rows": [{...}, {...}]}
+    POST .../bulk-update/   {"row_ids": [3, 4]} ou {"filter": {...}}, avec {"values": {...}}
+    POST .../bulk-delete/   {"row_ids": [3, 4]} ou {"filter": {"Client": "X", "Tonnage": {"gte": 1000}}}
+
+Comme pour une entrée, ?base_version= fait refuser (409) un lot fondé sur des _row_id
+renumérotés depuis. Les filtres acceptent les colonnes et opérateurs de get_sheet_data (eq, ne, contains,
+gt, gte, lt, lte), comparés selon le type de la colonne et servis par ses index.
+En mode fichier, le lot est journalisé en une fois : le compacteur l'écrit dans le
+classeur en un seul enregistrement (fichier remplacé d'un coup).
+"""
+import os
+from urllib.parse import unquote
+
+from django.db import transaction
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .edit_journal import edit_lock, journal_edits
+from .etags import row_ids_conflict
+from .models import FileCache, SheetRow
+from .sheet_indexes import get_indexed_columns
+from .sheet_queries import apply_filters, get_column_types, parse_filter_object
+from .sheet_rows import adjust_entry_counts, delete_sheet_rows, insert_sheet_rows, parse_row_id, update_sheet_rows
+from .sheet_validation import validate_row
+from .views import EXCEL_FOLDER, find_file_cache, find_sheet_cache, journal_sheet_cache
+
+# Nombre maximum d'entrées par requête
+MAX_BULK_ROWS = 1000
+
+
+def bulk_sheet_cache(filename, sheet_name):
+    """
+    Fichier et feuille visés par une opération en lot : (mode fichier, file_cache, sheet_cache).
+    En mode fichier, les modifications passent par le journal d'écriture différée.
+    """
+    decoded_filename = unquote(filename)
+    filepath = os.path.join(EXCEL_FOLDER, decoded_filename)
+
+    if os.path.exists(filepath):
+        file_cache, sheet_cache = journal_sheet_cache(filepath, decoded_filename, unquote(sheet_name))
+        return True, file_cache, sheet_cache
+
+    file_cache = find_file_cache(filename)
+    sheet_cache = find_sheet_cache(file_cache, sheet_name) if file_cache else None
+    return False, file_cache, sheet_cache
+
+
+def select_rows(sheet_cache, data):
+    """
+    Lignes visées par une modification / suppression en lot :
+    {"row_ids": [3, 4, 5]} ou {"filter": {"Client": "X", "Tonnage": {"gte": 1000}}}.
+    Retourne (queryset, _row_id introuvables). Lève ValueError si la sélection est invalide.
+    """
+    row_ids = data.get('row_ids')
+    filter_object = data.get('filter')
+    if (row_ids is None) == (filter_object is None):
+        raise ValueError("Indiquer soit 'row_ids', soit 'filter'")
+
+    queryset = SheetRow.objects.filter(sheet=sheet_cache)
+    if row_ids is not None:
+        if not isinstance(row_ids, list) or not row_ids:
+            raise ValueError("Liste 'row_ids' requise")
+        if len(row_ids) > MAX_BULK_ROWS:
+            raise ValueError(f"{MAX_BULK_ROWS} lignes maximum par requête")
+        parsed = [parse_row_id(row_id) for row_id in row_ids]
+        if any(row_id is None or row_id < 2 for row_id in parsed):
+            raise ValueError("ID de ligne invalide")
+        queryset = queryset.filter(row_id__in=parsed)
+        found = set(queryset.values_list('row_id', flat=True))
+        return queryset, sorted(set(parsed) - found)
+
+    filters = parse_filter_object(filter_object, sheet_cache.headers or [])
+    if not filters:
+        # Un filtre vide viserait toute la feuille
+        raise ValueError("Filtre vide")
+    column_types = get_column_types(sheet_cache)
+    queryset = apply_filters(queryset, filters, column_types, sheet_cache, get_indexed_columns(sheet_cache))
+    # Filtre résolu en _row_id : le verrou (select_for_update) porte sur une requête simple, sans jointure d'index
+    return SheetRow.objects.filter(sheet=sheet_cache, row_id__in=list(queryset.values_list('row_id', flat=True))), []
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def add_sheet_entries(request, filename, sheet_name):
+    """
+    POST .../bulk-add/ {"rows": [{...}, {...}]} - Ajouter plusieurs entrées en une fois
+
+    Toutes les entrées sont validées d'abord (mêmes règles que le formulaire) :
+    si une seule est invalide, rien n'est ajouté et la réponse (400) détaille
+    les erreurs de chaque entrée. Sinon toutes sont ajoutées dans une seule
+    transaction, avec une seule écriture du fichier Excel en mode fichier.
+    """
+    try:
+        rows = request.data.get('rows') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "Liste 'rows' requise"}, status=400)
+        if len(rows) > MAX_BULK_ROWS:
+            return Response({"error": f"{MAX_BULK_ROWS} entrées maximum par requête"}, status=400)
+
+        file_mode, file_cache, sheet_cache = bulk_sheet_cache(filename, sheet_name)
+        if not sheet_cache:
+            return Response({"error": f"Données non trouvées pour {unquote(filename)}/{unquote(sheet_name)}"}, status=404)
+
+        headers = sheet_cache.headers or []
+        column_types = get_column_types(sheet_cache)
+        results = []
+        invalid = 0
+        for index, values in enumerate(rows):
+            errors = validate_row(values, headers, column_types, for_file=file_mode)
+            if errors:
+                invalid += 1
+                results.append({"index": index, "valid": False, "errors": errors})
+            else:
+                results.append({"index": index, "valid": True})
+
+        if invalid:
+            return Response({
+                "error": f"{invalid} entrée(s) invalide(s), aucune entrée ajoutée",
+                "inserted": 0,
+                "results": results
+            }, status=400)
+
+        with edit_lock(file_cache), transaction.atomic():
+            created = insert_sheet_rows(sheet_cache, rows)
+            if file_mode:
+                journal_edits(
+                    file_cache, sheet_cache.sheet_name, 'insert',
+                    [(row.row_id, row.values) for row in created], request.user
+                )
+            adjust_entry_counts(file_cache, sheet_cache.sheet_name, len(created), request.user)
+
+        for result, row in zip(results, created):
+            result["row_number"] = row.row_id
+
+        return Response({
+            "message": f"{len(created)} entrée(s) ajoutée(s) avec succès",
+            "inserted": len(created),
+            "version": sheet_cache.version,
+            "results": results
+        })
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return Response({"error": str(e)}, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def update_sheet_entries(request, filename, sheet_name):
+    """
+    POST .../bulk-update/ {"row_ids": [...] ou "filter": {...}, "values": {"Client": "Nouveau nom"}}
+    Modifier les mêmes colonnes de plusieurs entrées en une opération :
+    une transaction en base, une seule écriture du fichier Excel en mode fichier.
+    Rien n'est modifié si une valeur est invalide ou si un _row_id n'existe pas.
+    """
+    try:
+        if not isinstance(request.data, dict):
+            return Response({"error": "Objet JSON requis"}, status=400)
+        values = request.data.get('values')
+        if not isinstance(values, dict) or not values:
+            return Response({"error": "Objet 'values' requis"}, status=400)
+
+        file_mode, file_cache, sheet_cache = bulk_sheet_cache(filename, sheet_name)
+        if not sheet_cache:
+            return Response({"error": f"Données non trouvées pour {unquote(filename)}/{unquote(sheet_name)}"}, status=404)
+
+        errors = validate_row(values, sheet_cache.headers or [], get_column_types(sheet_cache), for_file=file_mode, partial=True)
+        if errors:
+            return Response({"error": "Valeurs invalides, aucune entrée modifiée", "errors": errors}, status=400)
+
+        with edit_lock(file_cache), transaction.atomic():
+            conflict = row_ids_conflict(request, sheet_cache)
+            if conflict:
+                return conflict
+            try:
+                queryset, missing = select_rows(sheet_cache, request.data)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+            if missing:
+                return Response({"error": "Lignes non trouvées, aucune entrée modifiée", "not_found": missing}, status=404)
+
+            rows = update_sheet_rows(sheet_cache, queryset, values)
+            if file_mode and rows:
+                journal_edits(file_cache, sheet_cache.sheet_name, 'update', [(row.row_id, values) for row in rows], request.user)
+            if rows:
+                FileCache.objects.filter(pk=file_cache.pk).update(last_modified_by=request.user)
+
+        return Response({
+            "message": f"{len(rows)} entrée(s) modifiée(s) avec succès",
+            "updated": len(rows),
+            "row_ids": [row.row_id for row in rows],
+            "version": sheet_cache.version
+        })
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return Response({"error": str(e)}, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def delete_sheet_entries(request, filename, sheet_name):
+    """
+    POST .../bulk-delete/ {"row_ids": [...]} ou {"filter": {...}}
+    Supprimer plusieurs entrées en une opération (une transaction, une écriture du fichier).
+    Rien n'est supprimé si un _row_id n'existe pas.
+    """
+    try:
+        if not isinstance(request.data, dict):
+            return Response({"error": "Objet JSON requis"}, status=400)
+
+        file_mode, file_cache, sheet_cache = bulk_sheet_cache(filename, sheet_name)
+        if not sheet_cache:
+            return Response({"error": f"Données non trouvées pour {unquote(filename)}/{unquote(sheet_name)}"}, status=404)
+
+        with edit_lock(file_cache), transaction.atomic():
+            conflict = row_ids_conflict(request, sheet_cache)
+            if conflict:
+                return conflict
+            try:
+                queryset, missing = select_rows(sheet_cache, request.data)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+            if missing:
+                return Response({"error": "Lignes non trouvées, aucune entrée supprimée", "not_found": missing}, status=404)
+
+            row_ids = delete_sheet_rows(sheet_cache, queryset)
+            if file_mode and row_ids:
+                journal_edits(file_cache, sheet_cache.sheet_name, 'delete', [(row_id, None) for row_id in row_ids], request.user)
+            if row_ids:
+                adjust_entry_counts(file_cache, sheet_cache.sheet_name, -len(row_ids), request.user)
+
+        return Response({
+            "message": f"{len(row_ids)} entrée(s) supprimée(s) avec succès",
+            "deleted": len(row_ids),
+            "row_ids": row_ids,
+            "version": sheet_cache.version
+        })
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return Response({"error": str(e)}, status=500)
@@ -0,0 +1,50 @@
+"""
+Synchronisation par différences des données d'une feuille (journal SheetChange)
+"""
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .sheet_changes import changes_since
+from .sheet_queries import parse_fields
+from .sheet_rows import parse_row_id
+from .views import find_file_cache, find_sheet_cache
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_sheet_changes(request, filename, sheet_name):
+    """
+    GET .../changes/?since=<version> - Lignes ajoutées / modifiées / supprimées depuis une version
+    (la version est renvoyée par get_sheet_data). Si full_reload vaut true, le journal ne
+    couvre plus cette version : recharger toute la feuille. ?fields= comme get_sheet_data.
+    """
+    since = parse_row_id(request.query_params.get('since'))
+    if since is None or since < 0:
+        return Response({"error": "Paramètre 'since' invalide"}, status=400)
+    
+    try:
+        file_cache = find_file_cache(filename)
+        sheet_cache = find_sheet_cache(file_cache, sheet_name) if file_cache else None
+        if not sheet_cache:
+            return Response({"error": f"Données non trouvées pour {filename}/{sheet_name}"}, status=404)
+        
+        headers = sheet_cache.headers if isinstance(sheet_cache.headers, list) else []
+        try:
+            fields = parse_fields(request.query_params, headers)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        
+        result = changes_since(sheet_cache, since, fields)
+        return Response({
+            "filename": file_cache.filename,
+            "sheet_name": sheet_cache.sheet_name,
+            **result,
+            "total_rows": sheet_cache.rows_count
+        })
+        
+    except Exception as e:
+        print(f"Erreur get_sheet_changes: {e}")
+        import traceback
+        traceback.print_exc()
+        return Response({"error": str(e)}, status=500)
@@ -0,0 +1,65 @@
+"""
+Index secondaires des colonnes d'une feuille (choix des colonnes indexées)
+"""
+import time
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import SheetIndexEntry
+from .sheet_indexes import INDEX_KEYS, get_indexed_columns, set_indexed_columns
+from .sheet_queries import get_column_types
+from .views import find_file_cache, find_sheet_cache
+
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def sheet_indexes(request, filename, sheet_name):
+    """
+    GET .../indexes/ - Colonnes indexées et colonnes indexables de la feuille
+    PUT .../indexes/ {"columns": ["Navires", "Date B/L"]} - Choisir les colonnes indexées
+    (liste vide pour supprimer les index). Les index sont reconstruits immédiatement.
+    """
+    try:
+        file_cache = find_file_cache(filename)
+        sheet_cache = find_sheet_cache(file_cache, sheet_name) if file_cache else None
+        if not sheet_cache:
+            return Response({"error": f"Données non trouvées pour {filename}/{sheet_name}"}, status=404)
+        
+        took_ms = None
+        if request.method == 'PUT':
+            columns = request.data.get('columns')
+            if not isinstance(columns, list):
+                return Response({"error": "Liste 'columns' requise"}, status=400)
+            try:
+                started = time.perf_counter()
+                set_indexed_columns(sheet_cache, [str(column) for column in columns])
+                took_ms = round((time.perf_counter() - started) * 1000, 2)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+        
+        column_types = get_column_types(sheet_cache)
+        indexed = get_indexed_columns(sheet_cache)
+        response_data = {
+            "filename": file_cache.filename,
+            "sheet_name": sheet_cache.sheet_name,
+            "indexed_columns": [
+                {"name": column, "data_type": column_types.get(column), "key": key_field}
+                for column, key_field in indexed.items()
+            ],
+            "indexable_columns": [
+                column for column in (sheet_cache.headers or [])
+                if column_types.get(column) in INDEX_KEYS
+            ],
+            "entries_count": SheetIndexEntry.objects.filter(sheet=sheet_cache).count()
+        }
+        if took_ms is not None:
+            response_data["took_ms"] = took_ms
+        return Response(response_data)
+        
+    except Exception as e:
+        print(f"Erreur sheet_indexes: {e}")
+        import traceback
+        traceback.print_exc()
+        return Response({"error": str(e)}, status=500)
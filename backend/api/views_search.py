@@ -0,0 +1,43 @@
+"""
+Recherche plein texte dans toutes les feuilles de tous les fichiers Excel
+"""
+import time
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .search_index import search_rows, MAX_SEARCH_RESULTS
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_entries(request):
+    """
+    GET /api/search/?q=texte - Rechercher un texte (ex: nom de navire) dans tous les fichiers
+    Paramètres optionnels: limit (max 200), file (limiter à un fichier)
+    """
+    query = request.query_params.get('q', '').strip()
+    if len(query) < 2:
+        return Response({"error": "La recherche doit contenir au moins 2 caractères"}, status=400)
+    
+    try:
+        limit = int(request.query_params.get('limit', 50))
+    except ValueError:
+        return Response({"error": "Paramètre 'limit' invalide"}, status=400)
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    
+    try:
+        started = time.perf_counter()
+        results = search_rows(query, limit, request.query_params.get('file'))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        return Response({
+            "query": query,
+            "results": results,
+            "total": len(results),
+            "took_ms": round(elapsed_ms, 2)
+        })
+    except Exception as e:
+        print(f"Erreur search_entries: {e}")
+        return Response({"error": str(e)}, status=500)
@@ -8,6 +8,7 @@ from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from api.models import FileCache, SheetDataCache
+from api.sheet_rows import absorb_legacy_data
 from datetime import datetime
 import json
 import os
@@ -119,7 +120,7 @@ def setup_database(request):
                         fc = file_map.get(sd.get('file_cache_id'))
                         if fc:
                             try:
-                                SheetDataCache.objects.create(
+                                sheet = SheetDataCache.objects.create(
                                     file_cache=fc,
                                     sheet_name=sd['sheet_name'],
                                     headers=sd.get('headers', '[]'),
@@ -127,6 +128,8 @@ def setup_database(request):
                                     data=sd.get('data', '[]'),
                                     rows_count=sd.get('rows_count', 0)
                                 )
+                                # Découper les données en lignes SheetRow
+                                absorb_legacy_data(sheet)
                                 results['sheets_created'] += 1
                             except Exception as e:
                                 results['errors'].append(f"Sheet {sd.get('sheet_name', '?')}: {str(e)}")
@@ -0,0 +1,289 @@
+"""
+Ajout de lignes dans un fichier .xlsx sans charger tout le classeur
+
+Un .xlsx est une archive zip : seule la partie XML de la feuille visée
+(xl/worksheets/sheetN.xml) est modifiée, en insérant les nouveaux éléments <row>
+avant </sheetData> et en agrandissant <dimension ref="...">. Toutes les autres
+parties (styles, autres feuilles, commentaires...) sont recopiées telles quelles.
+
+Les textes sont écrits en chaînes en ligne (t="inlineStr") pour ne pas réécrire
+xl/sharedStrings.xml. Utilisé par l'écriture du journal (xlsx_patch) : si la
+structure du fichier n'est pas celle attendue (XlsxPatchError), le journal revient
+à openpyxl (load_workbook / save).
+"""
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from posixpath import join, normpath
+from xml.sax.saxutils import escape
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+# Caractères interdits en XML 1.0 (refusés aussi par openpyxl)
+ILLEGAL_XML_CHARS_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+CELL_REF_RE = re.compile(r'^([A-Z]+)(\d+)$')
+ROW_NUMBER_RE = re.compile(rb'\br="(\d+)"')
+DIMENSION_RE = re.compile(rb'<dimension ref="([A-Z]+\d+)(?::([A-Z]+\d+))?"\s*/>')
+
+
+class XlsxPatchError(Exception):
+    """Structure du fichier non gérée par l'ajout direct (repli sur openpyxl)"""
+
+
+def normalize_header(value):
+    return str(value).strip().replace('\n', ' ')
+
+
+def sheet_part_name(archive, sheet_name):
+    """Chemin de la partie XML de la feuille dans l'archive, None si la feuille n'existe pas"""
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    relation_id = None
+    for sheet in workbook.iter(f'{{{MAIN_NS}}}sheet'):
+        if sheet.get('name') == sheet_name:
+            relation_id = sheet.get(f'{{{REL_NS}}}id')
+            break
+    if relation_id is None:
+        return None
+
+    relations = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relation in relations.iter(f'{{{PACKAGE_REL_NS}}}Relationship'):
+        if relation.get('Id') == relation_id:
+            target = relation.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return normpath(join('xl', target))
+    raise XlsxPatchError(f"Relation {relation_id} introuvable")
+
+
+def shared_strings_part(archive):
+    """Chemin de xl/sharedStrings.xml (ou équivalent), None s'il n'y en a pas"""
+    relations = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relation in relations.iter(f'{{{PACKAGE_REL_NS}}}Relationship'):
+        if relation.get('Type', '').endswith('/sharedStrings'):
+            target = relation.get('Target')
+            return target.lstrip('/') if target.startswith('/') else normpath(join('xl', target))
+    return None
+
+
+def string_item_text(element):
+    """Texte d'un <si> ou <is> : <t> direct ou runs <r><t> (sans les indications phonétiques <rPh>)"""
+    texts = [element.find(f'{{{MAIN_NS}}}t')]
+    texts.extend(run.find(f'{{{MAIN_NS}}}t') for run in element.findall(f'{{{MAIN_NS}}}r'))
+    return ''.join(text.text or '' for text in texts if text is not None)
+
+
+def read_shared_strings(archive, indexes):
+    """Textes partagés d'indices `indexes` (lecture arrêtée au plus grand indice demandé)"""
+    wanted = set(indexes)
+    if not wanted:
+        return {}
+    part = shared_strings_part(archive)
+    if part is None:
+        raise XlsxPatchError("Table des chaînes partagées absente")
+
+    strings = {}
+    last = max(wanted)
+    index = 0
+    with archive.open(part) as stream:
+        for _, element in ET.iterparse(stream):
+            if element.tag != f'{{{MAIN_NS}}}si':
+                continue
+            if index in wanted:
+                strings[index] = string_item_text(element)
+            element.clear()
+            if index >= last:
+                break
+            index += 1
+    return strings
+
+
+def header_row(archive, sheet_xml):
+    """En-têtes de la ligne 1 : [(numéro de colonne, en-tête)]"""
+    match = re.search(rb'<row\b[^>]*\br="1"[^>]*?(/?)>', sheet_xml)
+    if not match:
+        return []
+    if match.group(1):
+        return []
+    end = sheet_xml.find(b'</row>', match.end())
+    if end < 0:
+        raise XlsxPatchError("Ligne d'en-têtes mal formée")
+
+    try:
+        cells = ET.fromstring(b'<row xmlns="' + MAIN_NS.encode() + b'">' + sheet_xml[match.end():end] + b'</row>')
+    except ET.ParseError as e:
+        raise XlsxPatchError(f"Ligne d'en-têtes illisible: {e}")
+
+    raw = []
+    for cell in cells.iter(f'{{{MAIN_NS}}}c'):
+        reference = CELL_REF_RE.match(cell.get('r', ''))
+        if not reference:
+            raise XlsxPatchError("Cellule d'en-tête sans référence")
+        column = column_index_from_string(reference.group(1))
+        cell_type = cell.get('t', 'n')
+        if cell_type == 'inlineStr':
+            inline = cell.find(f'{{{MAIN_NS}}}is')
+            value = string_item_text(inline) if inline is not None else None
+        else:
+            node = cell.find(f'{{{MAIN_NS}}}v')
+            value = node.text if node is not None else None
+        if value is None or value == '':
+            continue
+        raw.append((column, cell_type, value))
+
+    strings = read_shared_strings(archive, [int(value) for _, cell_type, value in raw if cell_type == 's'])
+    headers = []
+    for column, cell_type, value in raw:
+        if cell_type == 's':
+            value = strings.get(int(value))
+        elif cell_type == 'n':
+            number = float(value)
+            value = int(number) if number.is_integer() else number
+        if value is not None and value != '':
+            headers.append((column, normalize_header(value)))
+    return headers
+
+
+def last_row_number(sheet_xml, data_end):
+    """Numéro de la dernière ligne contenant des cellules (comme ws.max_row d'openpyxl)"""
+    position = data_end
+    while True:
+        start = sheet_xml.rfind(b'<row ', 0, position)
+        if start < 0:
+            return 0
+        tag_end = sheet_xml.find(b'>', start)
+        if sheet_xml[tag_end - 1:tag_end] != b'/':
+            match = ROW_NUMBER_RE.search(sheet_xml, start, tag_end)
+            if not match:
+                raise XlsxPatchError("Ligne sans numéro")
+            return int(match.group(1))
+        position = start
+
+
+def check_cell_value(value):
+    """Lève ValueError si la valeur ne peut pas être écrite dans une cellule Excel"""
+    if isinstance(value, (dict, list)):
+        raise ValueError("Une cellule Excel ne peut pas contenir de liste ou d'objet")
+    if isinstance(value, str) and ILLEGAL_XML_CHARS_RE.search(value):
+        raise ValueError("La valeur contient des caractères non autorisés dans Excel")
+
+
+def cell_xml(reference, value, style=None):
+    """Élément <c> d'une valeur JSON (texte, nombre, booléen), avec le style `style` (attribut s)"""
+    attributes = f'r="{reference}"' + (f' s="{style}"' if style else '')
+    if isinstance(value, bool):
+        return f'<c {attributes} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c {attributes}><v>{value!r}</v></c>'
+    text = str(value)
+    check_cell_value(text)
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    return f'<c {attributes} t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+
+def patch_dimension(sheet_xml, row_number, last_column):
+    match = DIMENSION_RE.search(sheet_xml)
+    if not match:
+        return sheet_xml
+    start = CELL_REF_RE.match(match.group(1).decode())
+    end = CELL_REF_RE.match((match.group(2) or match.group(1)).decode())
+    if not start or not end:
+        return sheet_xml
+    end_column = max(column_index_from_string(end.group(1)), last_column)
+    end_row = max(int(end.group(2)), row_number)
+    ref = f'{match.group(1).decode()}:{get_column_letter(end_column)}{end_row}'
+    return sheet_xml[:match.start()] + f'<dimension ref="{ref}"/>'.encode() + sheet_xml[match.end():]
+
+
+def rewrite_archive(filepath, parts, removed=()):
+    """
+    Réécrire l'archive avec les parties `parts` ({chemin: contenu}) remplacées et les
+    parties `removed` retirées, les autres copiées sans modification
+    """
+    folder = os.path.dirname(os.path.abspath(filepath))
+    descriptor, temporary = tempfile.mkstemp(suffix='.xlsx', dir=folder)
+    try:
+        with os.fdopen(descriptor, 'wb') as output, zipfile.ZipFile(filepath) as source:
+            with zipfile.ZipFile(output, 'w') as target:
+                for info in source.infolist():
+                    if info.filename in removed:
+                        continue
+                    if info.filename in parts:
+                        target.writestr(info, parts[info.filename], compress_type=info.compress_type)
+                        continue
+                    with source.open(info) as reader, target.open(info, 'w') as writer:
+                        shutil.copyfileobj(reader, writer, 1024 * 1024)
+        shutil.copymode(filepath, temporary)
+        os.replace(temporary, filepath)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def save_workbook(wb, filepath):
+    """Enregistrer un classeur openpyxl d'un seul coup (fichier temporaire puis remplacement)"""
+    folder = os.path.dirname(os.path.abspath(filepath))
+    descriptor, temporary = tempfile.mkstemp(suffix='.xlsx', dir=folder)
+    os.close(descriptor)
+    try:
+        wb.save(temporary)
+        shutil.copymode(filepath, temporary)
+        os.replace(temporary, filepath)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def append_rows_to_sheet(sheet_xml, headers, entries):
+    """
+    Ajouter des lignes à la fin du XML d'une feuille (sans écrire le fichier).
+    Retourne (XML modifié, numéros des lignes ajoutées) ; lève XlsxPatchError si impossible.
+    """
+    empty_data = re.search(rb'<sheetData\s*/>', sheet_xml)
+    data_end = sheet_xml.rfind(b'</sheetData>')
+    if empty_data is None and data_end < 0:
+        # Éléments préfixés (<x:sheetData>...) ou feuille sans données : non gérés
+        raise XlsxPatchError("Fin des données introuvable")
+
+    next_row = (last_row_number(sheet_xml, data_end) if empty_data is None else 0) + 1
+
+    rows = []
+    row_numbers = []
+    last_column = 1
+    for row_number, entry_data in enumerate(entries, start=next_row):
+        cells = []
+        for column, header in headers:
+            value = entry_data.get(header, "")
+            if value == "" or value is None:
+                continue
+            cells.append(cell_xml(f'{get_column_letter(column)}{row_number}', value))
+            last_column = max(last_column, column)
+        rows.append(f'<row r="{row_number}">{"".join(cells)}</row>')
+        row_numbers.append(row_number)
+    if not rows:
+        return sheet_xml, row_numbers
+    rows = ''.join(rows).encode('utf-8')
+
+    if empty_data is not None:
+        sheet_xml = sheet_xml[:empty_data.start()] + b'<sheetData>' + rows + b'</sheetData>' + sheet_xml[empty_data.end():]
+    else:
+        sheet_xml = sheet_xml[:data_end] + rows + sheet_xml[data_end:]
+    return patch_dimension(sheet_xml, row_numbers[-1], last_column), row_numbers
+
+
+def sheet_headers(ws):
+    """En-têtes de la ligne 1 d'une feuille openpyxl : [(numéro de colonne, en-tête)]"""
+    return [
+        (col_idx, normalize_header(cell.value))
+        for col_idx, cell in enumerate(ws[1], start=1)
+        if cell.value
+    ]
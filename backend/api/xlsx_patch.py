@@ -0,0 +1,558 @@
+"""
+Modification et suppression de lignes dans un fichier .xlsx sans charger tout le classeur
+
+Complète xlsx_append pour le journal d'écriture différée : toutes les modifications en
+attente d'un classeur sont appliquées au XML des feuilles concernées, puis l'archive est
+réécrite une seule fois (rewrite_archive), les autres parties recopiées telles quelles.
+openpyxl n'est plus nécessaire, y compris pour les classeurs qu'il ne sait pas relire.
+
+- modification : les cellules des colonnes modifiées sont remplacées en gardant leur
+  style (attribut s) ; une valeur vide laisse une cellule sans valeur
+- suppression : les lignes sont retirées et les suivantes remontées, avec leurs formules
+  (décalées comme par un déplacement de cellule), les formules partagées, les plages de
+  la feuille (dimension, filtre, tri, fusions, mises en forme conditionnelles,
+  validations, liens) et les commentaires (texte et forme VML)
+- ajout : après la dernière ligne restante (append_rows_to_sheet)
+
+Dès qu'une formule a bougé ou disparu, la chaîne de calcul (xl/calcChain.xml) est
+retirée ; le classeur est recalculé à l'ouverture, comme après un enregistrement par
+openpyxl. Les structures non gérées (tableaux, formules matricielles touchées,
+extensions x14, commentaires modernes) lèvent XlsxPatchError : repli sur openpyxl.
+"""
+import html
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from bisect import bisect_left, bisect_right
+from posixpath import basename, dirname, join, normpath
+from xml.sax.saxutils import escape
+
+from openpyxl.formula.tokenizer import TokenizerError
+from openpyxl.formula.translate import Translator, TranslatorError
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from .xlsx_append import (
+    DIMENSION_RE, PACKAGE_REL_NS, ROW_NUMBER_RE, XlsxPatchError, append_rows_to_sheet, cell_xml, header_row,
+    rewrite_archive, sheet_part_name
+)
+
+# Dernière ligne d'une feuille : une plage qui va jusque-là reste « jusqu'à la fin »
+MAX_ROW = 1048576
+
+SHEET_DATA_RE = re.compile(rb'<sheetData\s*(/?)>')
+ROW_RE = re.compile(rb'<row\b([^>]*?)(/>|>(.*?)</row>)', re.S)
+CELL_RE = re.compile(rb'<c\b([^>]*?)(/>|>(.*?)</c>)', re.S)
+FORMULA_RE = re.compile(rb'<f\b([^>]*?)(/>|>(.*?)</f>)', re.S)
+CELL_REFERENCE_RE = re.compile(rb'\br="([A-Z]+)(\d+)"')
+CELL_TAG_REFERENCE_RE = re.compile(rb'(<c\b[^>]*?\br=")([A-Z]+)\d+"')
+TYPED_FORMULA_RE = re.compile(rb'<f\b[^>]*?\bt="')
+STYLE_RE = re.compile(rb'\bs="(\d+)"')
+TYPE_RE = re.compile(rb'\bt="(\w+)"')
+SHARED_INDEX_RE = re.compile(rb'\bsi="(\d+)"')
+SPANS_RE = re.compile(rb'\s+spans="[^"]*"')
+RANGE_RE = re.compile(r'^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$')
+
+# Éléments de la feuille (hors données) qui désignent des plages de cellules
+REF_ELEMENT_RE = re.compile(rb'<(autoFilter|sortState|sortCondition|mergeCell|hyperlink)\b([^>]*?)\bref="([^"]*)"([^>]*?)(/?)>')
+SQREF_ELEMENT_RE = re.compile(
+    rb'<(conditionalFormatting|dataValidation|ignoredError)\b([^>]*?)\bsqref="([^"]*)"([^>]*?)(/>|>(.*?)</\1>)', re.S
+)
+RULE_FORMULA_RE = re.compile(rb'(<formula[12]?>)(.*?)(</formula[12]?>)', re.S)
+UNSUPPORTED_RE = re.compile(rb'<(?:tableParts|x14:conditionalFormatting|x14:dataValidation)\b')
+
+COMMENT_RE = re.compile(rb'<comment\b([^>]*?)\bref="([A-Z]+)(\d+)"([^>]*?)(/>|>.*?</comment>)', re.S)
+NOTE_SHAPE_RE = re.compile(rb'<v:shape\b[^>]*>.*?</v:shape>', re.S)
+NOTE_ROW_RE = re.compile(rb'(<x:Row>)(\d+)(</x:Row>)')
+NOTE_ANCHOR_RE = re.compile(rb'(<x:Anchor>)([^<]*)(</x:Anchor>)')
+
+
+class RowShift:
+    """Nouveaux numéros des lignes d'une feuille après la suppression des lignes `deleted`"""
+
+    def __init__(self, deleted):
+        self.deleted = sorted(deleted)
+        self.deleted_set = set(deleted)
+
+    def __bool__(self):
+        return bool(self.deleted)
+
+    def row(self, number):
+        """Nouveau numéro d'une ligne (celui de la ligne suivante restante si elle est supprimée)"""
+        return number - bisect_left(self.deleted, number)
+
+    def span(self, first, last):
+        """Nouvelles bornes des lignes first..last, None si elles sont toutes supprimées"""
+        new_first = self.row(first)
+        if last >= MAX_ROW:
+            return new_first, MAX_ROW
+        new_last = last - bisect_right(self.deleted, last)
+        if new_last < new_first:
+            return None
+        return new_first, new_last
+
+
+def cell_reference(column, row):
+    return f'{get_column_letter(column)}{row}'
+
+
+def set_attribute(attributes, name, value):
+    """Attributs XML (octets) avec l'attribut `name` remplacé ou ajouté"""
+    pattern = re.compile(rb'\b' + name + rb'="[^"]*"')
+    replacement = name + b'="' + value.encode() + b'"'
+    if pattern.search(attributes):
+        return pattern.sub(lambda _: replacement, attributes, count=1)
+    return attributes + b' ' + replacement
+
+
+def translate_formula(text, origin, destination):
+    """Texte XML d'une formule déplacée de `origin` à `destination` (références relatives décalées)"""
+    try:
+        formula = Translator('=' + html.unescape(text.decode('utf-8')), origin).translate_formula(destination)
+    except (TokenizerError, TranslatorError, ValueError) as e:
+        raise XlsxPatchError(f"Formule illisible en {origin}: {e}")
+    return escape(formula[1:]).encode('utf-8')
+
+
+def shift_range(reference, shift):
+    """Plage (A1, A1:B5, A:B, 2:5) après suppression des lignes, None si elle disparaît"""
+    match = RANGE_RE.match(reference)
+    if not match:
+        raise XlsxPatchError(f"Plage non gérée: {reference}")
+    first_column, first_row, last_column, last_row = match.groups()
+    if not first_row:
+        return reference
+    single = last_column is None
+    rows = shift.span(int(first_row), int(first_row if single else last_row or MAX_ROW))
+    if rows is None:
+        return None
+    if single:
+        return f'{first_column}{rows[0]}'
+    return f'{first_column}{rows[0]}:{last_column}{rows[1]}'
+
+
+def shift_sqref(sqref, shift):
+    """Liste de plages séparées par des espaces après suppression des lignes"""
+    ranges = (shift_range(reference, shift) for reference in sqref.split())
+    return ' '.join(reference for reference in ranges if reference)
+
+
+def top_left(sqref):
+    """Première cellule d'une liste de plages (origine des formules relatives), None sans ligne"""
+    match = RANGE_RE.match(sqref.split()[0]) if sqref.split() else None
+    if not match or not match.group(1) or not match.group(2):
+        return None
+    return f'{match.group(1)}{match.group(2)}'
+
+
+def split_sheet_data(sheet_xml):
+    """(début jusqu'à <sheetData>, lignes, suite à partir de </sheetData>)"""
+    match = SHEET_DATA_RE.search(sheet_xml)
+    if match is None:
+        # Éléments préfixés (<x:sheetData>...) : non gérés
+        raise XlsxPatchError("Données de la feuille introuvables")
+    if match.group(1):
+        return sheet_xml[:match.start()] + b'<sheetData>', b'', b'</sheetData>' + sheet_xml[match.end():]
+    end = sheet_xml.rfind(b'</sheetData>')
+    if end < 0:
+        raise XlsxPatchError("Fin des données introuvable")
+    return sheet_xml[:match.end()], sheet_xml[match.end():end], sheet_xml[end:]
+
+
+def sheet_rows(data):
+    """Lignes du XML : [(numéro, attributs, contenu ou None, élément complet)]"""
+    rows = []
+    for match in ROW_RE.finditer(data):
+        number = ROW_NUMBER_RE.search(match.group(1))
+        if not number:
+            raise XlsxPatchError("Ligne sans numéro")
+        rows.append((int(number.group(1)), match.group(1), match.group(3), match.group(0)))
+    return rows
+
+
+def row_cells(content):
+    """Cellules d'une ligne : [(numéro de colonne, attributs, contenu ou None)]"""
+    cells = []
+    for match in CELL_RE.finditer(content or b''):
+        reference = CELL_REFERENCE_RE.search(match.group(1))
+        if not reference:
+            raise XlsxPatchError("Cellule sans référence")
+        cells.append((column_index_from_string(reference.group(1).decode()), match.group(1), match.group(3)))
+    return cells
+
+
+def formula_type(formula):
+    kind = TYPE_RE.search(formula.group(1))
+    return kind.group(1) if kind else b'normal'
+
+
+def shared_formula_plans(rows, shift, updated):
+    """
+    Formules partagées touchées par les modifications.
+    Retourne ({si: (cellule maîtresse (colonne, ligne d'origine), attributs de <f>, texte)},
+    lignes contenant une cellule d'un groupe touché).
+    La cellule maîtresse supprimée ou remplacée cède sa place à la suivante du groupe.
+    """
+    groups = {}
+    for number, _, content, _ in rows:
+        # Formules partagées, matricielles ou tables de données (<f t="...">)
+        if not content or not TYPED_FORMULA_RE.search(content):
+            continue
+        for column, _, body in row_cells(content):
+            formula = FORMULA_RE.search(body or b'')
+            if not formula:
+                continue
+            kind = formula_type(formula)
+            if kind == b'shared':
+                index = SHARED_INDEX_RE.search(formula.group(1))
+                if not index:
+                    raise XlsxPatchError("Formule partagée sans indice")
+                group = groups.setdefault(index.group(1), {'members': [], 'master': None})
+                group['members'].append((column, number))
+                if formula.group(3):
+                    group.update(master=(column, number), attributes=formula.group(1), text=formula.group(3))
+            elif kind != b'normal':
+                # Formule matricielle ou table de données : plage entière à décaler, non gérée
+                reference = re.search(rb'\bref="[A-Z]+\d+(?::[A-Z]+(\d+))?"', formula.group(1))
+                last = int(reference.group(1)) if reference and reference.group(1) else number
+                if (column, number) in updated or (shift and last >= shift.deleted[0]):
+                    raise XlsxPatchError(f"Formule matricielle en {cell_reference(column, number)}")
+
+    plans = {}
+    touched_rows = set()
+    for index, group in groups.items():
+        members = group['members']
+        master = group['master']
+        if master is None:
+            raise XlsxPatchError("Formule partagée sans cellule maîtresse")
+        survivors = [(column, row) for column, row in members if row not in shift.deleted_set and (column, row) not in updated]
+        if len(survivors) == len(members) and all(shift.row(row) == row for _, row in members):
+            continue
+        touched_rows.update(row for _, row in members)
+        if not survivors:
+            continue
+
+        column, row = master if master in survivors else survivors[0]
+        columns = [member[0] for member in survivors]
+        new_rows = [shift.row(member[1]) for member in survivors]
+        first = cell_reference(min(columns), min(new_rows))
+        last = cell_reference(max(columns), max(new_rows))
+        text = group['text']
+        if (column, shift.row(row)) != master:
+            text = translate_formula(text, cell_reference(*master), cell_reference(column, shift.row(row)))
+        attributes = set_attribute(group['attributes'], b'ref', first if first == last else f'{first}:{last}')
+        plans[index] = ((column, row), attributes, text)
+    return plans, touched_rows
+
+
+def patch_cell(column, number, new_number, attributes, body, plans):
+    """Cellule conservée, renumérotée et avec sa formule décalée ou redevenue maîtresse"""
+    if new_number != number:
+        reference = cell_reference(column, new_number).encode()
+        attributes = CELL_REFERENCE_RE.sub(lambda _: b'r="' + reference + b'"', attributes, count=1)
+    if body is None:
+        return b'<c' + attributes + b'/>'
+
+    formula = FORMULA_RE.search(body)
+    if formula:
+        element = None
+        if formula_type(formula) == b'shared':
+            index = SHARED_INDEX_RE.search(formula.group(1)).group(1)
+            plan = plans.get(index)
+            if plan and plan[0] == (column, number):
+                element = b'<f' + plan[1] + b'>' + plan[2] + b'</f>'
+        elif new_number != number and formula.group(3):
+            text = translate_formula(
+                formula.group(3), cell_reference(column, number), cell_reference(column, new_number)
+            )
+            element = b'<f' + formula.group(1) + b'>' + text + b'</f>'
+        if element is not None:
+            body = body[:formula.start()] + element + body[formula.end():]
+    return b'<c' + attributes + b'>' + body + b'</c>'
+
+
+def patch_rows(sheet_xml, headers, updates, shift):
+    """
+    Modifications (numéros de ligne du fichier) puis suppressions dans les lignes de la feuille.
+    Retourne (XML modifié, une formule a bougé, disparu ou été remplacée).
+    """
+    head, data, tail = split_sheet_data(sheet_xml)
+    rows = sheet_rows(data)
+
+    # {ligne: {colonne: valeur}} des cellules à remplacer
+    updated_rows = {}
+    for row_id, values in updates.items():
+        columns = {column: values[header] for column, header in headers if header in values}
+        if columns:
+            updated_rows[row_id] = columns
+    updated = {(column, row) for row, columns in updated_rows.items() for column in columns}
+
+    plans, touched_rows = shared_formula_plans(rows, shift, updated)
+    formulas_changed = bool(touched_rows)
+
+    output = []
+    for number, attributes, content, original in rows:
+        has_formula = bool(content) and b'<f' in content
+        if number in shift.deleted_set:
+            formulas_changed = formulas_changed or has_formula
+            continue
+        new_number = shift.row(number)
+        columns = updated_rows.pop(number, {})
+        if not columns and new_number == number and number not in touched_rows:
+            output.append((number, original))
+            continue
+        formulas_changed = formulas_changed or (has_formula and new_number != number)
+        attributes = ROW_NUMBER_RE.sub(lambda _: f'r="{new_number}"'.encode(), attributes, count=1)
+
+        if not columns and not has_formula and number not in touched_rows:
+            # Ligne remontée sans formule : seules les références des cellules changent
+            if content is None:
+                output.append((new_number, b'<row' + attributes + b'/>'))
+                continue
+            suffix = f'{new_number}"'.encode()
+            content = CELL_TAG_REFERENCE_RE.sub(lambda match: match.group(1) + match.group(2) + suffix, content)
+            output.append((new_number, b'<row' + attributes + b'>' + content + b'</row>'))
+            continue
+
+        styles = {}
+        cells = []
+        for column, cell_attributes, body in row_cells(content):
+            if column in columns:
+                style = STYLE_RE.search(cell_attributes)
+                styles[column] = style.group(1).decode() if style else None
+                formulas_changed = formulas_changed or (body is not None and b'<f' in body)
+                continue
+            cells.append((column, patch_cell(column, number, new_number, cell_attributes, body, plans)))
+        cells.extend(updated_cells(columns, new_number, styles))
+
+        if columns:
+            # Plage de colonnes indicative : plus forcément exacte
+            attributes = SPANS_RE.sub(b'', attributes)
+        output.append((new_number, row_xml(attributes, cells)))
+
+    # Modifications de lignes absentes du fichier : nouvelles lignes
+    for number, columns in updated_rows.items():
+        new_number = shift.row(number)
+        output.append((new_number, row_xml(f' r="{new_number}"'.encode(), updated_cells(columns, new_number, {}))))
+    output.sort(key=lambda row: row[0])
+
+    return head + b''.join(element for _, element in output) + tail, formulas_changed
+
+
+def updated_cells(columns, row, styles):
+    """Nouvelles cellules [(colonne, XML)] ; une valeur vide ne garde que le style de la cellule"""
+    cells = []
+    for column, value in columns.items():
+        reference = cell_reference(column, row)
+        style = styles.get(column)
+        if value is None or value == "":
+            if style:
+                cells.append((column, f'<c r="{reference}" s="{style}"/>'.encode()))
+            continue
+        cells.append((column, cell_xml(reference, value, style).encode('utf-8')))
+    return cells
+
+
+def row_xml(attributes, cells):
+    if not cells:
+        return b'<row' + attributes + b'/>'
+    cells.sort(key=lambda cell: cell[0])
+    return b'<row' + attributes + b'>' + b''.join(element for _, element in cells) + b'</row>'
+
+
+def patch_sheet_ranges(sheet_xml, shift):
+    """Plages de la feuille hors données (dimension, filtre, fusions...) après suppression des lignes"""
+    head, data, tail = split_sheet_data(sheet_xml)
+    if UNSUPPORTED_RE.search(tail):
+        raise XlsxPatchError("Tableau ou extension x14 dans la feuille")
+
+    dimension = DIMENSION_RE.search(head)
+    if dimension:
+        reference = dimension.group(1) + (b':' + dimension.group(2) if dimension.group(2) else b'')
+        reference = shift_range(reference.decode(), shift) or 'A1'
+        head = head[:dimension.start()] + f'<dimension ref="{reference}"/>'.encode() + head[dimension.end():]
+
+    def patch_ref(match):
+        tag = match.group(1)
+        reference = shift_range(match.group(3).decode(), shift)
+        if tag in (b'mergeCell', b'hyperlink'):
+            if not match.group(5):
+                raise XlsxPatchError(f"Élément {tag.decode()} non géré")
+            # Fusion réduite à une cellule ou lien d'une ligne supprimée : retiré
+            if reference is None or (tag == b'mergeCell' and ':' not in reference):
+                return b''
+        elif reference is None:
+            raise XlsxPatchError(f"Plage de {tag.decode()} supprimée")
+        return (b'<' + tag + match.group(2) + b'ref="' + reference.encode() + b'"' + match.group(4)
+                + match.group(5) + b'>')
+
+    def patch_sqref(match):
+        tag = match.group(1)
+        sqref = match.group(3).decode()
+        new_sqref = shift_sqref(sqref, shift)
+        if not new_sqref:
+            if tag == b'ignoredError':
+                return b''
+            raise XlsxPatchError(f"Plage de {tag.decode()} supprimée")
+        body = match.group(6)
+        origin, destination = top_left(sqref), top_left(new_sqref)
+        if body is not None and origin != destination:
+            # Formules des règles relatives à la première cellule de la plage
+            body = RULE_FORMULA_RE.sub(
+                lambda rule: rule.group(1) + translate_formula(rule.group(2), origin, destination) + rule.group(3), body
+            )
+        end = b'/>' if body is None else b'>' + body + b'</' + tag + b'>'
+        return b'<' + tag + match.group(2) + b'sqref="' + new_sqref.encode() + b'"' + match.group(4) + end
+
+    tail = REF_ELEMENT_RE.sub(patch_ref, tail)
+    tail = SQREF_ELEMENT_RE.sub(patch_sqref, tail)
+
+    merges = tail.count(b'<mergeCell ')
+    if merges:
+        tail = re.sub(rb'(<mergeCells\b[^>]*?\bcount=")\d+"', lambda match: match.group(1) + b'%d"' % merges, tail)
+    else:
+        tail = re.sub(rb'<mergeCells\b[^>]*?(?:/>|>\s*</mergeCells>)', b'', tail)
+    return head + data + tail
+
+
+def sheet_relations(archive, part_name):
+    """Parties liées à la feuille : [(type de relation, chemin dans l'archive)]"""
+    relations_name = join(dirname(part_name), '_rels', basename(part_name) + '.rels')
+    try:
+        relations = ET.fromstring(archive.read(relations_name))
+    except KeyError:
+        return []
+    parts = []
+    for relation in relations.iter(f'{{{PACKAGE_REL_NS}}}Relationship'):
+        if relation.get('TargetMode') == 'External':
+            continue
+        target = relation.get('Target')
+        path = target.lstrip('/') if target.startswith('/') else normpath(join(dirname(part_name), target))
+        parts.append((relation.get('Type', '').rsplit('/', 1)[-1], path))
+    return parts
+
+
+def patch_comments(archive, part_name, shift, parts):
+    """Commentaires de la feuille (et leurs formes VML) après suppression des lignes"""
+    for kind, path in sheet_relations(archive, part_name):
+        if kind in ('threadedComment', 'table'):
+            raise XlsxPatchError(f"Partie {kind} liée à la feuille")
+        if kind == 'comments':
+            def patch_comment(match):
+                row = int(match.group(3))
+                if row in shift.deleted_set:
+                    return b''
+                return (b'<comment' + match.group(1) + b'ref="' + match.group(2) + str(shift.row(row)).encode()
+                        + b'"' + match.group(4) + match.group(5))
+            content = archive.read(path)
+            patched = COMMENT_RE.sub(patch_comment, content)
+            if patched != content:
+                parts[path] = patched
+        elif kind == 'vmlDrawing':
+            content = archive.read(path)
+            patched = NOTE_SHAPE_RE.sub(lambda match: patch_note_shape(match.group(0), shift), content)
+            if patched != content:
+                parts[path] = patched
+
+
+def patch_note_shape(shape, shift):
+    """Forme VML d'un commentaire : retirée avec sa ligne, sinon ligne et ancrage remontés"""
+    row = NOTE_ROW_RE.search(shape)
+    if b'ObjectType="Note"' not in shape or not row:
+        return shape
+    # Numéros de ligne VML comptés à partir de 0
+    if int(row.group(2)) + 1 in shift.deleted_set:
+        return b''
+
+    def shifted(number):
+        return str(shift.row(int(number) + 1) - 1).encode()
+
+    def patch_anchor(match):
+        values = match.group(2).split(b',')
+        if len(values) != 8:
+            raise XlsxPatchError("Ancrage de commentaire non géré")
+        for position in (2, 6):
+            values[position] = values[position].replace(values[position].strip(), shifted(values[position]))
+        return match.group(1) + b','.join(values) + match.group(3)
+
+    shape = NOTE_ROW_RE.sub(lambda match: match.group(1) + shifted(match.group(2)) + match.group(3), shape)
+    return NOTE_ANCHOR_RE.sub(patch_anchor, shape)
+
+
+def drop_calc_chain(archive, parts, removed):
+    """Retirer la chaîne de calcul (références de cellules périmées) ; Excel la reconstruit"""
+    relations_name = 'xl/_rels/workbook.xml.rels'
+    relations = parts.get(relations_name) or archive.read(relations_name)
+    relation = re.search(rb'<Relationship\b[^>]*\bType="[^"]*/calcChain"[^>]*/>', relations)
+    if relation is None:
+        return
+    target = re.search(rb'\bTarget="([^"]+)"', relation.group(0)).group(1).decode()
+    part_name = target.lstrip('/') if target.startswith('/') else normpath(join('xl', target))
+
+    parts[relations_name] = relations[:relation.start()] + relations[relation.end():]
+    content_types = archive.read('[Content_Types].xml')
+    parts['[Content_Types].xml'] = re.sub(
+        rb'<Override\b[^>]*\bPartName="/' + re.escape(part_name.encode()) + rb'"[^>]*/>', b'', content_types
+    )
+    removed.add(part_name)
+
+
+def request_full_calculation(archive, parts):
+    """Recalcul complet à l'ouverture dans Excel : valeurs des formules à jour"""
+    workbook = archive.read('xl/workbook.xml')
+    calculation = re.search(rb'<calcPr\b([^>]*?)(/?)>', workbook)
+    if calculation:
+        attributes = set_attribute(calculation.group(1), b'fullCalcOnLoad', '1')
+        element = b'<calcPr' + attributes + calculation.group(2) + b'>'
+        parts['xl/workbook.xml'] = workbook[:calculation.start()] + element + workbook[calculation.end():]
+        return
+    # Sans <calcPr> : à placer après les feuilles et les noms définis
+    previous = list(re.finditer(rb'</(?:sheets|externalReferences|definedNames)>', workbook))
+    if previous:
+        position = previous[-1].end()
+        parts['xl/workbook.xml'] = workbook[:position] + b'<calcPr fullCalcOnLoad="1"/>' + workbook[position:]
+
+
+def apply_edits_xml(filepath, sheets):
+    """
+    Appliquer les modifications coalescées du journal ({feuille: {'updates', 'deletes',
+    'inserts'}}) en une seule réécriture du fichier : modifications, puis suppressions, puis
+    ajouts. Retourne {feuille: numéros des lignes ajoutées} (feuilles absentes omises) ;
+    lève XlsxPatchError si la structure du fichier n'est pas gérée (rien n'est écrit).
+    """
+    parts = {}
+    removed = set()
+    inserted = {}
+    formulas_changed = False
+    edited = False
+    try:
+        with zipfile.ZipFile(filepath) as archive:
+            for sheet_name, pending in sheets.items():
+                part_name = sheet_part_name(archive, sheet_name)
+                if part_name is None:
+                    continue
+                sheet_xml = archive.read(part_name)
+                headers = header_row(archive, sheet_xml)
+
+                shift = RowShift(pending['deletes'])
+                if pending['updates'] or shift:
+                    sheet_xml, changed = patch_rows(sheet_xml, headers, pending['updates'], shift)
+                    formulas_changed = formulas_changed or changed
+                    edited = True
+                if shift:
+                    sheet_xml = patch_sheet_ranges(sheet_xml, shift)
+                    patch_comments(archive, part_name, shift, parts)
+                sheet_xml, inserted[sheet_name] = append_rows_to_sheet(
+                    sheet_xml, headers, list(pending['inserts'].values())
+                )
+                parts[part_name] = sheet_xml
+
+            if formulas_changed:
+                drop_calc_chain(archive, parts, removed)
+            if edited:
+                request_full_calculation(archive, parts)
+    except (KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        raise XlsxPatchError(str(e))
+
+    if parts:
+        rewrite_archive(filepath, parts, removed)
+    return inserted
@@ -0,0 +1,299 @@
+"""
+Lecture directe des valeurs d'un fichier .xlsx, sans les objets cellule d'openpyxl
+
+Même en read_only, openpyxl crée un objet par cellule et analyse toute la feuille
+(y compris les filtres automatiques, dont certains le font échouer). Ici on lit
+l'archive zip directement :
+
+- xl/workbook.xml (+ relations) : noms des feuilles, calendrier 1900 / 1904
+- xl/sharedStrings.xml : table des chaînes partagées
+- xl/styles.xml : styles de cellule (cellXfs) dont le format de nombre est une date
+- xl/worksheets/sheetN.xml : parcouru avec iterparse jusqu'à </sheetData>
+
+Les lignes sont des tuples de valeurs, comme ws.iter_rows(values_only=True) :
+les nombres sont convertis en int / float, les numéros de série en datetime quand
+le style de la cellule a un format de date. Les lignes absentes du XML sont rendues
+vides pour que la position de chaque tuple reste le numéro de ligne Excel.
+La balise <dimension> n'est pas utilisée (openpyxl en read_only coupe les lignes
+qui la dépassent, ce qui perd des données quand elle n'est pas à jour).
+
+content_hashes() donne une empreinte SHA-256 par feuille, calculée sur sa partie XML
+et sur ce dont ses valeurs dépendent (chaînes partagées qu'elle utilise, styles de date,
+calendrier) : deux feuilles de même empreinte donnent exactement les mêmes lignes, et
+une chaîne partagée ajoutée ou modifiée ne change que l'empreinte des feuilles qui la lisent.
+
+Pour une structure non gérée (feuille graphique, partie manquante, XML illisible...)
+XlsxReadError est levée : l'appelant relit alors le fichier avec openpyxl.
+"""
+import hashlib
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from posixpath import join, normpath
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+from .xlsx_append import MAIN_NS, PACKAGE_REL_NS, REL_NS, string_item_text
+
+ROW_TAG = f'{{{MAIN_NS}}}row'
+CELL_TAG = f'{{{MAIN_NS}}}c'
+VALUE_TAG = f'{{{MAIN_NS}}}v'
+INLINE_STRING_TAG = f'{{{MAIN_NS}}}is'
+SHEET_DATA_TAG = f'{{{MAIN_NS}}}sheetData'
+
+# Taille des blocs lus pour calculer les empreintes
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Indice de la chaîne partagée d'une cellule t="s" (attribut propre aux cellules dans
+# sheetData : les formules ont t="shared", "array"...), après une éventuelle formule
+SHARED_STRING_INDEX_RE = re.compile(
+    rb'\bt="s"[^>]*(?<!/)>\s*(?:<(?:\w+:)?f\b[^>]*?(?:/>|>[^<]*</(?:\w+:)?f>)\s*)?<(?:\w+:)?v>\s*(\d+)\s*<'
+)
+
+# Erreurs de structure ou de contenu qui font revenir à openpyxl
+READ_ERRORS = (KeyError, IndexError, ValueError, ET.ParseError, zipfile.BadZipFile)
+
+
+class XlsxReadError(Exception):
+    """Fichier non géré par la lecture directe (repli sur openpyxl)"""
+
+
+def part_path(target):
+    """Chemin dans l'archive d'une cible de relation du classeur"""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return normpath(join('xl', target))
+
+
+@lru_cache(maxsize=None)
+def column_letters_number(letters):
+    return column_index_from_string(letters)
+
+
+def column_number(reference):
+    """Numéro de colonne d'une référence de cellule ('AB12' -> 28)"""
+    return column_letters_number(reference.rstrip('0123456789'))
+
+
+def cast_number(text):
+    """Nombre d'une cellule : int sauf s'il a une partie décimale ou un exposant (comme openpyxl)"""
+    if '.' in text or 'E' in text or 'e' in text:
+        return float(text)
+    return int(text)
+
+
+def hash_stream(digest, stream):
+    """Ajouter à `digest` le contenu d'un flux, lu par blocs"""
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    return digest
+
+
+def read_date_styles(archive):
+    """Indices (en texte, comme l'attribut s des cellules) des styles de cellule dont le format est une date"""
+    try:
+        stream = archive.open('xl/styles.xml')
+    except KeyError:
+        return set()
+
+    custom_formats = {}
+    date_styles = set()
+    in_cell_xfs = False
+    index = 0
+    with stream:
+        for event, element in ET.iterparse(stream, events=('start', 'end')):
+            tag = element.tag
+            if tag == f'{{{MAIN_NS}}}cellXfs':
+                in_cell_xfs = event == 'start'
+            elif event != 'end':
+                continue
+            elif tag == f'{{{MAIN_NS}}}numFmt':
+                custom_formats[int(element.get('numFmtId'))] = element.get('formatCode')
+            elif tag == f'{{{MAIN_NS}}}xf' and in_cell_xfs:
+                format_id = int(element.get('numFmtId', 0))
+                format_code = custom_formats.get(format_id, BUILTIN_FORMATS.get(format_id))
+                if is_date_format(format_code):
+                    date_styles.add(str(index))
+                index += 1
+                element.clear()
+    return date_styles
+
+
+def read_shared_string_table(archive, part):
+    """Toutes les chaînes partagées, dans l'ordre"""
+    strings = []
+    with archive.open(part) as stream:
+        for _, element in ET.iterparse(stream):
+            if element.tag == f'{{{MAIN_NS}}}si':
+                strings.append(string_item_text(element).replace('x005F_', ''))
+                element.clear()
+    return strings
+
+
+class XlsxReader:
+    """
+    Classeur ouvert en lecture directe : sheetnames, iter_rows(nom de feuille), close().
+    Lève XlsxReadError si le fichier n'est pas géré.
+    """
+
+    def __init__(self, filepath):
+        try:
+            self.archive = zipfile.ZipFile(filepath)
+        except (OSError, zipfile.BadZipFile) as e:
+            raise XlsxReadError(str(e))
+        try:
+            self._read_workbook()
+        except XlsxReadError:
+            self.close()
+            raise
+        except READ_ERRORS as e:
+            self.close()
+            raise XlsxReadError(f"{type(e).__name__}: {e}")
+
+    def _read_workbook(self):
+        workbook = ET.fromstring(self.archive.read('xl/workbook.xml'))
+        relations = ET.fromstring(self.archive.read('xl/_rels/workbook.xml.rels'))
+
+        targets = {}
+        shared_strings = None
+        for relation in relations.iter(f'{{{PACKAGE_REL_NS}}}Relationship'):
+            relation_type = relation.get('Type', '')
+            if relation_type.endswith('/sharedStrings'):
+                shared_strings = part_path(relation.get('Target'))
+            targets[relation.get('Id')] = (relation_type, relation.get('Target'))
+
+        properties = workbook.find(f'{{{MAIN_NS}}}workbookPr')
+        date1904 = properties is not None and properties.get('date1904', '').lower() in ('1', 'true')
+        self.epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        existing = set(self.archive.namelist())
+        self.sheet_parts = {}
+        for sheet in workbook.iter(f'{{{MAIN_NS}}}sheet'):
+            relation_type, target = targets[sheet.get(f'{{{REL_NS}}}id')]
+            if not relation_type.endswith('/worksheet'):
+                raise XlsxReadError(f"Feuille '{sheet.get('name')}' non gérée ({relation_type.rsplit('/', 1)[-1]})")
+            part = part_path(target)
+            if part in existing:
+                # Comme openpyxl : une feuille dont la partie manque est ignorée
+                self.sheet_parts[sheet.get('name')] = part
+        self.sheetnames = list(self.sheet_parts)
+
+        self.shared_strings_part = shared_strings if shared_strings in existing else None
+        self.shared_strings = read_shared_string_table(self.archive, shared_strings) if self.shared_strings_part else []
+        self.date_styles = read_date_styles(self.archive)
+
+    def close(self):
+        self.archive.close()
+
+    def content_hashes(self):
+        """Empreinte de chaque feuille : {nom de feuille: sha256 hexadécimal}"""
+        try:
+            context = repr((sorted(self.date_styles, key=int), self.epoch.isoformat())).encode()
+            hashes = {}
+            for sheet_name, part in self.sheet_parts.items():
+                digest = hashlib.sha256(context)
+                indexes = self._hash_sheet_part(digest, part)
+                # Textes des chaînes partagées lues par la feuille, pas toute la table
+                digest.update(repr([(index, self.shared_strings[index]) for index in sorted(indexes)]).encode())
+                hashes[sheet_name] = digest.hexdigest()
+            return hashes
+        except READ_ERRORS as e:
+            raise XlsxReadError(f"{type(e).__name__}: {e}")
+
+    def _hash_sheet_part(self, digest, part):
+        """Ajouter à `digest` le XML d'une feuille ; retourne les indices des chaînes partagées utilisées"""
+        indexes = set()
+        pending = b''
+        with self.archive.open(part) as stream:
+            for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+                # Cellules cherchées jusqu'à la dernière fin de ligne du bloc, le reste avec le suivant
+                pending += block
+                end = pending.rfind(b'row>') + len(b'row>')
+                if end < len(b'row>'):
+                    continue
+                indexes.update(map(int, SHARED_STRING_INDEX_RE.findall(pending, 0, end)))
+                pending = pending[end:]
+        indexes.update(map(int, SHARED_STRING_INDEX_RE.findall(pending)))
+        return indexes
+
+    def iter_rows(self, sheet_name):
+        """Lignes de la feuille (tuples de valeurs), à partir de la ligne 1"""
+        try:
+            yield from self._iter_rows(self.sheet_parts[sheet_name])
+        except READ_ERRORS as e:
+            raise XlsxReadError(f"{sheet_name}: {type(e).__name__}: {e}")
+
+    def _iter_rows(self, part):
+        expected = 1
+        row_number = 0
+        sheet_data = None
+        with self.archive.open(part) as stream:
+            for event, element in ET.iterparse(stream, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if element.tag == SHEET_DATA_TAG:
+                    # Le reste (filtres, mises en forme...) ne contient pas de valeurs
+                    return
+                if element.tag != ROW_TAG:
+                    continue
+
+                number = element.get('r')
+                row_number = int(float(number)) if number else row_number + 1
+                cells = self._row_values(element)
+                sheet_data.clear()
+                if row_number < expected:
+                    continue
+
+                # Lignes absentes du XML : rendues vides
+                while expected < row_number:
+                    expected += 1
+                    yield ()
+                expected += 1
+                yield cells
+
+    def _row_values(self, row):
+        """Valeurs d'un élément <row>, jusqu'à sa dernière cellule"""
+        values = []
+        column = 0
+        for cell in row.iter(CELL_TAG):
+            reference = cell.get('r')
+            column = column_number(reference) if reference else column + 1
+            if column > len(values):
+                values.extend([None] * (column - len(values)))
+            values[column - 1] = self._cell_value(cell)
+        # Comme openpyxl : la ligne s'arrête à la colonne de sa dernière cellule
+        del values[column:]
+        return tuple(values)
+
+    def _cell_value(self, cell):
+        cell_type = cell.get('t', 'n')
+        if cell_type == 'inlineStr':
+            inline = cell.find(INLINE_STRING_TAG)
+            return string_item_text(inline) if inline is not None else None
+
+        value = cell.findtext(VALUE_TAG) or None
+        if value is None:
+            return None
+        if cell_type == 'n':
+            value = cast_number(value)
+            if cell.get('s', '0') in self.date_styles:
+                try:
+                    return from_excel(value, self.epoch)
+                except (OverflowError, ValueError):
+                    # Numéro de série hors des dates possibles : même valeur d'erreur qu'openpyxl
+                    return '#VALUE!'
+            return value
+        if cell_type == 's':
+            return self.shared_strings[int(value)]
+        if cell_type == 'b':
+            return bool(int(value))
+        if cell_type == 'd':
+            return from_ISO8601(value)
+        # 'str' (résultat texte d'une formule), 'e' (#N/A, #DIV/0!...)
+        return value
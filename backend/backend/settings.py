@@ -57,6 +57,16 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    # JSON encodé / décodé par orjson s'il est installé (sinon module json standard)
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.json_renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "api.json_renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
 }
 
 SIMPLE_JWT = {
@@ -67,6 +77,7 @@ SIMPLE_JWT = {
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.middleware.CompressionMiddleware',  # Compression gzip / brotli / zstd des réponses de l'API
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Pour servir les fichiers statiques
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -169,3 +180,22 @@ if os.environ.get('RENDER'):
     EXCEL_FOLDER = str(BASE_DIR / 'excel_files')
 else:
     EXCEL_FOLDER = os.environ.get('EXCEL_FOLDER', str(BASE_DIR.parent))
+
+# Écriture différée des modifications dans les fichiers Excel (secondes, 0 = au téléchargement uniquement)
+EDIT_JOURNAL_FLUSH_INTERVAL = int(os.environ.get('EDIT_JOURNAL_FLUSH_INTERVAL', '30'))
+
+# Surveillance du dossier des fichiers Excel (cache tenu à jour en arrière-plan) :
+# 'auto' = inotify si disponible, 'poll' = relecture toutes les FILE_WATCHER_INTERVAL secondes, 'off'
+FILE_WATCHER = os.environ.get('FILE_WATCHER', 'off' if os.environ.get('RENDER') else 'auto')
+FILE_WATCHER_INTERVAL = int(os.environ.get('FILE_WATCHER_INTERVAL', '5'))
+
+# Processus de lecture des classeurs à l'ingestion (1 = lecture en série, par défaut ; 0 = un par
+# cœur disponible). Chaque processus recharge Django et openpyxl : à n'augmenter qu'avec assez de mémoire.
+INGESTION_WORKERS = int(os.environ.get('INGESTION_WORKERS', '1'))
+
+# Agrégats du tableau de bord (noms d'en-têtes séparés par des virgules) : colonne date
+# regroupée par mois et colonnes numériques sommées. Sans déclaration : la première colonne
+# date et les DASHBOARD_MAX_MEASURES premières colonnes numériques de chaque feuille.
+DASHBOARD_DATE_COLUMNS = [name.strip() for name in os.environ.get('DASHBOARD_DATE_COLUMNS', '').split(',') if name.strip()]
+DASHBOARD_MEASURES = [name.strip() for name in os.environ.get('DASHBOARD_MEASURES', '').split(',') if name.strip()]
+DASHBOARD_MAX_MEASURES = int(os.environ.get('DASHBOARD_MAX_MEASURES', '3'))
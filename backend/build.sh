@@ -18,6 +18,7 @@ import os
 from django.contrib.auth.models import User
 from django.db import transaction
 from api.models import FileCache, SheetDataCache
+from api.sheet_rows import absorb_legacy_data
 
 print("Debut du chargement...")
 
@@ -81,6 +82,10 @@ if os.path.exists(json_file):
         if sheets_to_create:
             SheetDataCache.objects.bulk_create(sheets_to_create)
             print(f"  {len(sheets_to_create)} feuilles creees")
+        
+        # Decouper les donnees de chaque feuille en lignes SheetRow
+        for sheet in SheetDataCache.objects.all():
+            absorb_legacy_data(sheet)
     
     print("Donnees chargees avec succes!")
 else:
@@ -11,13 +11,14 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 django.setup()
 
 from api.models import FileCache, SheetDataCache
-from api.views import update_file_cache, cache_sheet_data
+from api.ingestion import ingest_workbooks
+import argparse
 import glob
 
 EXCEL_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-def refresh_all_caches():
-    """Rafraichir tous les caches avec l'analyse des types de colonnes"""
+def refresh_all_caches(workers=None):
+    """Rafraichir tous les caches avec l'analyse des types de colonnes (workers: processus de lecture)"""
     print("=" * 60)
     print("Rafraichissement du cache avec analyse des types de colonnes")
     print("=" * 60)
@@ -32,22 +33,22 @@ def refresh_all_caches():
     
     print(f"\n[FICHIERS] {len(files)} fichiers Excel trouves")
     
+    files = [filepath for filepath in files if not os.path.basename(filepath).startswith('~$')]
+    
+    # Lire les classeurs en parallele puis mettre en cache chaque fichier et ses feuilles
+    file_caches = ingest_workbooks(files, workers)
+    
     for filepath in files:
         filename = os.path.basename(filepath)
-        if filename.startswith('~$'):
-            continue
-            
-        print(f"\n[FICHIER] Traitement de: {filename}")
-        
-        # Mettre a jour le cache du fichier
-        file_cache = update_file_cache(filepath, filename)
+        print(f"\n[FICHIER] {filename}")
+        file_cache = file_caches.get(filepath)
         
         if file_cache:
             print(f"   [OK] Cache fichier mis a jour")
             
-            # Mettre en cache chaque feuille avec analyse des types
+            # Types detectes pour chaque feuille
             for sheet_name in file_cache.sheets_json:
-                sheet_cache = cache_sheet_data(file_cache, filepath, sheet_name)
+                sheet_cache = SheetDataCache.objects.filter(file_cache=file_cache, sheet_name=sheet_name).first()
                 
                 if sheet_cache:
                     # Afficher les types detectes
@@ -72,5 +73,8 @@ def refresh_all_caches():
     print("=" * 60)
 
 if __name__ == '__main__':
-    refresh_all_caches()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processus de lecture (0 = un par coeur, 1 = en serie ; defaut: INGESTION_WORKERS)')
+    refresh_all_caches(parser.parse_args().workers)
 
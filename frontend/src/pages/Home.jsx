@@ -6,6 +6,7 @@ import "./Home.css";
 export default function Home() {
   const [user, setUser] = useState(null);
   const [files, setFiles] = useState([]);
+  const [dashboard, setDashboard] = useState(null);
   const [loading, setLoading] = useState(true);
   const [uploading, setUploading] = useState(false);
   const [uploadSuccess, setUploadSuccess] = useState("");
@@ -36,6 +37,7 @@ export default function Home() {
       setLoading(true);
       const response = await filesService.getFiles();
       setFiles(response.data.files);
+      fetchDashboard();
     } catch (error) {
       console.error("Erreur lors de la récupération des fichiers:", error);
     } finally {
@@ -43,6 +45,15 @@ export default function Home() {
     }
   };
 
+  const fetchDashboard = async () => {
+    try {
+      const response = await filesService.getDashboard();
+      setDashboard(response.data);
+    } catch (error) {
+      console.error("Erreur lors de la récupération du tableau de bord:", error);
+    }
+  };
+
   const handleLogout = () => {
     localStorage.removeItem("token");
     localStorage.removeItem("refreshToken");
@@ -314,6 +325,14 @@ export default function Home() {
             <div className="section-header-left">
               <h2>Fichiers disponibles</h2>
               <span className="files-count">{files.length} fichier(s)</span>
+              {dashboard && (
+                <span className="files-count">{dashboard.total_entries} entrée(s)</span>
+              )}
+              {dashboard?.updated_at && (
+                <span className="stats-freshness">
+                  Statistiques à jour le {new Date(dashboard.updated_at).toLocaleString("fr-FR")}
+                </span>
+              )}
             </div>
             <div className="section-header-actions">
               {/* Input caché pour l'import */}
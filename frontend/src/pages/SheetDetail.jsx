@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import { filesService } from "../services/api";
 import "./SheetDetail.css";
@@ -11,6 +11,8 @@ export default function SheetDetail() {
   
   const [columns, setColumns] = useState([]);
   const [data, setData] = useState([]);
+  // Version des données chargées (pour ne récupérer ensuite que les modifications)
+  const dataVersion = useRef(null);
   const [headers, setHeaders] = useState([]);
   const [loading, setLoading] = useState(true);
   const [saving, setSaving] = useState(false);
@@ -275,6 +277,7 @@ export default function SheetDetail() {
         try { dt = JSON.parse(dt); } catch { dt = []; }
       }
       setData(Array.isArray(dt) ? dt : []);
+      dataVersion.current = dataRes.data.version ?? null;
       
       // Initialiser avec une ligne vide
       initializeEmptyRows(1, Array.isArray(cols) ? cols : []);
@@ -287,6 +290,41 @@ export default function SheetDetail() {
     }
   };
 
+  // Appliquer seulement les lignes ajoutées / modifiées / supprimées depuis le dernier chargement
+  const syncChanges = async () => {
+    if (dataVersion.current === null) {
+      return fetchData();
+    }
+    try {
+      const response = await filesService.getChanges(decodedFilename, decodedSheetName, dataVersion.current);
+      const changes = response.data;
+      if (changes.full_reload) {
+        return fetchData();
+      }
+      
+      const deleted = new Set(changes.deleted);
+      const changed = new Map([...changes.updated, ...changes.inserted].map(row => [row._row_id, row]));
+      setData(prev => {
+        const next = [];
+        prev.forEach(row => {
+          if (deleted.has(row._row_id)) return;
+          if (changed.has(row._row_id)) {
+            next.push(changed.get(row._row_id));
+            changed.delete(row._row_id);
+          } else {
+            next.push(row);
+          }
+        });
+        // Les lignes restantes sont des ajouts (en fin de feuille)
+        return [...next, ...changed.values()];
+      });
+      dataVersion.current = changes.version;
+    } catch (err) {
+      console.error(err);
+      return fetchData();
+    }
+  };
+
   const initializeEmptyRows = (count, cols = columns) => {
     const rows = [];
     for (let i = 0; i < count; i++) {
@@ -480,9 +518,10 @@ export default function SheetDetail() {
     e.preventDefault();
     
     // Filtrer les lignes vides (au moins un champ rempli)
-    const nonEmptyRows = formRows.filter(row => 
-      Object.values(row).some(val => val !== "" && val !== null && val !== undefined)
-    );
+    const nonEmptyIndexes = formRows
+      .map((row, rowIndex) => rowIndex)
+      .filter(rowIndex => Object.values(formRows[rowIndex]).some(val => val !== "" && val !== null && val !== undefined));
+    const nonEmptyRows = nonEmptyIndexes.map(rowIndex => formRows[rowIndex]);
 
     if (nonEmptyRows.length === 0) {
       setError("Veuillez remplir au moins une ligne");
@@ -502,21 +541,19 @@ export default function SheetDetail() {
     try {
       if (editingRow) {
         // Mode édition - une seule ligne
-        await filesService.updateEntry(decodedFilename, decodedSheetName, { ...formRows[0], _row_id: editingRow });
+        await filesService.updateEntry(
+          decodedFilename, decodedSheetName, { ...formRows[0], _row_id: editingRow }, dataVersion.current
+        );
         setSuccess("Entrée modifiée avec succès !");
         setEditingRow(null);
       } else {
-        // Ajouter toutes les lignes non vides
-        let addedCount = 0;
-        for (const row of nonEmptyRows) {
-          await filesService.addEntry(decodedFilename, decodedSheetName, row);
-          addedCount++;
-        }
-        setSuccess(`${addedCount} entrée(s) ajoutée(s) avec succès !`);
+        // Ajouter toutes les lignes non vides en une seule requête
+        const response = await filesService.addEntries(decodedFilename, decodedSheetName, nonEmptyRows);
+        setSuccess(`${response.data.inserted} entrée(s) ajoutée(s) avec succès !`);
       }
       
-      // Recharger les données
-      await fetchData();
+      // Mettre à jour les données (seulement les lignes modifiées)
+      await syncChanges();
       
       // Réinitialiser le formulaire avec une ligne vide
       initializeEmptyRows(1);
@@ -527,7 +564,25 @@ export default function SheetDetail() {
       }, 1500);
       
     } catch (err) {
-      setError("Erreur lors de l'enregistrement");
+      const results = err.response?.data?.results;
+      if (err.response?.status === 409) {
+        // Lignes renumérotées (fichier réécrit) : la ligne modifiée n'est plus sûre, tout recharger
+        setEditingRow(null);
+        await fetchData();
+        setError(err.response.data.error);
+      } else if (results) {
+        // Erreurs de validation du serveur : les afficher sous les champs concernés
+        const errors = {};
+        results.filter(result => !result.valid).forEach(result => {
+          Object.entries(result.errors).forEach(([column, message]) => {
+            errors[`${nonEmptyIndexes[result.index]}-${column}`] = message;
+          });
+        });
+        setValidationErrors(errors);
+        setError(err.response.data.error);
+      } else {
+        setError("Erreur lors de l'enregistrement");
+      }
       console.error(err);
     } finally {
       setSaving(false);
@@ -558,11 +613,17 @@ export default function SheetDetail() {
     }
 
     try {
-      await filesService.deleteEntry(decodedFilename, decodedSheetName, rowId);
-      await fetchData();
+      await filesService.deleteEntry(decodedFilename, decodedSheetName, rowId, dataVersion.current);
+      await syncChanges();
       setSuccess("Entrée supprimée avec succès");
     } catch (err) {
-      setError("Erreur lors de la suppression");
+      if (err.response?.status === 409) {
+        // Lignes renumérotées (fichier réécrit) : recharger avant de choisir la ligne à supprimer
+        await fetchData();
+        setError(err.response.data.error);
+      } else {
+        setError("Erreur lors de la suppression");
+      }
       console.error(err);
     }
   };
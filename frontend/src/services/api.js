@@ -63,25 +63,73 @@ export const filesService = {
     api.get(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/columns/`),
   
   // Récupérer les données d'une feuille
-  getData: (filename, sheetName) => 
-    api.get(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/data/`),
+  // params optionnels: { limit, after } pour charger par pages (curseur sur _row_id)
+  getData: (filename, sheetName, params = {}) => 
+    api.get(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/data/`, { params }),
+  
+  // Lignes modifiées depuis une version (renvoyée par getData), pour mettre à jour la copie locale
+  getChanges: (filename, sheetName, since) => 
+    api.get(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/changes/`, {
+      params: { since }
+    }),
+  
+  // Agrégats d'une feuille, ex: { group_by: "Navires", metric: ["sum:Tonnage", "count"] }
+  getAggregates: (filename, sheetName, params) => 
+    api.get(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/aggregate/`, {
+      params,
+      paramsSerializer: { indexes: null }
+    }),
+  
+  // Colonnes indexées d'une feuille (filtres plus rapides)
+  getIndexes: (filename, sheetName) => 
+    api.get(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/indexes/`),
+  
+  setIndexes: (filename, sheetName, columns) => 
+    api.put(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/indexes/`, { columns }),
   
   // Ajouter une entrée
   addEntry: (filename, sheetName, data) => 
     api.post(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/add/`, data),
   
+  // Ajouter plusieurs entrées en une fois (une transaction, erreurs détaillées par entrée)
+  addEntries: (filename, sheetName, rows) => 
+    api.post(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/bulk-add/`, { rows }),
+  
   // Modifier une entrée
-  updateEntry: (filename, sheetName, data) => 
-    api.put(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/update/`, data),
+  // baseVersion : version de la copie locale (409 si les lignes ont été renumérotées depuis)
+  updateEntry: (filename, sheetName, data, baseVersion) => 
+    api.put(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/update/`, data, {
+      params: { base_version: baseVersion ?? undefined }
+    }),
   
   // Supprimer une entrée
-  deleteEntry: (filename, sheetName, rowId) => 
-    api.delete(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/delete/?row_id=${rowId}`),
+  deleteEntry: (filename, sheetName, rowId, baseVersion) => 
+    api.delete(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/delete/`, {
+      params: { row_id: rowId, base_version: baseVersion ?? undefined }
+    }),
+  
+  // Modifier les mêmes colonnes de plusieurs entrées (selection = { row_ids: [...] } ou { filter: {...} })
+  updateEntries: (filename, sheetName, selection, values, baseVersion) => 
+    api.post(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/bulk-update/`, { ...selection, values }, {
+      params: { base_version: baseVersion ?? undefined }
+    }),
+  
+  // Supprimer plusieurs entrées (selection = { row_ids: [...] } ou { filter: {...} })
+  deleteEntries: (filename, sheetName, selection, baseVersion) => 
+    api.post(`/files/${encodeURIComponent(filename)}/sheets/${encodeURIComponent(sheetName)}/bulk-delete/`, selection, {
+      params: { base_version: baseVersion ?? undefined }
+    }),
   
   // Télécharger un fichier
   download: (filename) => 
     api.get(`/files/${encodeURIComponent(filename)}/download/`, { responseType: 'blob' }),
   
+  // Rechercher un texte dans toutes les feuilles de tous les fichiers
+  search: (query, params = {}) => api.get("/search/", { params: { q: query, ...params } }),
+  
+  // Tableau de bord de l'accueil (agrégats pré-calculés, sans lecture des lignes)
+  getDashboard: (params = {}) => api.get("/dashboard/", { params }),
+  
   // Gestion des fichiers archivés
   getArchivedFiles: () => api.get("/files/archived/"),
   restoreFile: (fileId) => api.post(`/files/archived/${fileId}/restore/`),